@@ -0,0 +1,151 @@
+"""
+Benchmark de la serialización de listados (filas/s antes y después).
+
+Compara, sobre una base de datos SQLite con datos sintéticos, la ruta
+original de los listados (objetos ORM + to_dict() + jsonify) con
+odontocare_comun/serializacion.py (tuplas de columnas + orjson + cuerpo por bloques) y
+comprueba que ambos cuerpos son idénticos byte a byte.
+
+Cada servicio se mide en un subproceso propio, ya que ambos exponen su
+código como el paquete `app`.
+
+Uso:
+    python benchmarks/bench_serializacion.py --filas 100000
+    python benchmarks/bench_serializacion.py --filas 100000 --servicios citas --sin-orjson
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from bench_servicios import RAIZ, cargar_datos_citas, cargar_datos_usuarios, ejecutar_migraciones
+
+# servicio -> [(clave de la respuesta, modelo)]
+LISTADOS = {
+    'servicio_citas': [('citas', 'Cita')],
+    'servicio_usuarios': [('pacientes', 'Paciente'), ('doctores', 'Doctor'),
+                          ('centros', 'Centro'), ('usuarios', 'Usuario')],
+}
+
+
+def medir(servicio, ruta_db, repeticiones, sin_orjson):
+    """Mide ambas rutas dentro del proceso actual; retorna una lista de resultados"""
+    sys.path.insert(0, os.path.join(RAIZ, servicio))
+    os.environ['DATABASE_URL'] = f'sqlite:///{ruta_db}'
+
+    from flask import jsonify
+    from odontocare_comun import serializacion
+    from app import create_app, models
+
+    if sin_orjson:
+        serializacion.orjson = None
+    app = create_app()
+    app.debug = False
+
+    def antes(clave, modelo):
+        filas = modelo.query.all()
+        return jsonify({'total': len(filas), clave: [f.to_dict() for f in filas]}).get_data()
+
+    def despues(clave, modelo):
+        return serializacion.listado_json(clave, modelo.query, modelo).get_data()
+
+    resultados = []
+    for clave, nombre_modelo in LISTADOS[servicio]:
+        modelo = getattr(models, nombre_modelo)
+        tiempos = {}
+        cuerpos = {}
+        for nombre, funcion in (('antes', antes), ('despues', despues)):
+            mejor = None
+            for _ in range(repeticiones):
+                # Contexto nuevo en cada repetición: sesión e identity map vacíos
+                with app.test_request_context():
+                    inicio = time.perf_counter()
+                    cuerpos[nombre] = funcion(clave, modelo)
+                    duracion = time.perf_counter() - inicio
+                mejor = duracion if mejor is None else min(mejor, duracion)
+            tiempos[nombre] = mejor
+
+        total = json.loads(cuerpos['antes'])['total']
+        resultados.append({
+            'listado': clave,
+            'filas': total,
+            'bytes': len(cuerpos['antes']),
+            'identico': cuerpos['antes'] == cuerpos['despues'],
+            'antes_filas_s': round(total / tiempos['antes']) if tiempos['antes'] else None,
+            'despues_filas_s': round(total / tiempos['despues']) if tiempos['despues'] else None,
+            'aceleracion': round(tiempos['antes'] / tiempos['despues'], 2) if tiempos['despues'] else None,
+        })
+    return {'orjson': serializacion.orjson is not None, 'resultados': resultados}
+
+
+def medir_servicios(args, escala, hoy, directorio):
+    """Prepara la base de datos de cada servicio en `directorio` y mide sus listados"""
+    informe = {}
+    for nombre in args.servicios.split(','):
+        servicio = f'servicio_{nombre}'
+        ruta_db = os.path.join(directorio, f'{nombre}.db')
+        print(f'[*] {servicio}: preparando {ruta_db}')
+        ejecutar_migraciones(servicio, f'sqlite:///{ruta_db}')
+        if nombre == 'citas':
+            cargar_datos_citas(ruta_db, escala, args.semilla, hoy)
+        else:
+            cargar_datos_usuarios(ruta_db, escala, args.semilla)
+
+        comando = [sys.executable, os.path.abspath(__file__), '--medir', servicio, '--db', ruta_db,
+                   '--repeticiones', str(args.repeticiones)]
+        if args.sin_orjson:
+            comando.append('--sin-orjson')
+        salida = subprocess.run(comando, cwd=os.path.join(RAIZ, servicio), check=True,
+                                capture_output=True, text=True).stdout
+        informe[servicio] = json.loads(salida.strip().splitlines()[-1])
+
+        print(f'    codificador: {"orjson" if informe[servicio]["orjson"] else "json estándar"}')
+        for r in informe[servicio]['resultados']:
+            print(f'    {r["listado"]:<10} {r["filas"]:>8} filas  antes {r["antes_filas_s"]:>9} filas/s  '
+                  f'después {r["despues_filas_s"]:>9} filas/s  x{r["aceleracion"]}  '
+                  f'{"idéntico" if r["identico"] else "¡DIFERENTE!"}')
+    return informe
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de serialización de listados')
+    parser.add_argument('--filas', type=int, default=50000, help='Citas y pacientes a generar')
+    parser.add_argument('--servicios', default='citas,usuarios', help='Lista separada por comas')
+    parser.add_argument('--repeticiones', type=int, default=3, help='Se toma el mejor tiempo')
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--sin-orjson', action='store_true', help='Fuerza el codificador json estándar')
+    parser.add_argument('--salida', default=None, help='Guarda los resultados en JSON')
+    parser.add_argument('--medir', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--db', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.medir:
+        print(json.dumps(medir(args.medir, args.db, args.repeticiones, args.sin_orjson)))
+        return
+
+    escala = {
+        'pacientes': args.filas,
+        'citas': args.filas,
+        'doctores': max(1, args.filas // 200),
+        'centros': 20,
+    }
+    hoy = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    with tempfile.TemporaryDirectory(prefix='odontocare_bench_serial_') as directorio:
+        informe = medir_servicios(args, escala, hoy, directorio)
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as archivo:
+            json.dump(informe, archivo, indent=2, ensure_ascii=False)
+        print(f'[OK] Resultados guardados en {args.salida}')
+
+    if not all(r['identico'] for datos in informe.values() for r in datos['resultados']):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,432 @@
+"""
+Suite de benchmarks de carga para los servicios de OdontoCare.
+
+Levanta localmente ambos servicios Flask sobre bases de datos SQLite
+temporales, las rellena con datos sintéticos de generar_datos.py a la escala
+indicada y ejecuta
+una serie de escenarios representativos (ráfagas de login, creación de citas,
+listados con filtros, consultas de disponibilidad y cargas masivas).
+
+Los resultados (throughput y latencias p50/p95/p99 por escenario) se guardan
+en JSON para poder comparar ejecuciones entre sí.
+
+Uso:
+    python benchmarks/bench_servicios.py --pacientes 10000 --citas 10000
+    python benchmarks/bench_servicios.py --pacientes 1000000 --citas 1000000 \\
+        --salida resultados.json --comparar resultados_anteriores.json
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import generar_datos  # noqa: E402
+
+# Usuarios con los que se ejecuta la ráfaga de login (además de admin)
+USUARIOS_LOGIN = 20
+PASSWORD_BENCH = 'bench123'
+
+LOTE_INSERCION = 10000
+
+# Pacientes por petición en carga_masiva, como CARGA_LOTE en web_usuarios
+LOTE_CARGA_MASIVA = 50
+
+
+# ==================== ARRANQUE DE SERVICIOS ====================
+
+def puerto_libre():
+    """Retorna un puerto TCP libre en localhost"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def ejecutar_migraciones(servicio, database_url):
+    """Ejecuta migrate.py del servicio sobre la base de datos indicada"""
+    entorno = {**os.environ, 'DATABASE_URL': database_url}
+    subprocess.run(
+        [sys.executable, 'migrate.py'],
+        cwd=os.path.join(RAIZ, servicio), env=entorno,
+        check=True, stdout=subprocess.DEVNULL
+    )
+
+
+def iniciar_servicio(servicio, puerto, entorno_extra):
+    """Arranca un servicio Flask en un subproceso y espera a que responda"""
+    # Sin limitador: las ráfagas del benchmark agotarían las cuotas por usuario.
+    # Sin tareas periódicas: cambiarían el estado de las citas durante la medida
+    entorno = {**os.environ, 'LIMITADOR_ACTIVO': '0', 'TAREAS_ACTIVAS': '0', **entorno_extra}
+    codigo = (
+        'from app import create_app; '
+        f'create_app().run(host="127.0.0.1", port={puerto}, threaded=True)'
+    )
+    proceso = subprocess.Popen(
+        [sys.executable, '-c', codigo],
+        cwd=os.path.join(RAIZ, servicio), env=entorno,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    url = f'http://127.0.0.1:{puerto}'
+    for _ in range(100):
+        try:
+            requests.get(url, timeout=0.5)
+            return proceso, url
+        except requests.RequestException:
+            time.sleep(0.1)
+    proceso.terminate()
+    raise RuntimeError(f'El servicio {servicio} no arrancó en el puerto {puerto}')
+
+
+# ==================== DATOS DE PRUEBA ====================
+
+def _insertar_por_lotes(conn, sql, filas):
+    lote = []
+    for fila in filas:
+        lote.append(fila)
+        if len(lote) >= LOTE_INSERCION:
+            conn.executemany(sql, lote)
+            lote = []
+    if lote:
+        conn.executemany(sql, lote)
+    conn.commit()
+
+
+def cargar_datos_usuarios(ruta_db, escala, semilla):
+    """Inserta centros, doctores, pacientes y usuarios de login en la BD de usuarios"""
+    from werkzeug.security import generate_password_hash
+
+    # Todos los usuarios de prueba comparten password: se calcula un solo hash
+    hash_bench = generate_password_hash(PASSWORD_BENCH)
+
+    conn = sqlite3.connect(ruta_db)
+    _insertar_por_lotes(
+        conn,
+        'INSERT INTO usuarios (nombre_usuario, nombre_normalizado, password, rol) VALUES (?, ?, ?, ?)',
+        ((f'bench.secretaria{i}', f'bench.secretaria{i}', hash_bench, 'secretaria') for i in range(USUARIOS_LOGIN))
+    )
+    _insertar_por_lotes(
+        conn,
+        'INSERT INTO centros (nombre, direccion) VALUES (?, ?)',
+        ((c['nombre'], c['direccion']) for c in generar_datos.generar_centros(semilla, escala['centros']))
+    )
+    _insertar_por_lotes(
+        conn,
+        'INSERT INTO doctores (nombre, especialidad) VALUES (?, ?)',
+        ((d['nombre'], d['especialidad']) for d in generar_datos.generar_doctores(semilla, escala['doctores']))
+    )
+    _insertar_por_lotes(
+        conn,
+        'INSERT INTO pacientes (nombre, telefono, estado) VALUES (?, ?, ?)',
+        ((p['nombre'], p['telefono'], p['estado'])
+         for p in generar_datos.generar_pacientes(semilla, escala['pacientes'], proporcion_con_usuario=0))
+    )
+    conn.close()
+
+
+def cargar_datos_citas(ruta_db, escala, semilla, hoy):
+    """Inserta el histórico de citas en la BD de citas"""
+    especialidades = [d['especialidad'] for d in generar_datos.generar_doctores(semilla, escala['doctores'])]
+    centros = generar_datos.asignar_centros(semilla, escala['doctores'], escala['centros'])
+    citas = generar_datos.generar_citas(
+        semilla, escala['citas'], especialidades, centros,
+        generar_datos.pacientes_activos(semilla, escala['pacientes']), hoy=hoy
+    )
+
+    conn = sqlite3.connect(ruta_db)
+    _insertar_por_lotes(
+        conn,
+        'INSERT INTO citas (fecha, motivo, estado, id_paciente, id_doctor, id_centro, '
+        'id_user_registrado, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        ((c['fecha'].replace('T', ' '), c['motivo'], c['estado'], c['id_paciente'], c['id_doctor'],
+          c['id_centro'], c['id_user_registrado'], c['fecha'].replace('T', ' ')) for c in citas)
+    )
+    # Los id_cita de las citas nuevas salen del directorio
+    conn.execute("INSERT INTO citas_directorio (id_cita, shard) SELECT id_cita, 'principal' FROM citas")
+    conn.commit()
+    conn.close()
+
+
+# ==================== ESCENARIOS ====================
+
+class Contexto:
+    """Estado compartido por los escenarios durante una ejecución"""
+
+    def __init__(self, url_usuarios, url_citas, escala, semilla, hoy):
+        self.url_usuarios = url_usuarios
+        self.url_citas = url_citas
+        self.escala = escala
+        self.hoy = hoy
+        self.token = None
+        self._local = threading.local()
+        self._semilla = semilla
+        self._contador = 0
+        self._lock = threading.Lock()
+
+    def sesion(self):
+        """Sesión HTTP por hilo para reutilizar conexiones"""
+        if not hasattr(self._local, 'sesion'):
+            self._local.sesion = requests.Session()
+            with self._lock:
+                self._contador += 1
+                self._local.rng = random.Random(self._semilla * 1000 + self._contador)
+        return self._local.sesion
+
+    def rng(self):
+        self.sesion()
+        return self._local.rng
+
+    def headers(self):
+        return {'Authorization': f'Bearer {self.token}', 'Content-Type': 'application/json'}
+
+
+def escenario_login(ctx):
+    """Ráfaga de logins de usuarios de secretaría"""
+    i = ctx.rng().randrange(USUARIOS_LOGIN)
+    return ctx.sesion().post(
+        f'{ctx.url_usuarios}/auth/login',
+        json={'nombre_usuario': f'bench.secretaria{i}', 'password': PASSWORD_BENCH}
+    ), (200,)
+
+
+def escenario_crear_cita(ctx):
+    """POST /citas con validaciones contra el servicio de usuarios"""
+    rng = ctx.rng()
+    fecha = ctx.hoy + timedelta(days=rng.randrange(1, 365), minutes=rng.randrange(0, 24 * 60))
+    payload = {
+        'id_paciente': rng.randint(1, ctx.escala['pacientes']),
+        'id_doctor': rng.randint(1, ctx.escala['doctores']),
+        'id_centro': rng.randint(1, ctx.escala['centros']),
+        'fecha': fecha.replace(second=rng.randrange(60)).isoformat(),
+        'motivo': 'Benchmark'
+    }
+    # 400 (paciente inactivo) y 409 (doble reserva) son respuestas válidas del negocio
+    return ctx.sesion().post(f'{ctx.url_citas}/citas', json=payload, headers=ctx.headers()), (201, 400, 409)
+
+
+def escenario_listar_citas(ctx):
+    """GET /citas con filtros de admin (doctor + estado)"""
+    rng = ctx.rng()
+    params = {'id_doctor': rng.randint(1, ctx.escala['doctores']), 'estado': 'PROGRAMADA'}
+    return ctx.sesion().get(f'{ctx.url_citas}/citas', params=params, headers=ctx.headers()), (200,)
+
+
+def escenario_disponibilidad(ctx):
+    """Agenda de un doctor en un día concreto (consulta de disponibilidad)"""
+    rng = ctx.rng()
+    dia = ctx.hoy + timedelta(days=rng.randrange(-30, 60))
+    params = {'id_doctor': rng.randint(1, ctx.escala['doctores']), 'fecha': dia.date().isoformat()}
+    return ctx.sesion().get(f'{ctx.url_citas}/citas', params=params, headers=ctx.headers()), (200,)
+
+
+def escenario_carga_masiva(ctx):
+    """Lotes de LOTE_CARGA_MASIVA pacientes a POST /admin/lote/pacientes, como
+    los envía la carga masiva CSV"""
+    rng = ctx.rng()
+    registros = [{'nombre': f'Paciente carga {rng.random()}', 'telefono': '600000000', 'estado': 'ACTIVO'}
+                 for _ in range(LOTE_CARGA_MASIVA)]
+    return ctx.sesion().post(f'{ctx.url_usuarios}/admin/lote/pacientes', json={'registros': registros},
+                             headers=ctx.headers()), (200,)
+
+
+# Registros que procesa cada petición de los escenarios por lotes
+escenario_carga_masiva.filas = LOTE_CARGA_MASIVA
+
+
+ESCENARIOS = {
+    'login': escenario_login,
+    'crear_cita': escenario_crear_cita,
+    'listar_citas': escenario_listar_citas,
+    'disponibilidad': escenario_disponibilidad,
+    'carga_masiva': escenario_carga_masiva,
+}
+
+
+# ==================== EJECUCIÓN Y RESULTADOS ====================
+
+def percentil(valores_ordenados, p):
+    """Percentil por el método del rango más cercano"""
+    if not valores_ordenados:
+        return None
+    indice = max(0, math.ceil(p / 100 * len(valores_ordenados)) - 1)
+    return valores_ordenados[indice]
+
+
+def ejecutar_escenario(ctx, funcion, peticiones, concurrencia):
+    """Ejecuta un escenario y retorna sus métricas"""
+    latencias = []
+    errores = 0
+    lock = threading.Lock()
+
+    def una_peticion(_):
+        nonlocal errores
+        inicio = time.perf_counter()
+        try:
+            respuesta, esperados = funcion(ctx)
+            ok = respuesta.status_code in esperados
+        except requests.RequestException:
+            ok = False
+        duracion = time.perf_counter() - inicio
+        with lock:
+            latencias.append(duracion)
+            if not ok:
+                errores += 1
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        list(pool.map(una_peticion, range(peticiones)))
+    total = time.perf_counter() - inicio
+
+    latencias.sort()
+    a_ms = lambda v: round(v * 1000, 3) if v is not None else None
+    filas = getattr(funcion, 'filas', 1)
+    return {
+        'peticiones': peticiones,
+        'errores': errores,
+        'duracion_s': round(total, 3),
+        'throughput_rps': round(peticiones / total, 2) if total else None,
+        'throughput_filas_s': round(peticiones * filas / total, 2) if total else None,
+        'p50_ms': a_ms(percentil(latencias, 50)),
+        'p95_ms': a_ms(percentil(latencias, 95)),
+        'p99_ms': a_ms(percentil(latencias, 99)),
+        'max_ms': a_ms(latencias[-1] if latencias else None),
+    }
+
+
+def comparar(actual, anterior):
+    """Imprime la variación de cada escenario respecto a una ejecución anterior"""
+    print('\nComparación con ejecución anterior:')
+    for nombre, datos in actual['escenarios'].items():
+        previo = anterior.get('escenarios', {}).get(nombre)
+        if not previo:
+            continue
+        partes = []
+        for clave in ('throughput_rps', 'throughput_filas_s', 'p50_ms', 'p95_ms', 'p99_ms'):
+            if datos.get(clave) and previo.get(clave):
+                variacion = (datos[clave] - previo[clave]) / previo[clave] * 100
+                partes.append(f'{clave} {variacion:+.1f}%')
+        print(f'  {nombre:<16} ' + ', '.join(partes))
+
+
+def version_git():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks de carga de OdontoCare')
+    parser.add_argument('--pacientes', type=int, default=10000)
+    parser.add_argument('--citas', type=int, default=10000)
+    parser.add_argument('--doctores', type=int, default=None, help='Por defecto, pacientes / 200')
+    parser.add_argument('--centros', type=int, default=20)
+    parser.add_argument('--peticiones', type=int, default=500, help='Peticiones por escenario')
+    parser.add_argument('--concurrencia', type=int, default=8)
+    parser.add_argument('--escenarios', default=','.join(ESCENARIOS), help='Lista separada por comas')
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--salida', default='bench_resultados.json')
+    parser.add_argument('--comparar', default=None, help='JSON de una ejecución anterior')
+    parser.add_argument('--conservar-datos', action='store_true',
+                        help='No borrar al terminar el directorio temporal con las bases de datos')
+    args = parser.parse_args()
+
+    escala = {
+        'pacientes': args.pacientes,
+        'citas': args.citas,
+        'doctores': args.doctores or max(1, args.pacientes // 200),
+        'centros': args.centros,
+    }
+    hoy = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    directorio = tempfile.mkdtemp(prefix='odontocare_bench_')
+    db_usuarios = os.path.join(directorio, 'usuarios.db')
+    db_citas = os.path.join(directorio, 'citas.db')
+    procesos = []
+
+    try:
+        print(f'[1] Preparando bases de datos en {directorio} (escala: {escala})')
+        ejecutar_migraciones('servicio_usuarios', f'sqlite:///{db_usuarios}')
+        ejecutar_migraciones('servicio_citas', f'sqlite:///{db_citas}')
+        inicio = time.perf_counter()
+        cargar_datos_usuarios(db_usuarios, escala, args.semilla)
+        cargar_datos_citas(db_citas, escala, args.semilla, hoy)
+        print(f'    Datos cargados en {time.perf_counter() - inicio:.1f}s')
+
+        print('[2] Arrancando servicios')
+        puerto_usuarios, puerto_citas = puerto_libre(), puerto_libre()
+        proceso, url_usuarios = iniciar_servicio(
+            'servicio_usuarios', puerto_usuarios, {'DATABASE_URL': f'sqlite:///{db_usuarios}'}
+        )
+        procesos.append(proceso)
+        proceso, url_citas = iniciar_servicio('servicio_citas', puerto_citas, {
+            'DATABASE_URL': f'sqlite:///{db_citas}',
+            'SERVICIO_USUARIOS_URL': url_usuarios,
+        })
+        procesos.append(proceso)
+
+        ctx = Contexto(url_usuarios, url_citas, escala, args.semilla, hoy)
+        respuesta = requests.post(
+            f'{url_usuarios}/auth/login', json={'nombre_usuario': 'admin', 'password': 'admin123'}
+        )
+        ctx.token = respuesta.json()['token']
+
+        print(f'[3] Ejecutando escenarios ({args.peticiones} peticiones, concurrencia {args.concurrencia})')
+        resultados = {}
+        for nombre in args.escenarios.split(','):
+            resultados[nombre] = ejecutar_escenario(ctx, ESCENARIOS[nombre], args.peticiones, args.concurrencia)
+            r = resultados[nombre]
+            print(f'  {nombre:<16} {r["throughput_rps"]:>9} rps  p50 {r["p50_ms"]}ms  '
+                  f'p95 {r["p95_ms"]}ms  p99 {r["p99_ms"]}ms  errores {r["errores"]}'
+                  + (f'  ({r["throughput_filas_s"]} filas/s)' if getattr(ESCENARIOS[nombre], 'filas', 1) > 1 else ''))
+    finally:
+        for proceso in procesos:
+            proceso.terminate()
+            proceso.wait()
+        if args.conservar_datos:
+            print(f'    Bases de datos conservadas en {directorio}')
+        else:
+            shutil.rmtree(directorio, ignore_errors=True)
+
+    informe = {
+        'meta': {
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'commit': version_git(),
+            'python': platform.python_version(),
+            'plataforma': platform.platform(),
+            'escala': escala,
+            'semilla': args.semilla,
+            'peticiones': args.peticiones,
+            'concurrencia': args.concurrencia,
+        },
+        'escenarios': resultados,
+    }
+    with open(args.salida, 'w', encoding='utf-8') as archivo:
+        json.dump(informe, archivo, indent=2, ensure_ascii=False)
+    print(f'\n[OK] Resultados guardados en {args.salida}')
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as archivo:
+            comparar(informe, json.load(archivo))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,15 @@
 """
 Script cliente para carga inicial de datos del sistema OdontoCare.
 Lee los archivos CSV y envía los registros a la API REST.
+
+Por defecto usa los CSV de datos/. Con --datos se puede cargar un directorio
+generado por generar_datos.py, que incluye además un histórico de citas.
 """
 
+import argparse
 import csv
+import os
+import time
 import requests
 from datetime import datetime, timedelta
 
@@ -15,6 +21,22 @@ SERVICIO_CITAS_URL = "http://localhost:5001"
 ADMIN_USER = "admin"
 ADMIN_PASSWORD = "admin123"
 
+# Reintentos de una petición rechazada por el limitador (429) o por saturación (503)
+MAX_REINTENTOS = 10
+
+
+def enviar(metodo, url, **kwargs):
+    """Envía la petición y, si el servicio responde 429 o 503, espera lo que
+    indica Retry-After y la repite"""
+    for _ in range(MAX_REINTENTOS):
+        response = requests.request(metodo, url, **kwargs)
+        if response.status_code not in (429, 503):
+            return response
+        espera = int(response.headers.get('Retry-After', 1))
+        print(f"  [ESPERA] Servicio ocupado ({response.status_code}), reintento en {espera}s")
+        time.sleep(espera)
+    return response
+
 
 def login(nombre_usuario, password):
     """Realiza login y retorna el token JWT"""
@@ -25,7 +47,7 @@ def login(nombre_usuario, password):
     }
     
     try:
-        response = requests.post(url, json=payload)
+        response = enviar('POST', url, json=payload)
         if response.status_code == 200:
             data = response.json()
             print(f"[OK] Login exitoso para: {nombre_usuario}")
@@ -70,7 +92,7 @@ def cargar_usuarios(token, archivo_csv):
                     "rol": row['rol']
                 }
                 
-                response = requests.post(url, json=payload, headers=get_headers(token))
+                response = enviar('POST', url, json=payload, headers=get_headers(token))
                 
                 if response.status_code == 201:
                     print(f"  [OK] Usuario creado: {row['nombre_usuario']}")
@@ -109,7 +131,7 @@ def cargar_doctores(token, archivo_csv):
                     "password": row['password']
                 }
                 
-                response = requests.post(url, json=payload, headers=get_headers(token))
+                response = enviar('POST', url, json=payload, headers=get_headers(token))
                 
                 if response.status_code == 201:
                     print(f"  [OK] Doctor creado: {row['nombre']}")
@@ -149,7 +171,7 @@ def cargar_pacientes(token, archivo_csv):
                     "password": row['password']
                 }
                 
-                response = requests.post(url, json=payload, headers=get_headers(token))
+                response = enviar('POST', url, json=payload, headers=get_headers(token))
                 
                 if response.status_code == 201:
                     print(f"  [OK] Paciente creado: {row['nombre']}")
@@ -186,7 +208,7 @@ def cargar_centros(token, archivo_csv):
                     "direccion": row['direccion']
                 }
                 
-                response = requests.post(url, json=payload, headers=get_headers(token))
+                response = enviar('POST', url, json=payload, headers=get_headers(token))
                 
                 if response.status_code == 201:
                     print(f"  [OK] Centro creado: {row['nombre']}")
@@ -203,6 +225,51 @@ def cargar_centros(token, archivo_csv):
     return registros_creados
 
 
+def cargar_citas(token, archivo_csv):
+    """Carga el histórico de citas desde archivo CSV (generado por generar_datos.py)"""
+    print("\n" + "="*50)
+    print("CARGANDO CITAS")
+    print("="*50)
+    
+    url = f"{SERVICIO_CITAS_URL}/citas"
+    registros_creados = 0
+    
+    try:
+        with open(archivo_csv, 'r', encoding='utf-8') as file:
+            reader = csv.DictReader(file)
+            for numero, row in enumerate(reader, start=1):
+                # El admin puede crear la cita directamente en su estado del histórico
+                # y a nombre de quien la registró
+                payload = {
+                    "id_paciente": int(row['id_paciente']),
+                    "id_doctor": int(row['id_doctor']),
+                    "id_centro": int(row['id_centro']),
+                    "fecha": row['fecha'],
+                    "motivo": row['motivo'],
+                    "estado": row['estado']
+                }
+                if row.get('id_user_registrado'):
+                    payload["id_user_registrado"] = int(row['id_user_registrado'])
+                
+                response = enviar('POST', url, json=payload, headers=get_headers(token))
+                
+                if response.status_code == 201:
+                    registros_creados += 1
+                else:
+                    print(f"  [ERROR] Error creando cita de la fila {numero}: {response.json()}")
+                
+                if numero % 1000 == 0:
+                    print(f"  [OK] {numero} filas procesadas")
+    
+    except FileNotFoundError:
+        print(f"  [ERROR] Archivo no encontrado: {archivo_csv}")
+    except Exception as e:
+        print(f"  [ERROR] Error: {e}")
+    
+    print(f"\nTotal citas creadas: {registros_creados}")
+    return registros_creados
+
+
 def crear_cita_ejemplo(token):
     """Crea una cita médica de ejemplo"""
     print("\n" + "="*50)
@@ -225,7 +292,7 @@ def crear_cita_ejemplo(token):
     }
     
     try:
-        response = requests.post(url, json=payload, headers=get_headers(token))
+        response = enviar('POST', url, json=payload, headers=get_headers(token))
         
         if response.status_code == 201:
             cita = response.json()
@@ -247,6 +314,10 @@ def crear_cita_ejemplo(token):
 
 def main():
     """Función principal del script de carga inicial"""
+    parser = argparse.ArgumentParser(description='Carga inicial de datos de OdontoCare')
+    parser.add_argument('--datos', default='datos', help='Directorio con los archivos CSV')
+    args = parser.parse_args()
+    
     print("\n" + "="*60)
     print("   SISTEMA ODONTOCARE - CARGA INICIAL DE DATOS")
     print("="*60)
@@ -261,23 +332,28 @@ def main():
     
     # 2. Cargar usuarios
     print("\n[2] Cargando usuarios...")
-    cargar_usuarios(token, "datos/usuarios.csv")
+    cargar_usuarios(token, os.path.join(args.datos, "usuarios.csv"))
     
     # 3. Cargar doctores
     print("\n[3] Cargando doctores...")
-    cargar_doctores(token, "datos/doctores.csv")
+    cargar_doctores(token, os.path.join(args.datos, "doctores.csv"))
     
     # 4. Cargar pacientes
     print("\n[4] Cargando pacientes...")
-    cargar_pacientes(token, "datos/pacientes.csv")
+    cargar_pacientes(token, os.path.join(args.datos, "pacientes.csv"))
     
     # 5. Cargar centros
     print("\n[5] Cargando centros médicos...")
-    cargar_centros(token, "datos/centros.csv")
+    cargar_centros(token, os.path.join(args.datos, "centros.csv"))
     
-    # 6. Crear cita de ejemplo
-    print("\n[6] Creando cita médica de ejemplo...")
-    crear_cita_ejemplo(token)
+    # 6. Cargar histórico de citas (solo en datos generados)
+    archivo_citas = os.path.join(args.datos, "citas.csv")
+    if os.path.exists(archivo_citas):
+        print("\n[6] Cargando histórico de citas...")
+        cargar_citas(token, archivo_citas)
+    else:
+        print("\n[6] Creando cita médica de ejemplo...")
+        crear_cita_ejemplo(token)
     
     print("\n" + "="*60)
     print("   CARGA INICIAL COMPLETADA")
@@ -0,0 +1,72 @@
+"""
+Colector OTLP/HTTP mínimo para desarrollo (sustituto de un OpenTelemetry Collector).
+
+Recibe los lotes de spans que envían los servicios con
+TRAZAS_DESTINO=http://localhost:4318/v1/traces, los guarda como líneas JSON
+y muestra un resumen con la duración de cada span.
+
+Uso:
+    python colector_trazas.py --puerto 4318 --salida trazas.jsonl
+"""
+
+import argparse
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def crear_manejador(ruta_salida):
+    class Manejador(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != '/v1/traces':
+                self.send_response(404)
+                self.end_headers()
+                return
+
+            longitud = int(self.headers.get('Content-Length', 0))
+            try:
+                datos = json.loads(self.rfile.read(longitud))
+            except ValueError:
+                self.send_response(400)
+                self.end_headers()
+                return
+
+            with open(ruta_salida, 'a', encoding='utf-8') as archivo:
+                for recurso in datos.get('resourceSpans', []):
+                    servicio = next(
+                        (a['value'].get('stringValue') for a in recurso.get('resource', {}).get('attributes', [])
+                         if a['key'] == 'service.name'),
+                        'desconocido'
+                    )
+                    for scope in recurso.get('scopeSpans', []):
+                        for span in scope.get('spans', []):
+                            duracion_ms = (int(span['endTimeUnixNano']) - int(span['startTimeUnixNano'])) / 1e6
+                            archivo.write(json.dumps({'servicio': servicio, **span}, ensure_ascii=False) + '\n')
+                            print(f"  {span['traceId'][:8]} {servicio:<20} {span['name']:<45} {duracion_ms:9.2f} ms")
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(b'{}')
+
+        def log_message(self, formato, *args):
+            pass
+
+    return Manejador
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Colector OTLP/HTTP de desarrollo')
+    parser.add_argument('--puerto', type=int, default=4318)
+    parser.add_argument('--salida', default='trazas.jsonl')
+    args = parser.parse_args()
+
+    servidor = ThreadingHTTPServer(('0.0.0.0', args.puerto), crear_manejador(args.salida))
+    print(f"[OK] Colector de trazas escuchando en http://localhost:{args.puerto}/v1/traces")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,8 @@
+"""
+Módulos comunes de OdontoCare, compartidos por los servicios (servicio_usuarios,
+servicio_citas) y las aplicaciones web (web_usuarios, web_citas).
+
+Cada módulo expone una extensión con init_app() (trazador, metricas,
+limitador...) o funciones sueltas, y se importa directamente:
+``from odontocare_comun.trazas import trazador``.
+"""
@@ -0,0 +1,241 @@
+"""
+Caché HTTP para las peticiones GET a los servicios.
+
+Guarda las respuestas 200 que traen ETag o Last-Modified y, en la siguiente
+petición a la misma URL con el mismo token, envía If-None-Match /
+If-Modified-Since; si el servicio contesta 304 se reutiliza el cuerpo
+guardado. Respeta Cache-Control: con max-age la respuesta se reutiliza sin
+contactar al servicio mientras esté fresca y con no-store no se guarda.
+
+Con CACHE_WEB_TTL (segundos, 0 por defecto) una respuesta guardada se
+reutiliza sin revalidar durante ese tiempo aunque el servicio pida
+no-cache. Es opcional porque oculta las escrituras ajenas hasta que vence:
+invalidar() solo descarta lo que ve este almacén, así que con el almacén en
+memoria los demás workers (y cualquier escritura hecha por otro cliente)
+siguen sirviendo la respuesta anterior hasta CACHE_WEB_TTL segundos.
+
+Con CACHE_WEB_ALMACEN=memoria (por defecto) cada proceso tiene su caché;
+con la ruta de un fichero, las respuestas se guardan en SQLite y todos los
+workers de la máquina comparten las entradas y las invalidaciones. La clave
+de cada entrada es la URL más el hash del token, que no se guarda.
+
+Las peticiones salen por el pool compartido de cliente_http; obtener() es
+la corrutina equivalente a get() para lanzarla junto a otras con
+cliente_http.reunir(). Con el almacén SQLite las lecturas y escrituras del
+fichero se hacen en el executor del bucle, para no detener las demás
+peticiones en curso.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode
+import httpx
+from odontocare_comun.cliente_http import cliente_http
+
+# Cabeceras que no se guardan: el cuerpo se guarda ya descomprimido
+_CABECERAS_EXCLUIDAS = {'content-encoding', 'content-length', 'transfer-encoding', 'connection'}
+
+
+def _directivas(cache_control):
+    directivas = {}
+    for parte in (cache_control or '').split(','):
+        nombre, _, valor = parte.strip().partition('=')
+        if nombre:
+            directivas[nombre.lower()] = valor.strip('"')
+    return directivas
+
+
+class AlmacenMemoria:
+    """Entradas en memoria del proceso (LRU acotada)"""
+
+    def __init__(self, max_entradas):
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def leer(self, clave):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada:
+                self._entradas.move_to_end(clave)
+            return entrada
+
+    def escribir(self, clave, entrada):
+        with self._lock:
+            self._entradas[clave] = entrada
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def borrar(self, clave):
+        with self._lock:
+            self._entradas.pop(clave, None)
+
+    def borrar_prefijo(self, prefijo):
+        with self._lock:
+            for clave in [c for c in self._entradas if c.startswith(prefijo)]:
+                del self._entradas[clave]
+
+
+class AlmacenSQLite:
+    """Entradas en un fichero SQLite compartido por los procesos de la máquina"""
+
+    def __init__(self, ruta, max_entradas):
+        self.ruta = ruta
+        self.max_entradas = max_entradas
+        self._local = threading.local()
+        self._escrituras = 0
+        self._conexion().execute(
+            'CREATE TABLE IF NOT EXISTS respuestas (clave TEXT PRIMARY KEY, entrada TEXT NOT NULL, '
+            'cuerpo BLOB NOT NULL, guardada REAL NOT NULL)'
+        )
+
+    def _conexion(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.ruta, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            self._local.conn = conn
+        return conn
+
+    def leer(self, clave):
+        fila = self._conexion().execute(
+            'SELECT entrada, cuerpo FROM respuestas WHERE clave = ?', (clave,)
+        ).fetchone()
+        if fila is None:
+            return None
+        return {**json.loads(fila[0]), 'cuerpo': fila[1]}
+
+    def escribir(self, clave, entrada):
+        datos = {k: v for k, v in entrada.items() if k != 'cuerpo'}
+        conn = self._conexion()
+        conn.execute(
+            'INSERT OR REPLACE INTO respuestas (clave, entrada, cuerpo, guardada) VALUES (?, ?, ?, ?)',
+            (clave, json.dumps(datos), entrada['cuerpo'], time.time())
+        )
+        self._escrituras += 1
+        if self._escrituras % 100 == 0:
+            conn.execute(
+                'DELETE FROM respuestas WHERE guardada <= '
+                '(SELECT guardada FROM respuestas ORDER BY guardada DESC LIMIT 1 OFFSET ?)',
+                (self.max_entradas,)
+            )
+
+    def borrar(self, clave):
+        self._conexion().execute('DELETE FROM respuestas WHERE clave = ?', (clave,))
+
+    def borrar_prefijo(self, prefijo):
+        # substr en lugar de LIKE: la URL puede contener % y _
+        self._conexion().execute(
+            'DELETE FROM respuestas WHERE substr(clave, 1, ?) = ?', (len(prefijo), prefijo)
+        )
+
+
+class CacheHTTP:
+    """Cliente GET con validación condicional y caché acotada"""
+
+    def __init__(self, max_entradas=256, almacen=None, ttl=None):
+        self.ttl = float(os.environ.get('CACHE_WEB_TTL', 0) if ttl is None else ttl)
+        self.max_entradas = max_entradas
+        self._tipo_almacen = almacen or os.environ.get('CACHE_WEB_ALMACEN', 'memoria')
+        self._almacen = None
+        self._lock = threading.Lock()
+
+    @property
+    def almacen(self):
+        # El fichero se abre en el primer uso y no al importar el módulo
+        if self._almacen is None:
+            with self._lock:
+                if self._almacen is None:
+                    if self._tipo_almacen == 'memoria':
+                        self._almacen = AlmacenMemoria(self.max_entradas)
+                    else:
+                        self._almacen = AlmacenSQLite(self._tipo_almacen, self.max_entradas)
+        return self._almacen
+
+    async def _en_almacen(self, metodo, *args):
+        """Llama a un método del almacén; el de SQLite hace E/S de disco y se
+        ejecuta fuera del bucle de cliente_http"""
+        if self._tipo_almacen == 'memoria':
+            return getattr(self.almacen, metodo)(*args)
+        return await asyncio.get_running_loop().run_in_executor(
+            None, lambda: getattr(self.almacen, metodo)(*args)
+        )
+
+    def _clave(self, url, params, headers):
+        if params:
+            url = f"{url}?{urlencode(sorted(params.items()))}"
+        token = (headers or {}).get('Authorization') or ''
+        return f"{url}\x00{hashlib.sha256(token.encode()).hexdigest()[:32]}"
+
+    def get(self, url, headers=None, params=None, **kwargs):
+        return cliente_http.ejecutar(self.obtener(url, headers=headers, params=params, **kwargs))
+
+    async def obtener(self, url, headers=None, params=None, **kwargs):
+        clave = self._clave(url, params, headers)
+        entrada = await self._en_almacen('leer', clave)
+
+        headers = dict(headers or {})
+        if entrada:
+            if entrada['expira'] > time.time():
+                return self._respuesta(url, entrada)
+            if entrada['etag']:
+                headers['If-None-Match'] = entrada['etag']
+            if entrada['last_modified']:
+                headers['If-Modified-Since'] = entrada['last_modified']
+
+        respuesta = await cliente_http.peticion('GET', url, headers=headers, params=params, **kwargs)
+
+        if respuesta.status_code == 304 and entrada:
+            await self._guardar(clave, entrada, respuesta.headers)
+            return self._respuesta(url, entrada)
+        if respuesta.status_code == 200:
+            await self._guardar(clave, {
+                'estado': 200,
+                'cabeceras': [(k, v) for k, v in respuesta.headers.items()
+                              if k.lower() not in _CABECERAS_EXCLUIDAS],
+                'cuerpo': respuesta.content,
+            }, respuesta.headers)
+        return respuesta
+
+    @staticmethod
+    def _respuesta(url, entrada):
+        return httpx.Response(entrada['estado'], headers=entrada['cabeceras'], content=entrada['cuerpo'],
+                              request=httpx.Request('GET', url))
+
+    async def _guardar(self, clave, entrada, cabeceras):
+        directivas = _directivas(cabeceras.get('Cache-Control'))
+        guardadas = httpx.Headers(entrada['cabeceras'])
+        etag = cabeceras.get('ETag') or guardadas.get('ETag')
+        last_modified = cabeceras.get('Last-Modified') or guardadas.get('Last-Modified')
+        if 'no-store' in directivas or not (etag or last_modified):
+            await self._en_almacen('borrar', clave)
+            return
+
+        max_age = 0
+        if 'no-cache' not in directivas:
+            try:
+                max_age = int(directivas.get('max-age', 0))
+            except ValueError:
+                max_age = 0
+
+        await self._en_almacen('escribir', clave, {
+            **entrada,
+            'etag': etag,
+            'last_modified': last_modified,
+            'expira': time.time() + max(max_age, self.ttl),
+        })
+
+    def invalidar(self, prefijo_url=''):
+        """Descarta las entradas cuya URL empieza por `prefijo_url`"""
+        self.almacen.borrar_prefijo(prefijo_url)
+
+
+cache_http = CacheHTTP()
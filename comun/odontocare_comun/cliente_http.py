@@ -0,0 +1,103 @@
+"""
+Cliente HTTP asíncrono con un pool de conexiones compartido por el proceso.
+
+Las peticiones se hacen con httpx.AsyncClient en un bucle de eventos que
+corre en un hilo propio, así que todos los hilos de trabajo del proceso
+reutilizan las mismas conexiones keep-alive. Las vistas síncronas usan
+get()/post()/put()/delete(), que esperan la respuesta, o reunir(), que
+lanza varias corrutinas a la vez y espera a que terminen todas: una vista
+que consulta varios servicios tarda lo que la petición más lenta y no la
+suma de todas. Una vista async puede esperar las mismas corrutinas con
+`await cliente_http.esperar(...)` sin bloquear su propio bucle.
+
+Configuración (variables de entorno):
+    HTTP_MAX_CONEXIONES          conexiones simultáneas del pool (100)
+    HTTP_MAX_CONEXIONES_LIBRES   conexiones keep-alive que se conservan (20)
+    HTTP_TIMEOUT                 tiempo máximo por petición en segundos (30)
+"""
+
+import asyncio
+import os
+import threading
+import httpx
+
+
+async def _reunir(corrutinas, devolver_excepciones):
+    return await asyncio.gather(*corrutinas, return_exceptions=devolver_excepciones)
+
+
+class ClienteHTTP:
+    """Pool httpx compartido, servido por un bucle de eventos en segundo plano"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._bucle = None
+        self._cliente = None
+
+    def _iniciar(self):
+        # Se crea en el primer uso de cada proceso: tras un fork (gunicorn,
+        # recarga del servidor de desarrollo) el hilo del bucle no existe
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            bucle = asyncio.new_event_loop()
+            threading.Thread(target=bucle.run_forever, name='cliente-http', daemon=True).start()
+            self._cliente = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=int(os.environ.get('HTTP_MAX_CONEXIONES', 100)),
+                    max_keepalive_connections=int(os.environ.get('HTTP_MAX_CONEXIONES_LIBRES', 20)),
+                ),
+                timeout=float(os.environ.get('HTTP_TIMEOUT', 30)),
+                follow_redirects=True,
+            )
+            self._bucle = bucle
+            self._pid = os.getpid()
+
+    def _lanzar(self, corrutina):
+        self._iniciar()
+        return asyncio.run_coroutine_threadsafe(corrutina, self._bucle)
+
+    async def peticion(self, metodo, url, reintentos=0, **kwargs):
+        """Corrutina que hace la petición; se ejecuta en el bucle del cliente.
+
+        Con `reintentos` la petición se repite tras un error de transporte
+        (conexión, timeout), así que solo debe usarse en peticiones
+        idempotentes: GET o POST con Idempotency-Key.
+        """
+        for intento in range(reintentos + 1):
+            try:
+                return await self._cliente.request(metodo, url, **kwargs)
+            except httpx.TransportError:
+                if intento == reintentos:
+                    raise
+                await asyncio.sleep(0.1 * 2 ** intento)
+
+    def ejecutar(self, corrutina):
+        """Ejecuta una corrutina en el bucle del cliente y espera su resultado"""
+        return self._lanzar(corrutina).result()
+
+    async def esperar(self, corrutina):
+        """Como ejecutar(), para vistas async: espera sin bloquear el bucle del llamante"""
+        return await asyncio.wrap_future(self._lanzar(corrutina))
+
+    def reunir(self, *corrutinas, devolver_excepciones=False):
+        """Ejecuta varias corrutinas a la vez y devuelve sus resultados en orden"""
+        return self.ejecutar(_reunir(corrutinas, devolver_excepciones))
+
+    def get(self, url, **kwargs):
+        return self.ejecutar(self.peticion('GET', url, **kwargs))
+
+    def post(self, url, **kwargs):
+        return self.ejecutar(self.peticion('POST', url, **kwargs))
+
+    def put(self, url, **kwargs):
+        return self.ejecutar(self.peticion('PUT', url, **kwargs))
+
+    def delete(self, url, **kwargs):
+        return self.ejecutar(self.peticion('DELETE', url, **kwargs))
+
+
+cliente_http = ClienteHTTP()
@@ -0,0 +1,122 @@
+"""
+Compresión negociada de las respuestas (brotli o gzip según Accept-Encoding).
+
+Solo se comprimen respuestas de texto/JSON a partir de COMPRESION_MINIMO
+bytes. Las respuestas enviadas por partes (listados) se comprimen también
+por partes: se leen bloques hasta superar el umbral y, si la respuesta
+termina antes, se envía sin comprimir.
+
+Cuando una respuesta con ETag se comprime, la codificación se añade al
+ETag ("doctores-3-1700000000-br") para que cada representación tenga el
+suyo.
+"""
+
+import gzip
+import itertools
+import os
+import zlib
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dependencia opcional
+    brotli = None
+
+CODIFICACIONES = ('br', 'gzip')
+
+_TIPOS_COMPRIMIBLES = ('application/json', 'text/')
+
+
+class Compresion:
+    """Hook after_request que comprime las respuestas según Accept-Encoding"""
+
+    def __init__(self):
+        self.activa = True
+        self.minimo = 1024
+        self.nivel_gzip = 6
+        self.nivel_brotli = 4
+
+    def init_app(self, app):
+        app.config.setdefault('COMPRESION_ACTIVA', os.environ.get('COMPRESION_ACTIVA', '1') != '0')
+        app.config.setdefault('COMPRESION_MINIMO', int(os.environ.get('COMPRESION_MINIMO', 1024)))
+        app.config.setdefault('COMPRESION_NIVEL_GZIP', int(os.environ.get('COMPRESION_NIVEL_GZIP', 6)))
+        app.config.setdefault('COMPRESION_NIVEL_BROTLI', int(os.environ.get('COMPRESION_NIVEL_BROTLI', 4)))
+        self.activa = app.config['COMPRESION_ACTIVA']
+        self.minimo = app.config['COMPRESION_MINIMO']
+        self.nivel_gzip = app.config['COMPRESION_NIVEL_GZIP']
+        self.nivel_brotli = app.config['COMPRESION_NIVEL_BROTLI']
+
+        if self.activa:
+            app.after_request(self._comprimir)
+
+    def _elegir_codificacion(self):
+        aceptadas = request.accept_encodings
+        if brotli is not None and aceptadas['br']:
+            return 'br'
+        if aceptadas['gzip']:
+            return 'gzip'
+        return None
+
+    def _compresor(self, codificacion):
+        """Funciones (comprimir, terminar) para comprimir por partes"""
+        if codificacion == 'br':
+            compresor = brotli.Compressor(quality=self.nivel_brotli)
+            return compresor.process, compresor.finish
+        compresor = zlib.compressobj(self.nivel_gzip, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compresor.compress, compresor.flush
+
+    def _comprimir_bytes(self, datos, codificacion):
+        if codificacion == 'br':
+            return brotli.compress(datos, quality=self.nivel_brotli)
+        return gzip.compress(datos, compresslevel=self.nivel_gzip, mtime=0)
+
+    def _comprimir(self, response):
+        if (response.status_code < 200 or response.status_code in (204, 206, 304)
+                or response.direct_passthrough
+                or 'Content-Encoding' in response.headers
+                or not (response.mimetype or '').startswith(_TIPOS_COMPRIMIBLES)):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        codificacion = self._elegir_codificacion()
+        if codificacion is None or request.method == 'HEAD':
+            return response
+
+        if response.is_streamed:
+            partes = response.iter_encoded()
+            inicio, tamano = [], 0
+            for parte in partes:
+                inicio.append(parte)
+                tamano += len(parte)
+                if tamano >= self.minimo:
+                    break
+            else:
+                # La respuesta completa no llega al umbral: se envía tal cual
+                response.set_data(b''.join(inicio))
+                return response
+
+            comprimir, terminar = self._compresor(codificacion)
+
+            def cuerpo():
+                for parte in itertools.chain(inicio, partes):
+                    datos = comprimir(parte)
+                    if datos:
+                        yield datos
+                yield terminar()
+
+            response.response = cuerpo()
+            response.headers.pop('Content-Length', None)
+        else:
+            datos = response.get_data()
+            if len(datos) < self.minimo:
+                return response
+            response.set_data(self._comprimir_bytes(datos, codificacion))
+
+        response.headers['Content-Encoding'] = codificacion
+        etag, debil = response.get_etag()
+        if etag:
+            response.set_etag(f'{etag}-{codificacion}', weak=debil)
+        return response
+
+
+compresion = Compresion()
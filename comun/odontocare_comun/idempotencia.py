@@ -0,0 +1,195 @@
+"""
+Cabecera Idempotency-Key en los endpoints de creación.
+
+La primera petición con una clave reserva una fila en claves_idempotencia
+(por usuario y clave) con la huella de la petición (método, ruta y cuerpo)
+y, al terminar, guarda el código, el tipo y el cuerpo de la respuesta. Un
+reintento con la misma clave recibe la respuesta guardada, con la cabecera
+Idempotent-Replayed, sin volver a ejecutar la vista ni sus validaciones.
+Si la huella no coincide se responde 422, y si la primera petición sigue
+en curso, 409 con Retry-After.
+
+Las respuestas 5xx no se guardan, para que el cliente pueda reintentar.
+
+Configuración (variables de entorno):
+    IDEMPOTENCIA_TTL        segundos que se conserva cada clave (86400)
+    IDEMPOTENCIA_MAX_FILAS  tamaño máximo de la tabla tras cada poda (10000)
+    IDEMPOTENCIA_BLOQUEO    segundos tras los que una petición en curso se
+                            considera abandonada y la clave se reutiliza (60)
+"""
+
+import hashlib
+import os
+import threading
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import current_app, jsonify, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import DateTime, Integer, LargeBinary, text
+from sqlalchemy.exc import IntegrityError
+
+_SQL_BUSCAR = text(
+    'SELECT huella, estado_http, tipo, cuerpo, creada, expira FROM claves_idempotencia '
+    'WHERE usuario = :usuario AND clave = :clave'
+).columns(estado_http=Integer, cuerpo=LargeBinary, creada=DateTime, expira=DateTime)
+_SQL_RESERVAR = text(
+    'INSERT INTO claves_idempotencia (usuario, clave, huella, creada, expira) '
+    'VALUES (:usuario, :clave, :huella, :creada, :expira)'
+)
+_SQL_GUARDAR = text(
+    'UPDATE claves_idempotencia SET estado_http = :estado_http, tipo = :tipo, cuerpo = :cuerpo '
+    'WHERE usuario = :usuario AND clave = :clave'
+)
+_SQL_BORRAR = text('DELETE FROM claves_idempotencia WHERE usuario = :usuario AND clave = :clave')
+_SQL_PURGAR_CADUCADAS = text('DELETE FROM claves_idempotencia WHERE expira <= :ahora')
+_SQL_PURGAR_EXCESO = text(
+    'DELETE FROM claves_idempotencia WHERE expira <= '
+    '(SELECT expira FROM claves_idempotencia ORDER BY expira DESC LIMIT 1 OFFSET :max_filas)'
+)
+
+# Cada cuántas reservas se poda la tabla
+_PODA_CADA = 100
+# Intentos de reserva cuando otra petición con la misma clave la toma y la
+# suelta entre la consulta y el INSERT
+_INTENTOS_RESERVA = 3
+# _reservar() no consiguió la clave ni una fila que mostrar: se trata como en curso
+_OCUPADA = object()
+
+
+class Idempotencia:
+    """Reserva, guarda y reproduce respuestas por Idempotency-Key"""
+
+    def __init__(self):
+        self.ttl = 86400
+        self.max_filas = 10000
+        self.bloqueo = 60
+        self._reservas = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault('IDEMPOTENCIA_TTL', int(os.environ.get('IDEMPOTENCIA_TTL', 86400)))
+        app.config.setdefault('IDEMPOTENCIA_MAX_FILAS', int(os.environ.get('IDEMPOTENCIA_MAX_FILAS', 10000)))
+        app.config.setdefault('IDEMPOTENCIA_BLOQUEO', int(os.environ.get('IDEMPOTENCIA_BLOQUEO', 60)))
+        self.ttl = app.config['IDEMPOTENCIA_TTL']
+        self.max_filas = app.config['IDEMPOTENCIA_MAX_FILAS']
+        self.bloqueo = app.config['IDEMPOTENCIA_BLOQUEO']
+
+    # ==================== TABLA ====================
+
+    @staticmethod
+    def _engine():
+        # Motor principal de Flask-SQLAlchemy de la aplicación actual
+        return current_app.extensions['sqlalchemy'].engine
+
+    def _reservar(self, usuario, clave, huella):
+        """Reserva la clave para esta petición; si ya existe devuelve su fila
+        (o _OCUPADA si no se pudo reservar ni leer)"""
+        parametros = {'usuario': usuario, 'clave': clave}
+        for _ in range(_INTENTOS_RESERVA):
+            ahora = datetime.utcnow()
+            try:
+                with self._engine().begin() as conn:
+                    fila = conn.execute(_SQL_BUSCAR, parametros).first()
+                    if fila is not None:
+                        caducada = fila.expira <= ahora
+                        abandonada = (fila.estado_http is None
+                                      and fila.creada + timedelta(seconds=self.bloqueo) <= ahora)
+                        if not (caducada or abandonada):
+                            return fila
+                        conn.execute(_SQL_BORRAR, parametros)
+                    conn.execute(_SQL_RESERVAR, {
+                        **parametros,
+                        'huella': huella,
+                        'creada': ahora,
+                        'expira': ahora + timedelta(seconds=self.ttl),
+                    })
+            except IntegrityError:
+                # Otra petición con la misma clave la reservó entre la consulta y el INSERT
+                with self._engine().connect() as conn:
+                    fila = conn.execute(_SQL_BUSCAR, parametros).first()
+                if fila is not None:
+                    return fila
+                # ...y ya la ha liberado (respuesta 5xx): se intenta de nuevo
+                continue
+
+            with self._lock:
+                self._reservas += 1
+                podar = self._reservas % _PODA_CADA == 0
+            if podar:
+                self.podar()
+            return None
+        return _OCUPADA
+
+    def _guardar(self, usuario, clave, response):
+        with self._engine().begin() as conn:
+            conn.execute(_SQL_GUARDAR, {
+                'usuario': usuario,
+                'clave': clave,
+                'estado_http': response.status_code,
+                'tipo': response.content_type,
+                'cuerpo': response.get_data(),
+            })
+
+    def _liberar(self, usuario, clave):
+        with self._engine().begin() as conn:
+            conn.execute(_SQL_BORRAR, {'usuario': usuario, 'clave': clave})
+
+    def podar(self):
+        """Borra las claves caducadas y las más antiguas por encima de IDEMPOTENCIA_MAX_FILAS"""
+        with self._engine().begin() as conn:
+            conn.execute(_SQL_PURGAR_CADUCADAS, {'ahora': datetime.utcnow()})
+            conn.execute(_SQL_PURGAR_EXCESO, {'max_filas': self.max_filas})
+
+    # ==================== DECORADOR ====================
+
+    @staticmethod
+    def _en_curso():
+        response = jsonify({'error': 'Hay una petición en curso con esta Idempotency-Key'})
+        response.status_code = 409
+        response.headers['Retry-After'] = '1'
+        return response
+
+    def _respuesta_existente(self, fila, huella):
+        if fila is _OCUPADA:
+            return self._en_curso()
+        if fila.huella != huella:
+            return jsonify({'error': 'La Idempotency-Key ya se usó con una petición distinta'}), 422
+        if fila.estado_http is None:
+            return self._en_curso()
+        response = current_app.response_class(fila.cuerpo, status=fila.estado_http, content_type=fila.tipo)
+        response.headers['Idempotent-Replayed'] = 'true'
+        return response
+
+    def idempotente(self, f):
+        """Decorador: aplica Idempotency-Key a la vista (requiere un JWT válido)"""
+        @wraps(f)
+        def envoltura(*args, **kwargs):
+            clave = request.headers.get('Idempotency-Key')
+            if clave is None:
+                return f(*args, **kwargs)
+            if not 0 < len(clave) <= 255:
+                return jsonify({'error': 'Idempotency-Key debe tener entre 1 y 255 caracteres'}), 400
+
+            usuario = str(get_jwt_identity()['id_user'])
+            huella = hashlib.sha256(b'\n'.join([
+                request.method.encode(), request.path.encode(), request.get_data()
+            ])).hexdigest()
+
+            existente = self._reservar(usuario, clave, huella)
+            if existente is not None:
+                return self._respuesta_existente(existente, huella)
+
+            try:
+                response = current_app.make_response(f(*args, **kwargs))
+            except BaseException:
+                self._liberar(usuario, clave)
+                raise
+            if response.status_code >= 500:
+                self._liberar(usuario, clave)
+            else:
+                self._guardar(usuario, clave, response)
+            return response
+        return envoltura
+
+
+idempotencia = Idempotencia()
@@ -0,0 +1,283 @@
+"""
+Limitación de peticiones (token bucket) y control de admisión.
+
+Cada petición consume un token del cubo de su cliente: el usuario del JWT
+(con la cuota de su rol) o, sin token válido, la IP (cuota "anonimo").
+Algunos endpoints tienen además un cubo propio por cliente (login,
+creación de citas) con @limitador.limite(nombre), del que pueden quedar
+exentos algunos roles (el admin en la carga de citas). Sin tokens se responde
+429 con Retry-After; todas las respuestas limitadas llevan RateLimit-Limit
+y RateLimit-Remaining del cubo más restrictivo.
+
+@limitador.concurrente(nombre) acota cuántas peticiones de un endpoint
+costoso se atienden a la vez en el proceso. Las que no consiguen plaza en
+LIMITADOR_ESPERA segundos reciben 503 con Retry-After en lugar de hacer
+crecer la latencia de todas.
+
+Configuración (variables de entorno):
+    LIMITADOR_ACTIVO        0 desactiva la limitación (por defecto activa)
+    LIMITADOR_ALMACEN       "memoria" (por defecto, estado del proceso) o la
+                            ruta de un fichero SQLite compartido por todos
+                            los workers (p. ej. /dev/shm/limitador.db)
+    LIMITADOR_CUOTAS        tasa/ráfaga por rol o cubo, p. ej.
+                            "paciente=2/20,login=0.1/5" (tokens por segundo
+                            y capacidad del cubo)
+    LIMITADOR_CONCURRENCIA  plazas por endpoint costoso, p. ej. "listados=4"
+    LIMITADOR_ESPERA        segundos que se espera plaza antes del 503 (1.0)
+    LIMITADOR_PROXIES       IPs o redes de los proxies de confianza, p. ej.
+                            "127.0.0.1,10.0.0.0/8" (por defecto, loopback):
+                            las peticiones que llegan a través de ellos (las
+                            webs) se cuentan por la IP del cliente que
+                            indican en X-Forwarded-For
+"""
+
+import ipaddress
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, g, jsonify, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt.exceptions import PyJWTError
+
+# (tokens por segundo, capacidad del cubo)
+CUOTAS = {
+    'admin': (50.0, 200),
+    'secretaria': (20.0, 100),
+    'medico': (20.0, 100),
+    'paciente': (5.0, 30),
+    'anonimo': (10.0, 50),
+    'login': (0.2, 20),
+    'crear_cita': (1.0, 20),
+}
+
+CONCURRENCIA = {
+    'login': 8,
+    'listados': 8,
+    'crear_cita': 16,
+}
+
+
+def _leer_pares(texto):
+    pares = {}
+    for parte in (texto or '').split(','):
+        nombre, _, valor = parte.strip().partition('=')
+        if nombre and valor:
+            pares[nombre] = valor
+    return pares
+
+
+class AlmacenMemoria:
+    """Cubos en un diccionario del proceso (LRU acotado)"""
+
+    def __init__(self, max_claves=10000):
+        self.max_claves = max_claves
+        self._cubos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consumir(self, clave, tasa, rafaga, ahora):
+        with self._lock:
+            tokens, ultimo = self._cubos.pop(clave, (rafaga, ahora))
+            tokens = min(rafaga, tokens + (ahora - ultimo) * tasa)
+            permitido = tokens >= 1
+            if permitido:
+                tokens -= 1
+            self._cubos[clave] = (tokens, ahora)
+            while len(self._cubos) > self.max_claves:
+                self._cubos.popitem(last=False)
+        return permitido, tokens
+
+
+class AlmacenSQLite:
+    """Cubos en una tabla SQLite, coherentes entre varios procesos"""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._local = threading.local()
+        self._conexion().execute(
+            'CREATE TABLE IF NOT EXISTS cubos '
+            '(clave TEXT PRIMARY KEY, tokens REAL NOT NULL, actualizado REAL NOT NULL)'
+        )
+
+    def _conexion(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.ruta, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            self._local.conn = conn
+        return conn
+
+    def consumir(self, clave, tasa, rafaga, ahora):
+        conn = self._conexion()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            fila = conn.execute('SELECT tokens, actualizado FROM cubos WHERE clave = ?', (clave,)).fetchone()
+            tokens, ultimo = fila if fila else (rafaga, ahora)
+            tokens = min(rafaga, tokens + max(0.0, ahora - ultimo) * tasa)
+            permitido = tokens >= 1
+            if permitido:
+                tokens -= 1
+            conn.execute(
+                'INSERT OR REPLACE INTO cubos (clave, tokens, actualizado) VALUES (?, ?, ?)',
+                (clave, tokens, ahora)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return permitido, tokens
+
+
+class Limitador:
+    """Token bucket por usuario/IP y límites de concurrencia por endpoint"""
+
+    def __init__(self):
+        self.activo = True
+        self.almacen = None
+        self.cuotas = dict(CUOTAS)
+        self.espera = 1.0
+        self.proxies = []
+        self._semaforos = {}
+
+    def init_app(self, app):
+        app.config.setdefault('LIMITADOR_ACTIVO', os.environ.get('LIMITADOR_ACTIVO', '1') != '0')
+        app.config.setdefault('LIMITADOR_ALMACEN', os.environ.get('LIMITADOR_ALMACEN', 'memoria'))
+        app.config.setdefault('LIMITADOR_CUOTAS', os.environ.get('LIMITADOR_CUOTAS', ''))
+        app.config.setdefault('LIMITADOR_CONCURRENCIA', os.environ.get('LIMITADOR_CONCURRENCIA', ''))
+        app.config.setdefault('LIMITADOR_ESPERA', float(os.environ.get('LIMITADOR_ESPERA', 1.0)))
+        app.config.setdefault('LIMITADOR_PROXIES', os.environ.get('LIMITADOR_PROXIES', '127.0.0.1,::1'))
+        self.activo = app.config['LIMITADOR_ACTIVO']
+        self.espera = app.config['LIMITADOR_ESPERA']
+        self.proxies = [ipaddress.ip_network(red.strip(), strict=False)
+                        for red in app.config['LIMITADOR_PROXIES'].split(',') if red.strip()]
+
+        self.cuotas = dict(CUOTAS)
+        for nombre, valor in _leer_pares(app.config['LIMITADOR_CUOTAS']).items():
+            tasa, _, rafaga = valor.partition('/')
+            self.cuotas[nombre] = (float(tasa), int(rafaga or max(1, float(tasa))))
+
+        plazas = dict(CONCURRENCIA)
+        for nombre, valor in _leer_pares(app.config['LIMITADOR_CONCURRENCIA']).items():
+            plazas[nombre] = int(valor)
+        self._semaforos = {nombre: threading.BoundedSemaphore(n) for nombre, n in plazas.items()}
+
+        almacen = app.config['LIMITADOR_ALMACEN']
+        self.almacen = AlmacenMemoria() if almacen == 'memoria' else AlmacenSQLite(almacen)
+
+        if self.activo:
+            app.before_request(self._limitar_cliente)
+            app.after_request(self._cabeceras)
+
+    # ==================== CUBOS ====================
+
+    def _es_proxy(self, ip):
+        try:
+            direccion = ipaddress.ip_address(ip)
+        except ValueError:
+            return False
+        return any(direccion in red for red in self.proxies)
+
+    def _ip_cliente(self):
+        """IP del cliente: la última de X-Forwarded-For que no sea un proxy de
+        confianza. Sin proxies de confianza por medio, la de la conexión."""
+        ruta = [ip.strip() for ip in request.headers.get('X-Forwarded-For', '').split(',') if ip.strip()]
+        ruta.append(request.remote_addr)
+        while len(ruta) > 1 and self._es_proxy(ruta[-1]):
+            ruta.pop()
+        return ruta[-1]
+
+    def _cliente(self):
+        """(clave, rol) del cliente de la petición actual"""
+        try:
+            verify_jwt_in_request(optional=True)
+            identidad = get_jwt_identity()
+        except (JWTExtendedException, PyJWTError):
+            identidad = None
+        if identidad:
+            return f"usuario:{identidad['id_user']}", identidad.get('rol')
+        return f'ip:{self._ip_cliente()}', 'anonimo'
+
+    def _consumir(self, cubo, clave):
+        tasa, rafaga = self.cuotas[cubo]
+        permitido, tokens = self.almacen.consumir(f'{cubo}:{clave}', tasa, rafaga, time.time())
+
+        # Se recuerda el cubo más restrictivo para las cabeceras RateLimit-*
+        estado = g.get('limitador_estado')
+        if estado is None or tokens / rafaga < estado[1] / estado[0]:
+            g.limitador_estado = (rafaga, tokens)
+        if permitido:
+            return None
+        return self._demasiadas(math.ceil((1 - tokens) / tasa))
+
+    def _demasiadas(self, segundos):
+        response = jsonify({'error': 'Demasiadas peticiones. Inténtelo de nuevo más tarde'})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(max(1, segundos))
+        return response
+
+    def _limitar_cliente(self):
+        if request.method == 'OPTIONS' or request.endpoint in ('metrics', 'static'):
+            return None
+        clave, rol = self._cliente()
+        g.limitador_cliente = clave
+        g.limitador_rol = rol
+        return self._consumir(rol if rol in self.cuotas else 'anonimo', clave)
+
+    def _cabeceras(self, response):
+        estado = g.get('limitador_estado')
+        if estado:
+            rafaga, tokens = estado
+            response.headers['RateLimit-Limit'] = str(rafaga)
+            response.headers['RateLimit-Remaining'] = str(max(0, math.floor(tokens)))
+        return response
+
+    def limite(self, cubo, exentos=()):
+        """Decorador: consume además un token del cubo `cubo` del cliente,
+        salvo si su rol está en `exentos`"""
+        def decorador(f):
+            @wraps(f)
+            def envoltura(*args, **kwargs):
+                if self.activo and g.get('limitador_rol') not in exentos:
+                    rechazo = self._consumir(cubo, g.get('limitador_cliente') or f'ip:{self._ip_cliente()}')
+                    if rechazo is not None:
+                        return rechazo
+                return f(*args, **kwargs)
+            return envoltura
+        return decorador
+
+    # ==================== CONCURRENCIA ====================
+
+    def concurrente(self, nombre):
+        """Decorador: limita las peticiones simultáneas del endpoint a las plazas de `nombre`.
+
+        La plaza se libera al cerrar la respuesta, de modo que los listados
+        enviados por partes la ocupan hasta terminar de enviarse.
+        """
+        def decorador(f):
+            @wraps(f)
+            def envoltura(*args, **kwargs):
+                semaforo = self._semaforos.get(nombre)
+                if not self.activo or semaforo is None:
+                    return f(*args, **kwargs)
+                if not semaforo.acquire(timeout=self.espera):
+                    response = jsonify({'error': 'Servicio saturado. Inténtelo de nuevo en unos segundos'})
+                    response.status_code = 503
+                    response.headers['Retry-After'] = '1'
+                    return response
+                try:
+                    response = current_app.make_response(f(*args, **kwargs))
+                except BaseException:
+                    semaforo.release()
+                    raise
+                response.call_on_close(semaforo.release)
+                return response
+            return envoltura
+        return decorador
+
+
+limitador = Limitador()
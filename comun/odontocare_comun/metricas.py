@@ -0,0 +1,252 @@
+"""
+Métricas de la aplicación expuestas en /metrics con formato de texto de Prometheus.
+
+Se registran por endpoint la latencia de las peticiones, el número y tiempo
+de consultas SQL por petición y la latencia y errores de las llamadas a
+otros servicios. La agregación se hace en memoria bajo un lock; con varios
+workers (gunicorn) cada proceso vuelca periódicamente su estado a un fichero
+en METRICAS_DIR y /metrics suma los de todos los procesos.
+
+Cada proceso borra su fichero al terminar, y /metrics borra y descarta los
+de procesos que ya no existen (un worker reciclado o caído), así que el
+directorio debe ser local a la máquina. Al desaparecer un worker, sus
+contadores dejan de sumarse: Prometheus lo trata como un reinicio del
+contador.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_CONSULTAS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+# nombre -> (tipo, descripción, buckets)
+DEFINICIONES = {
+    'odontocare_http_peticiones_total': (
+        'counter', 'Peticiones HTTP atendidas por endpoint y código de estado', None),
+    'odontocare_http_peticion_segundos': (
+        'histogram', 'Duración de las peticiones HTTP por endpoint', BUCKETS_SEGUNDOS),
+    'odontocare_db_consultas_por_peticion': (
+        'histogram', 'Consultas SQL ejecutadas por petición', BUCKETS_CONSULTAS),
+    'odontocare_db_segundos_por_peticion': (
+        'histogram', 'Tiempo total en consultas SQL por petición', BUCKETS_SEGUNDOS),
+    'odontocare_llamada_saliente_segundos': (
+        'histogram', 'Duración de las llamadas HTTP a otros servicios', BUCKETS_SEGUNDOS),
+    'odontocare_llamada_saliente_errores_total': (
+        'counter', 'Llamadas a otros servicios fallidas (conexión o estado 5xx)', None),
+}
+
+
+class Metricas:
+    """Registro de métricas en proceso con exposición en formato Prometheus"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._valores = {nombre: {} for nombre in DEFINICIONES}
+        self._directorio = None
+        self._intervalo_volcado = 5.0
+        self._ultimo_volcado = 0.0
+
+    def init_app(self, app):
+        app.config.setdefault('METRICAS_DIR', os.environ.get('METRICAS_DIR'))
+        app.config.setdefault('METRICAS_INTERVALO_VOLCADO', float(os.environ.get('METRICAS_INTERVALO_VOLCADO', 5)))
+        self._directorio = app.config['METRICAS_DIR']
+        self._intervalo_volcado = app.config['METRICAS_INTERVALO_VOLCADO']
+        if self._directorio:
+            os.makedirs(self._directorio, exist_ok=True)
+            atexit.register(self._borrar_volcado)
+
+        app.before_request(self._inicio_peticion)
+        app.after_request(self._fin_peticion)
+        app.add_url_rule('/metrics', 'metrics', self._exponer)
+
+        with app.app_context():
+            for engine in app.extensions['sqlalchemy'].engines.values():
+                event.listen(engine, 'before_cursor_execute', self._inicio_consulta)
+                event.listen(engine, 'after_cursor_execute', self._fin_consulta)
+
+    # ==================== REGISTRO ====================
+
+    def incrementar(self, nombre, etiquetas, valor=1):
+        clave = tuple(sorted(etiquetas.items()))
+        with self._lock:
+            serie = self._valores[nombre]
+            serie[clave] = serie.get(clave, 0) + valor
+
+    def observar(self, nombre, etiquetas, valor):
+        buckets = DEFINICIONES[nombre][2]
+        clave = tuple(sorted(etiquetas.items()))
+        with self._lock:
+            serie = self._valores[nombre]
+            datos = serie.get(clave)
+            if datos is None:
+                # Conteos por bucket (no acumulados), +Inf, suma
+                datos = serie[clave] = [0] * (len(buckets) + 1) + [0.0]
+            for i, limite in enumerate(buckets):
+                if valor <= limite:
+                    datos[i] += 1
+                    break
+            else:
+                datos[len(buckets)] += 1
+            datos[-1] += valor
+
+    def observar_llamada(self, servicio, operacion, duracion, error=False):
+        """Registra una llamada saliente a otro servicio"""
+        etiquetas = {'servicio': servicio, 'operacion': operacion}
+        self.observar('odontocare_llamada_saliente_segundos', etiquetas, duracion)
+        if error:
+            self.incrementar('odontocare_llamada_saliente_errores_total', etiquetas)
+
+    # ==================== HOOKS ====================
+
+    def _inicio_peticion(self):
+        g.metricas_inicio = time.perf_counter()
+        g.metricas_consultas = 0
+        g.metricas_tiempo_db = 0.0
+
+    def _fin_peticion(self, response):
+        inicio = g.get('metricas_inicio')
+        if inicio is None or request.endpoint == 'metrics':
+            return response
+
+        endpoint = request.url_rule.rule if request.url_rule else 'desconocido'
+        etiquetas = {'metodo': request.method, 'endpoint': endpoint}
+        self.observar('odontocare_http_peticion_segundos', etiquetas, time.perf_counter() - inicio)
+        self.incrementar('odontocare_http_peticiones_total', {**etiquetas, 'estado': str(response.status_code)})
+        self.observar('odontocare_db_consultas_por_peticion', etiquetas, g.metricas_consultas)
+        self.observar('odontocare_db_segundos_por_peticion', etiquetas, g.metricas_tiempo_db)
+
+        if self._directorio and time.monotonic() - self._ultimo_volcado >= self._intervalo_volcado:
+            self._volcar()
+        return response
+
+    def _inicio_consulta(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metricas_inicio_consulta', []).append(time.perf_counter())
+
+    def _fin_consulta(self, conn, cursor, statement, parameters, context, executemany):
+        inicios = conn.info.get('metricas_inicio_consulta')
+        if not inicios:
+            return
+        duracion = time.perf_counter() - inicios.pop()
+        if has_request_context() and 'metricas_consultas' in g:
+            g.metricas_consultas += 1
+            g.metricas_tiempo_db += duracion
+
+    # ==================== MULTIPROCESO ====================
+
+    def _estado(self):
+        with self._lock:
+            return {
+                nombre: [[list(map(list, clave)), valor] for clave, valor in serie.items()]
+                for nombre, serie in self._valores.items()
+            }
+
+    def _ruta_proceso(self, pid=None):
+        return os.path.join(self._directorio, f'metricas_{pid or os.getpid()}.json')
+
+    def _volcar(self):
+        """Escribe el estado de este proceso de forma atómica"""
+        self._ultimo_volcado = time.monotonic()
+        ruta = self._ruta_proceso()
+        temporal = f'{ruta}.tmp'
+        with open(temporal, 'w', encoding='utf-8') as archivo:
+            json.dump(self._estado(), archivo)
+        os.replace(temporal, ruta)
+
+    def _borrar_volcado(self, pid=None):
+        for ruta in (self._ruta_proceso(pid), f'{self._ruta_proceso(pid)}.tmp'):
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _proceso_vivo(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def _estados_de_procesos(self):
+        estados = [self._estado()]
+        if not self._directorio:
+            return estados
+        propio = os.path.basename(self._ruta_proceso())
+        for nombre in os.listdir(self._directorio):
+            if nombre == propio or not nombre.startswith('metricas_') or not nombre.endswith('.json'):
+                continue
+            pid = nombre[len('metricas_'):-len('.json')]
+            if pid.isdigit() and not self._proceso_vivo(int(pid)):
+                # Worker terminado sin borrar su fichero (p. ej. tras un SIGKILL)
+                self._borrar_volcado(int(pid))
+                continue
+            try:
+                with open(os.path.join(self._directorio, nombre), encoding='utf-8') as archivo:
+                    estados.append(json.load(archivo))
+            except (OSError, ValueError):
+                continue
+        return estados
+
+    def _combinar(self, estados):
+        combinado = {nombre: {} for nombre in DEFINICIONES}
+        for estado in estados:
+            for nombre, serie in estado.items():
+                if nombre not in combinado:
+                    continue
+                for clave, valor in serie:
+                    clave = tuple(map(tuple, clave))
+                    actual = combinado[nombre].get(clave)
+                    if actual is None:
+                        combinado[nombre][clave] = list(valor) if isinstance(valor, list) else valor
+                    elif isinstance(valor, list):
+                        combinado[nombre][clave] = [a + b for a, b in zip(actual, valor)]
+                    else:
+                        combinado[nombre][clave] = actual + valor
+        return combinado
+
+    # ==================== EXPOSICIÓN ====================
+
+    def _exponer(self):
+        if self._directorio:
+            self._volcar()
+        return Response(self.texto_prometheus(), mimetype='text/plain; version=0.0.4')
+
+    def texto_prometheus(self):
+        """Serializa todas las métricas en formato de exposición de Prometheus"""
+        combinado = self._combinar(self._estados_de_procesos())
+        lineas = []
+        for nombre, (tipo, descripcion, buckets) in DEFINICIONES.items():
+            lineas.append(f'# HELP {nombre} {descripcion}')
+            lineas.append(f'# TYPE {nombre} {tipo}')
+            for clave, valor in sorted(combinado[nombre].items()):
+                if tipo == 'counter':
+                    lineas.append(f'{nombre}{_etiquetas(clave)} {valor}')
+                    continue
+                acumulado = 0
+                for limite, cuenta in zip(list(buckets) + ['+Inf'], valor[:-1]):
+                    acumulado += cuenta
+                    lineas.append(f'{nombre}_bucket{_etiquetas(clave, le=limite)} {acumulado}')
+                lineas.append(f'{nombre}_sum{_etiquetas(clave)} {valor[-1]}')
+                lineas.append(f'{nombre}_count{_etiquetas(clave)} {acumulado}')
+        return '\n'.join(lineas) + '\n'
+
+
+def _etiquetas(clave, le=None):
+    pares = list(clave)
+    if le is not None:
+        pares.append(('le', str(le)))
+    if not pares:
+        return ''
+    escapar = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{escapar(v)}"' for k, v in pares) + '}'
+
+
+metricas = Metricas()
@@ -0,0 +1,135 @@
+"""
+Migraciones versionadas del esquema de base de datos.
+
+Cada servicio tiene su paquete de migraciones (app/migraciones): módulos
+``vNNN_descripcion.py`` que definen una función ``upgrade(conn)`` o, si solo
+crean índices, una lista ``INDICES`` de ``Indice``. Las funciones de este
+módulo reciben ese paquete. Las versiones aplicadas se registran en la tabla
+``schema_migraciones`` y se ejecutan con ``python migrate.py``, de modo que
+los workers de la aplicación arrancan sin ejecutar DDL.
+"""
+
+import importlib
+import pkgutil
+import re
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import inspect, text
+
+TABLA_VERSIONES = 'schema_migraciones'
+_PATRON_MODULO = re.compile(r'^v(\d{3,})_\w+$')
+
+Indice = namedtuple('Indice', ['nombre', 'tabla', 'columnas', 'unico'], defaults=[False])
+
+
+def listar_migraciones(paquete):
+    """Retorna las migraciones del paquete como [(version, nombre_modulo)] ordenadas"""
+    migraciones = []
+    for modulo in pkgutil.iter_modules(paquete.__path__):
+        coincidencia = _PATRON_MODULO.match(modulo.name)
+        if coincidencia:
+            migraciones.append((int(coincidencia.group(1)), modulo.name))
+    return sorted(migraciones)
+
+
+def _crear_tabla_versiones(conn):
+    conn.execute(text(
+        f'CREATE TABLE IF NOT EXISTS {TABLA_VERSIONES} ('
+        'version INTEGER NOT NULL PRIMARY KEY, '
+        'nombre VARCHAR(120) NOT NULL, '
+        'aplicada_en TIMESTAMP NOT NULL)'
+    ))
+
+
+def versiones_aplicadas(engine):
+    """Retorna el conjunto de versiones ya aplicadas en la base de datos"""
+    with engine.begin() as conn:
+        _crear_tabla_versiones(conn)
+        filas = conn.execute(text(f'SELECT version FROM {TABLA_VERSIONES}'))
+        return {fila[0] for fila in filas}
+
+
+def migraciones_pendientes(engine, paquete):
+    """Retorna las migraciones del paquete que aún no se han aplicado"""
+    aplicadas = versiones_aplicadas(engine)
+    return [(v, nombre) for v, nombre in listar_migraciones(paquete) if v not in aplicadas]
+
+
+def _registrar_version(conn, version, nombre):
+    conn.execute(
+        text(f'INSERT INTO {TABLA_VERSIONES} (version, nombre, aplicada_en) '
+             'VALUES (:version, :nombre, :aplicada_en)'),
+        {'version': version, 'nombre': nombre, 'aplicada_en': datetime.utcnow()}
+    )
+
+
+def _sql_indice(indice, concurrente=False):
+    tipo = 'UNIQUE INDEX' if indice.unico else 'INDEX'
+    modo = ' CONCURRENTLY' if concurrente else ''
+    return (f'CREATE {tipo}{modo} IF NOT EXISTS {indice.nombre} '
+            f'ON {indice.tabla} ({", ".join(indice.columnas)})')
+
+
+def _aplicar_indices(engine, indices, version, nombre):
+    """Crea los índices de una migración y registra su versión.
+
+    En SQLite todo va en una transacción. En PostgreSQL cada índice se
+    construye con CREATE INDEX CONCURRENTLY, que no admite transacción, para
+    no bloquear las escrituras de la tabla; la versión se registra después, y
+    si algo falla se eliminan los índices que creó esta ejecución (también el
+    INVALID que deja una construcción concurrente fallida), de modo que no
+    queden índices sin su versión.
+    """
+    if engine.dialect.name != 'postgresql':
+        # La versión va primero: el driver sqlite3 no abre la transacción
+        # hasta la primera sentencia DML, y un CREATE INDEX previo se
+        # confirmaría aunque el registro fallara después
+        with engine.begin() as conn:
+            _registrar_version(conn, version, nombre)
+            for indice in indices:
+                conn.execute(text(_sql_indice(indice)))
+        return
+
+    inspector = inspect(engine)
+    existentes = {ix['name'] for tabla in {indice.tabla for indice in indices}
+                  for ix in inspector.get_indexes(tabla)}
+    creados = []
+    try:
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as auto:
+            for indice in indices:
+                if indice.nombre in existentes:
+                    continue
+                creados.append(indice.nombre)
+                auto.execute(text(_sql_indice(indice, concurrente=True)))
+        with engine.begin() as conn:
+            _registrar_version(conn, version, nombre)
+    except Exception:
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as auto:
+            for nombre_indice in creados:
+                auto.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {nombre_indice}'))
+        raise
+
+
+def aplicar_migraciones(engine, paquete, hasta=None):
+    """Aplica en orden las migraciones pendientes (opcionalmente hasta una versión).
+
+    Cada migración se ejecuta en su propia transacción junto con el registro
+    de su versión, salvo las de índices en PostgreSQL (ver _aplicar_indices).
+    Retorna la lista de módulos aplicados.
+    """
+    aplicadas = []
+    for version, nombre in migraciones_pendientes(engine, paquete):
+        if hasta is not None and version > hasta:
+            break
+        modulo = importlib.import_module(f'{paquete.__name__}.{nombre}')
+        indices = getattr(modulo, 'INDICES', None)
+        if indices is not None:
+            if hasattr(modulo, 'upgrade'):
+                raise ValueError(f'{nombre}: una migración con INDICES no puede definir upgrade()')
+            _aplicar_indices(engine, indices, version, nombre)
+        else:
+            with engine.begin() as conn:
+                modulo.upgrade(conn)
+                _registrar_version(conn, version, nombre)
+        aplicadas.append(nombre)
+    return aplicadas
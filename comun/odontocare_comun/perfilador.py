@@ -0,0 +1,201 @@
+"""
+Perfilador de SQL por petición y registro de consultas lentas.
+
+Se activa con PERFILADOR_ACTIVO. Cuando está activo:
+
+- Toda consulta que supere PERFILADOR_UMBRAL_MS se registra en el logger
+  'odontocare.sql_lento' junto con su plan de ejecución (EXPLAIN). Se
+  registra la sentencia con sus marcadores, nunca los valores de los
+  parámetros (contraseñas, datos de pacientes).
+- Una fracción de las peticiones (PERFILADOR_MUESTREO) se perfila entera:
+  se agrupan las consultas por sentencia y se avisa de posibles N+1 cuando
+  una misma sentencia se repite PERFILADOR_REPETICIONES_N1 veces o más.
+- Una petición de un admin con la cabecera "X-Perfil-SQL: 1" se perfila
+  siempre; la respuesta incluye un resumen en la cabecera X-Perfil-SQL y el
+  desglose completo queda disponible (solo admin) en GET /debug/perfil-sql/<id>.
+  Con PERFILADOR_CABECERA_PUBLICA la cabecera se acepta de cualquier cliente
+  (solo para desarrollo).
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from flask import g, has_request_context, jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt_identity, verify_jwt_in_request
+from sqlalchemy import event
+
+logger = logging.getLogger('odontocare.sql_lento')
+
+MAX_PERFILES = 200
+_MAX_SENTENCIA = 500
+
+
+def _activo_config(valor):
+    return str(valor).lower() in ('1', 'true', 'si', 'sí', 'yes')
+
+
+class Perfilador:
+    """Perfilado de consultas SQL basado en eventos de SQLAlchemy"""
+
+    def __init__(self):
+        self.umbral = 0.1
+        self.muestreo = 0.0
+        self.repeticiones_n1 = 5
+        self.cabecera_publica = False
+        self._perfiles = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def init_app(self, app):
+        app.config.setdefault('PERFILADOR_ACTIVO', _activo_config(os.environ.get('PERFILADOR_ACTIVO', '0')))
+        app.config.setdefault('PERFILADOR_UMBRAL_MS', float(os.environ.get('PERFILADOR_UMBRAL_MS', 100)))
+        app.config.setdefault('PERFILADOR_MUESTREO', float(os.environ.get('PERFILADOR_MUESTREO', 0.01)))
+        app.config.setdefault('PERFILADOR_REPETICIONES_N1', int(os.environ.get('PERFILADOR_REPETICIONES_N1', 5)))
+        app.config.setdefault('PERFILADOR_CABECERA_PUBLICA',
+                              _activo_config(os.environ.get('PERFILADOR_CABECERA_PUBLICA', '0')))
+        if not app.config['PERFILADOR_ACTIVO']:
+            return
+
+        self.umbral = app.config['PERFILADOR_UMBRAL_MS'] / 1000
+        self.muestreo = app.config['PERFILADOR_MUESTREO']
+        self.repeticiones_n1 = app.config['PERFILADOR_REPETICIONES_N1']
+        self.cabecera_publica = app.config['PERFILADOR_CABECERA_PUBLICA']
+
+        app.before_request(self._inicio_peticion)
+        app.after_request(self._fin_peticion)
+        app.add_url_rule('/debug/perfil-sql/<id_perfil>', 'perfil_sql', self._ver_perfil)
+
+        with app.app_context():
+            for engine in app.extensions['sqlalchemy'].engines.values():
+                event.listen(engine, 'before_cursor_execute', self._inicio_consulta)
+                event.listen(engine, 'after_cursor_execute', self._fin_consulta)
+
+    # ==================== PETICIONES ====================
+
+    def _es_admin(self):
+        try:
+            verify_jwt_in_request(optional=True)
+            identidad = get_jwt_identity()
+        except Exception:
+            return False
+        return bool(identidad) and identidad.get('rol') == 'admin'
+
+    def _inicio_peticion(self):
+        # El perfil forzado da tiempos y sentencias de la base de datos: no
+        # lo puede pedir cualquier cliente
+        forzado = request.headers.get('X-Perfil-SQL') == '1' and (self.cabecera_publica or self._es_admin())
+        if forzado or random.random() < self.muestreo:
+            g.perfil_sql = {'forzado': forzado, 'consultas': {}, 'lentas': []}
+
+    def _fin_peticion(self, response):
+        perfil = g.pop('perfil_sql', None)
+        if perfil is None:
+            return response
+
+        consultas = sorted(perfil['consultas'].values(), key=lambda c: c['tiempo_ms'], reverse=True)
+        endpoint = request.url_rule.rule if request.url_rule else request.path
+        n_mas_1 = [c['sentencia'] for c in consultas if c['veces'] >= self.repeticiones_n1]
+        for sentencia in n_mas_1:
+            logger.warning('Posible N+1 en %s %s: %s', request.method, endpoint, sentencia)
+
+        total = sum(c['veces'] for c in consultas)
+        tiempo_ms = round(sum(c['tiempo_ms'] for c in consultas), 3)
+        if perfil['forzado']:
+            id_perfil = uuid.uuid4().hex[:16]
+            with self._lock:
+                self._perfiles[id_perfil] = {
+                    'id': id_perfil,
+                    'metodo': request.method,
+                    'endpoint': endpoint,
+                    'total_consultas': total,
+                    'tiempo_total_ms': tiempo_ms,
+                    'consultas': consultas,
+                    'n_mas_1': n_mas_1,
+                    'lentas': perfil['lentas'],
+                }
+                while len(self._perfiles) > MAX_PERFILES:
+                    self._perfiles.popitem(last=False)
+            response.headers['X-Perfil-SQL'] = f'consultas={total}; tiempo_ms={tiempo_ms}; n_mas_1={len(n_mas_1)}'
+            response.headers['X-Perfil-SQL-Id'] = id_perfil
+        return response
+
+    @jwt_required()
+    def _ver_perfil(self, id_perfil):
+        """Desglose de consultas de una petición perfilada (solo admin)"""
+        if get_jwt_identity()['rol'] != 'admin':
+            return jsonify({'error': 'Acceso denegado. Se requiere rol admin'}), 403
+        with self._lock:
+            perfil = self._perfiles.get(id_perfil)
+        if not perfil:
+            return jsonify({'error': 'Perfil no encontrado'}), 404
+        return jsonify(perfil), 200
+
+    # ==================== CONSULTAS ====================
+
+    def _inicio_consulta(self, conn, cursor, statement, parameters, context, executemany):
+        if not getattr(self._local, 'explicando', False):
+            conn.info.setdefault('perfilador_inicio', []).append(time.perf_counter())
+
+    def _fin_consulta(self, conn, cursor, statement, parameters, context, executemany):
+        inicios = conn.info.get('perfilador_inicio')
+        if getattr(self._local, 'explicando', False) or not inicios:
+            return
+        duracion = time.perf_counter() - inicios.pop()
+
+        perfil = g.get('perfil_sql') if has_request_context() else None
+        if perfil is not None:
+            datos = perfil['consultas'].setdefault(statement, {
+                'sentencia': statement[:_MAX_SENTENCIA], 'veces': 0, 'tiempo_ms': 0.0, 'max_ms': 0.0
+            })
+            datos['veces'] += 1
+            datos['tiempo_ms'] = round(datos['tiempo_ms'] + duracion * 1000, 3)
+            datos['max_ms'] = max(datos['max_ms'], round(duracion * 1000, 3))
+
+        if duracion >= self.umbral:
+            plan = self._explicar(conn, statement, parameters, executemany)
+            logger.warning('Consulta lenta (%.1f ms): %s | plan=%s', duracion * 1000, statement, plan)
+            if perfil is not None:
+                perfil['lentas'].append({
+                    'sentencia': statement[:_MAX_SENTENCIA],
+                    'duracion_ms': round(duracion * 1000, 3),
+                    'plan': plan,
+                })
+
+    def _explicar(self, conn, statement, parameters, executemany):
+        """Obtiene el plan de ejecución de una SELECT con un cursor de la misma
+        conexión: no ocupa otra conexión del pool y ve la misma transacción"""
+        if executemany or not statement.lstrip().upper().startswith('SELECT'):
+            return None
+        prefijo = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN '
+        self._local.explicando = True
+        # Fuera de SQLite un EXPLAIN fallido abortaría la transacción de la
+        # petición: se aísla en un savepoint
+        savepoint = conn.dialect.name != 'sqlite' and conn.in_transaction()
+        cursor = None
+        try:
+            cursor = conn.connection.dbapi_connection.cursor()
+            if savepoint:
+                cursor.execute('SAVEPOINT perfilador_explain')
+            try:
+                cursor.execute(prefijo + statement, parameters)
+                plan = [' '.join(str(columna) for columna in fila) for fila in cursor.fetchall()]
+            except Exception:
+                if savepoint:
+                    cursor.execute('ROLLBACK TO SAVEPOINT perfilador_explain')
+                raise
+            if savepoint:
+                cursor.execute('RELEASE SAVEPOINT perfilador_explain')
+            return plan
+        except Exception as e:
+            return [f'EXPLAIN no disponible: {e}']
+        finally:
+            if cursor is not None:
+                cursor.close()
+            self._local.explicando = False
+
+
+perfilador = Perfilador()
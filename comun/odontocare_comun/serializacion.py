@@ -0,0 +1,139 @@
+"""
+Serialización rápida de los listados.
+
+listado_json() pide a la base de datos solo las columnas que expone to_dict()
+(tuplas, sin hidratar objetos ni pasar por el identity map), codifica las
+filas por bloques con orjson si está instalado y emite el array a medida que
+se codifica.
+
+El cuerpo resultante es idéntico byte a byte al de
+jsonify({'total': ..., clave: [m.to_dict() for m in ...]}), tanto en modo
+compacto como con la sangría que Flask usa en modo debug.
+"""
+
+import itertools
+import json
+import re
+from datetime import date, datetime
+from flask import Response, current_app, stream_with_context
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dependencia opcional
+    orjson = None
+
+FILAS_POR_BLOQUE = 500
+
+# json.dumps(ensure_ascii=True) escapa todo lo que no sea ASCII imprimible
+_NO_ASCII = re.compile('[^\x00-\x7e]')
+
+
+def _valor_json(valor):
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    raise TypeError(f'Tipo no serializable: {type(valor).__name__}')
+
+
+def _escapar(coincidencia):
+    codigo = ord(coincidencia.group())
+    if codigo > 0xFFFF:
+        codigo -= 0x10000
+        return '\\u{:04x}\\u{:04x}'.format(0xD800 | (codigo >> 10), 0xDC00 | (codigo & 0x3FF))
+    return '\\u{:04x}'.format(codigo)
+
+
+def _codificador(indentado):
+    """Función que convierte una lista de dicts en el texto de sus elementos,
+    separados y con la sangría que tendrían dentro de la respuesta de jsonify"""
+    if orjson is not None:
+        # orjson escribe datetime/date igual que isoformat()
+        opciones = orjson.OPT_INDENT_2 if indentado else 0
+
+        def volcar(filas):
+            texto = orjson.dumps(filas, option=opciones).decode()
+            if texto.isascii() and '\x7f' not in texto:
+                return texto
+            return _NO_ASCII.sub(_escapar, texto)
+    else:
+        argumentos = {'indent': 2} if indentado else {'separators': (',', ':')}
+
+        def volcar(filas):
+            return json.dumps(filas, default=_valor_json, **argumentos)
+
+    if indentado:
+        # "[\n  {...},\n  {...}\n]" -> elementos con la sangría de un nivel más
+        return lambda filas: volcar(filas)[4:-2].replace('\n', '\n  ')
+    return lambda filas: volcar(filas)[1:-1]
+
+
+def _indentado():
+    """Replica la decisión de DefaultJSONProvider entre salida compacta o con sangría"""
+    compacto = current_app.json.compact
+    return compacto is False or (compacto is None and current_app.debug)
+
+
+def listado_json(clave, consulta, modelo, *otras):
+    """Respuesta {clave: [...], 'total': N} para una consulta ORM de `modelo`.
+
+    `modelo.CAMPOS_LISTADO` enumera las columnas (mismas claves que to_dict).
+    `otras` son pares (consulta, modelo) con los mismos campos cuyas filas
+    se añaden a continuación (p. ej. una tabla de archivo). Las consultas
+    se ejecutan antes de devolver la respuesta; las filas se leen y
+    codifican a medida que se envía el cuerpo.
+    """
+    campos = sorted(modelo.CAMPOS_LISTADO)
+    filas = itertools.chain.from_iterable([
+        iter(c.with_entities(*[getattr(m, campo) for campo in campos]).yield_per(FILAS_POR_BLOQUE))
+        for c, m in [(consulta, modelo), *otras]
+    ])
+    return listado_filas(clave, campos, filas)
+
+
+def listado_filas(clave, campos, filas):
+    """Como listado_json() para filas ya leídas: tuplas con los valores de
+    `campos` en ese orden (p. ej. las de varias bases de datos mezcladas)"""
+    indentado = _indentado()
+    codificar = _codificador(indentado)
+    if indentado:
+        abrir, separador_miembros, cerrar = '{\n  ', ',\n  ', '\n}\n'
+        separador_filas, fin_filas, dos_puntos = ',\n    ', '\n  ', ': '
+    else:
+        abrir, separador_miembros, cerrar = '{', ',', '}\n'
+        separador_filas, fin_filas, dos_puntos = ',', '', ':'
+
+    estado = {'total': 0}
+
+    def bloques():
+        bloque = []
+        for fila in filas:
+            bloque.append(dict(zip(campos, fila)))
+            if len(bloque) == FILAS_POR_BLOQUE:
+                yield bloque
+                bloque = []
+        if bloque:
+            yield bloque
+
+    def lista():
+        yield f'{json.dumps(clave)}{dos_puntos}['
+        for bloque in bloques():
+            inicio = separador_filas if estado['total'] else separador_filas.lstrip(',')
+            estado['total'] += len(bloque)
+            yield inicio + codificar(bloque)
+        yield (fin_filas if estado['total'] else '') + ']'
+
+    def total():
+        return f'"total"{dos_puntos}{estado["total"]}'
+
+    def cuerpo():
+        if clave < 'total':
+            yield abrir
+            yield from lista()
+            yield separador_miembros + total() + cerrar
+        else:
+            # Con sort_keys "total" va antes que la lista: hay que contar primero
+            partes = list(lista())
+            yield abrir + total() + separador_miembros
+            yield from partes
+            yield cerrar
+
+    return Response(stream_with_context(cuerpo()), mimetype=current_app.json.mimetype)
@@ -0,0 +1,298 @@
+"""
+Trazas distribuidas con propagación de contexto W3C (cabecera traceparent).
+
+Cada petición entrante abre un span de servidor que continúa la traza del
+llamante si trae traceparent. Dentro de la petición se pueden abrir spans
+hijos (consultas SQL, hash de contraseñas, llamadas salientes) y
+cabeceras() devuelve el traceparent a propagar en las peticiones salientes.
+Las consultas SQL se trazan si la aplicación usa Flask-SQLAlchemy (los
+servicios); las aplicaciones web, sin base de datos, solo trazan peticiones.
+
+Configuración (variables de entorno):
+    TRAZAS_DESTINO   ruta de un fichero JSONL o URL OTLP/HTTP (p. ej.
+                     http://localhost:4318/v1/traces). Sin destino no se traza.
+    TRAZAS_MUESTREO  proporción de trazas nuevas que se registran (0.0-1.0).
+                     Las trazas que llegan muestreadas se registran siempre.
+    TRAZAS_SERVICIO  nombre del servicio en los spans exportados.
+"""
+
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+import requests
+from flask import g, has_request_context, request
+
+_PATRON_TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+_MAX_SENTENCIA = 300
+
+
+def _nuevo_id(bits):
+    return f'{random.getrandbits(bits):0{bits // 4}x}'
+
+
+class ExportadorArchivo:
+    """Escribe los spans como líneas JSON en un fichero local"""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+
+    def exportar(self, servicio, spans):
+        lineas = ''.join(json.dumps({'servicio': servicio, **span}, ensure_ascii=False) + '\n' for span in spans)
+        with self._lock, open(self.ruta, 'a', encoding='utf-8') as archivo:
+            archivo.write(lineas)
+
+
+class ExportadorOTLP:
+    """Envía los spans en lotes a un colector OTLP/HTTP (JSON) desde un hilo aparte"""
+
+    def __init__(self, url, tamano_lote=200, intervalo=2.0):
+        self.url = url
+        self.tamano_lote = tamano_lote
+        self.intervalo = intervalo
+        self._cola = queue.Queue(maxsize=10000)
+        threading.Thread(target=self._bucle, name='exportador-trazas', daemon=True).start()
+
+    def exportar(self, servicio, spans):
+        for span in spans:
+            try:
+                self._cola.put_nowait((servicio, span))
+            except queue.Full:
+                # Nunca se bloquea una petición por la exportación de trazas
+                return
+
+    def _bucle(self):
+        while True:
+            lote = [self._cola.get()]
+            limite = time.monotonic() + self.intervalo
+            while len(lote) < self.tamano_lote and time.monotonic() < limite:
+                try:
+                    lote.append(self._cola.get(timeout=max(0.0, limite - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                requests.post(self.url, json=_a_otlp(lote), timeout=5)
+            except requests.RequestException:
+                pass
+
+
+def _a_otlp(lote):
+    """Convierte spans internos al formato JSON de OTLP"""
+    por_servicio = {}
+    for servicio, span in lote:
+        por_servicio.setdefault(servicio, []).append({
+            'traceId': span['trace_id'],
+            'spanId': span['span_id'],
+            'parentSpanId': span['parent_span_id'] or '',
+            'name': span['nombre'],
+            'kind': {'servidor': 2, 'cliente': 3}.get(span['tipo'], 1),
+            'startTimeUnixNano': str(span['inicio_ns']),
+            'endTimeUnixNano': str(span['fin_ns']),
+            'attributes': [
+                {'key': clave, 'value': {'stringValue': str(valor)}}
+                for clave, valor in span['atributos'].items()
+            ],
+            'status': {'code': 2 if span['error'] else 1},
+        })
+    return {'resourceSpans': [
+        {
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': servicio}}]},
+            'scopeSpans': [{'scope': {'name': 'odontocare'}, 'spans': spans}],
+        }
+        for servicio, spans in por_servicio.items()
+    ]}
+
+
+class Trazador:
+    """Gestión del contexto de traza de cada petición y exportación de spans"""
+
+    def __init__(self):
+        self.servicio = None
+        self.muestreo = 0.0
+        self.exportador = None
+
+    def init_app(self, app):
+        app.config.setdefault('TRAZAS_DESTINO', os.environ.get('TRAZAS_DESTINO'))
+        app.config.setdefault('TRAZAS_MUESTREO', float(os.environ.get('TRAZAS_MUESTREO', 0.01)))
+        app.config.setdefault('TRAZAS_SERVICIO', os.environ.get('TRAZAS_SERVICIO', app.import_name))
+        self.servicio = app.config['TRAZAS_SERVICIO']
+        self.muestreo = app.config['TRAZAS_MUESTREO']
+
+        destino = app.config['TRAZAS_DESTINO']
+        if destino:
+            if destino.startswith(('http://', 'https://')):
+                self.exportador = ExportadorOTLP(destino)
+            else:
+                self.exportador = ExportadorArchivo(destino)
+
+        app.before_request(self._inicio_peticion)
+        app.after_request(self._fin_peticion)
+        app.teardown_request(self._exportar_peticion)
+
+        if 'sqlalchemy' not in app.extensions:
+            return
+        from sqlalchemy import event
+
+        with app.app_context():
+            for engine in app.extensions['sqlalchemy'].engines.values():
+                event.listen(engine, 'before_cursor_execute', self._inicio_consulta)
+                event.listen(engine, 'after_cursor_execute', self._fin_consulta)
+                event.listen(engine, 'handle_error', self._error_consulta)
+
+    # ==================== CONTEXTO ====================
+
+    def _contexto(self):
+        if not has_request_context():
+            return None
+        return g.get('traza')
+
+    def activo(self):
+        """Indica si la petición actual se está registrando"""
+        contexto = self._contexto()
+        return bool(contexto and contexto['registrar'])
+
+    def cabeceras(self, span=None):
+        """Cabecera traceparent a propagar en una petición saliente (hija de `span` si se indica)"""
+        contexto = self._contexto()
+        if not contexto:
+            return {}
+        flags = '01' if contexto['muestreada'] else '00'
+        padre = span['span_id'] if span else contexto['pila'][-1]
+        return {'traceparent': f"00-{contexto['trace_id']}-{padre}-{flags}"}
+
+    def _abrir(self, nombre, tipo, atributos):
+        contexto = self._contexto()
+        span = {
+            'trace_id': contexto['trace_id'],
+            'span_id': _nuevo_id(64),
+            'parent_span_id': contexto['pila'][-1] if contexto['pila'] else contexto['padre_remoto'],
+            'nombre': nombre,
+            'tipo': tipo,
+            'inicio_ns': time.time_ns(),
+            'fin_ns': None,
+            'atributos': dict(atributos),
+            'error': False,
+        }
+        contexto['pila'].append(span['span_id'])
+        return span
+
+    def _cerrar(self, span):
+        contexto = self._contexto()
+        span['fin_ns'] = time.time_ns()
+        if contexto['pila'] and contexto['pila'][-1] == span['span_id']:
+            contexto['pila'].pop()
+        contexto['spans'].append(span)
+
+    @contextmanager
+    def span(self, nombre, tipo='interno', **atributos):
+        """Abre un span hijo del span actual; no hace nada si la traza no se registra"""
+        if not self.activo():
+            yield None
+            return
+        span = self._abrir(nombre, tipo, atributos)
+        try:
+            yield span
+        except Exception as e:
+            span['error'] = True
+            span['atributos']['error'] = type(e).__name__
+            raise
+        finally:
+            self._cerrar(span)
+
+    def iniciar_span(self, nombre, tipo='interno', **atributos):
+        """Abre un span hijo sin convertirlo en el actual, para operaciones que
+        se solapan (peticiones simultáneas); se cierra con terminar_span()"""
+        if not self.activo():
+            return None
+        span = self._abrir(nombre, tipo, atributos)
+        self._contexto()['pila'].pop()
+        return span
+
+    def terminar_span(self, span, error=False):
+        if span is None:
+            return
+        span['error'] = span['error'] or error
+        self._cerrar(span)
+
+    # ==================== HOOKS DE PETICIÓN ====================
+
+    def _inicio_peticion(self):
+        padre = _PATRON_TRACEPARENT.match(request.headers.get('traceparent', ''))
+        if padre:
+            trace_id, padre_remoto, flags = padre.groups()
+            muestreada = bool(int(flags, 16) & 1)
+        elif self.exportador is None:
+            return
+        else:
+            trace_id, padre_remoto = _nuevo_id(128), None
+            muestreada = random.random() < self.muestreo
+
+        g.traza = {
+            'trace_id': trace_id,
+            'padre_remoto': padre_remoto,
+            'muestreada': muestreada,
+            'registrar': muestreada and self.exportador is not None,
+            'pila': [],
+            'spans': [],
+        }
+        if g.traza['registrar']:
+            g.traza_raiz = self._abrir(f'{request.method} {request.path}', 'servidor', {
+                'http.method': request.method,
+                'http.target': request.full_path.rstrip('?'),
+            })
+        else:
+            # Sin registrar se sigue propagando el contexto para que la
+            # decisión de muestreo sea la misma en los servicios siguientes
+            g.traza['pila'].append(padre_remoto or _nuevo_id(64))
+
+    def _fin_peticion(self, response):
+        raiz = g.get('traza_raiz')
+        if raiz:
+            if request.url_rule:
+                raiz['nombre'] = f'{request.method} {request.url_rule.rule}'
+            raiz['atributos']['http.status_code'] = response.status_code
+            raiz['error'] = response.status_code >= 500
+        return response
+
+    def _exportar_peticion(self, exc):
+        raiz = g.pop('traza_raiz', None)
+        if not raiz:
+            return
+        if exc is not None:
+            raiz['error'] = True
+        self._cerrar(raiz)
+        spans = g.traza['spans']
+        try:
+            self.exportador.exportar(self.servicio, spans)
+        except OSError:
+            pass
+
+    # ==================== SQL ====================
+
+    def _inicio_consulta(self, conn, cursor, statement, parameters, context, executemany):
+        if self.activo():
+            conn.info.setdefault('trazas_spans', []).append(self._abrir('db.consulta', 'cliente', {
+                'db.system': conn.dialect.name,
+                'db.statement': statement[:_MAX_SENTENCIA],
+            }))
+
+    def _fin_consulta(self, conn, cursor, statement, parameters, context, executemany):
+        spans = conn.info.get('trazas_spans')
+        if spans and self.activo():
+            self._cerrar(spans.pop())
+
+    def _error_consulta(self, contexto_excepcion):
+        conn = contexto_excepcion.connection
+        spans = conn.info.get('trazas_spans') if conn is not None else None
+        if spans and self.activo():
+            span = spans.pop()
+            span['error'] = True
+            self._cerrar(span)
+
+
+trazador = Trazador()
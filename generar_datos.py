@@ -0,0 +1,308 @@
+"""
+Generador de datos sintéticos a escala de producción para OdontoCare.
+
+Produce los CSV de usuarios, doctores, pacientes y centros con el mismo
+formato que los de datos/, más un histórico de citas (citas.csv) con
+distribuciones realistas: especialidades, centros con demanda desigual,
+horas punta, fines de semana sin consulta y tasa de cancelación.
+
+La salida se escribe fila a fila (sin cargar nada en memoria salvo doctores
+y centros), por lo que admite millones de registros. Con la misma semilla
+los ficheros generados son idénticos. Los identificadores de citas.csv
+corresponden al orden de las filas, tal como los asigna una carga sobre
+bases de datos vacías (carga_inicial.py o benchmarks/bench_servicios.py).
+
+Uso:
+    python generar_datos.py --salida datos_generados --pacientes 1000000 --citas 5000000
+"""
+
+import argparse
+import csv
+import math
+import os
+import random
+from datetime import datetime, timedelta
+
+ESPECIALIDADES = [
+    ('Odontología General', 45),
+    ('Ortodoncia', 20),
+    ('Endodoncia', 12),
+    ('Periodoncia', 10),
+    ('Implantología', 8),
+    ('Odontopediatría', 5),
+]
+
+MOTIVOS = {
+    'Odontología General': ['Revisión dental', 'Limpieza dental', 'Empaste', 'Dolor de muelas'],
+    'Ortodoncia': ['Ajuste de brackets', 'Estudio de ortodoncia', 'Revisión de retenedor'],
+    'Endodoncia': ['Tratamiento de conducto', 'Revisión de endodoncia'],
+    'Periodoncia': ['Curetaje', 'Revisión de encías'],
+    'Implantología': ['Colocación de implante', 'Revisión de implante'],
+    'Odontopediatría': ['Revisión infantil', 'Sellado de fisuras'],
+}
+
+NOMBRES = [
+    'Juan', 'María', 'Pedro', 'Ana', 'Carlos', 'Laura', 'Antonio', 'Lucía', 'José', 'Carmen',
+    'Javier', 'Elena', 'Manuel', 'Isabel', 'David', 'Marta', 'Francisco', 'Sara', 'Luis', 'Paula',
+]
+APELLIDOS = [
+    'García', 'Fernández', 'González', 'Rodríguez', 'López', 'Martínez', 'Sánchez', 'Pérez',
+    'Gómez', 'Martín', 'Jiménez', 'Ruiz', 'Hernández', 'Díaz', 'Moreno', 'Álvarez', 'Romero',
+    'Torres', 'Navarro', 'Domínguez',
+]
+CALLES = ['Calle Mayor', 'Avenida de la Paz', 'Plaza España', 'Calle Alcalá', 'Gran Vía', 'Paseo del Prado']
+CIUDADES = ['Madrid', 'Barcelona', 'Valencia', 'Sevilla', 'Zaragoza', 'Málaga', 'Bilbao', 'Murcia']
+
+# Franjas de 30 minutos entre las 8:00 y las 20:00, con picos a media
+# mañana y a última hora de la tarde
+FRANJAS = [(h, m) for h in range(8, 20) for m in (0, 30)]
+PESO_HORA = {8: 3, 9: 6, 10: 9, 11: 10, 12: 8, 13: 4, 14: 1, 15: 3, 16: 6, 17: 9, 18: 10, 19: 6}
+PESOS_FRANJA = [PESO_HORA[h] for h, _ in FRANJAS]
+
+# Actividad relativa por día de la semana (lunes a domingo)
+PESO_DIA_SEMANA = [1.0, 1.0, 1.0, 1.0, 0.9, 0.3, 0.0]
+
+CAMPOS = {
+    'usuarios': ['nombre_usuario', 'password', 'rol'],
+    'centros': ['nombre', 'direccion'],
+    'doctores': ['nombre', 'especialidad', 'nombre_usuario', 'password'],
+    'pacientes': ['nombre', 'telefono', 'estado', 'nombre_usuario', 'password'],
+    'citas': ['fecha', 'motivo', 'estado', 'id_paciente', 'id_doctor', 'id_centro', 'id_user_registrado'],
+}
+
+
+def rng_para(semilla, tabla):
+    """Generador aleatorio independiente por tabla, para que cambiar el
+    tamaño de una tabla no altere el contenido de las demás"""
+    return random.Random(f'{semilla}-{tabla}')
+
+
+def nombre_completo(rng):
+    return f'{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)} {rng.choice(APELLIDOS)}'
+
+
+def pesos_centros(n_centros, sesgo=1.1):
+    """Demanda relativa de cada centro siguiendo una ley de Zipf"""
+    return [1 / (rango ** sesgo) for rango in range(1, n_centros + 1)]
+
+
+# ==================== TABLAS DE REFERENCIA ====================
+
+def generar_usuarios(n_secretarias):
+    """Usuario admin más las cuentas de secretaría"""
+    yield {'nombre_usuario': 'admin', 'password': 'admin123', 'rol': 'admin'}
+    for i in range(1, n_secretarias + 1):
+        yield {'nombre_usuario': f'secretaria{i}', 'password': f'secre{i:03d}', 'rol': 'secretaria'}
+
+
+def generar_centros(semilla, n_centros):
+    rng = rng_para(semilla, 'centros')
+    for i in range(1, n_centros + 1):
+        ciudad = CIUDADES[(i - 1) % len(CIUDADES)]
+        yield {
+            'nombre': f'Clínica Dental OdontoCare {ciudad} {i}',
+            'direccion': f'{rng.choice(CALLES)} {rng.randint(1, 200)} - {ciudad}',
+        }
+
+
+def generar_doctores(semilla, n_doctores):
+    rng = rng_para(semilla, 'doctores')
+    especialidades, pesos = zip(*ESPECIALIDADES)
+    for i in range(1, n_doctores + 1):
+        yield {
+            'nombre': f'Dr. {nombre_completo(rng)}',
+            'especialidad': rng.choices(especialidades, pesos)[0],
+            'nombre_usuario': f'dr.{i}',
+            'password': f'doc{i:05d}',
+        }
+
+
+def generar_pacientes(semilla, n_pacientes, proporcion_con_usuario=0.01, proporcion_inactivos=0.05):
+    """Pacientes; solo una fracción tiene cuenta de acceso para no pagar el
+    hash de contraseña por cada fila durante la carga"""
+    rng = rng_para(semilla, 'pacientes')
+    for i in range(1, n_pacientes + 1):
+        con_usuario = rng.random() < proporcion_con_usuario
+        yield {
+            'nombre': nombre_completo(rng),
+            'telefono': f'{6 + i // 100000000 % 2}{i % 100000000:08d}',
+            'estado': 'INACTIVO' if rng.random() < proporcion_inactivos else 'ACTIVO',
+            'nombre_usuario': f'paciente.{i}' if con_usuario else '',
+            'password': f'pac{i:07d}' if con_usuario else '',
+        }
+
+
+def pacientes_activos(semilla, n_pacientes):
+    """id_paciente de los pacientes ACTIVO (los que pueden pedir cita),
+    en el orden de carga de generar_pacientes()"""
+    return [i for i, paciente in enumerate(generar_pacientes(semilla, n_pacientes), start=1)
+            if paciente['estado'] == 'ACTIVO']
+
+
+def asignar_centros(semilla, n_doctores, n_centros):
+    """Centro de trabajo de cada doctor: los centros con más demanda tienen más doctores"""
+    rng = rng_para(semilla, 'asignacion')
+    pesos = pesos_centros(n_centros)
+    return rng.choices(range(1, n_centros + 1), pesos, k=n_doctores)
+
+
+# ==================== HISTÓRICO DE CITAS ====================
+
+def _franjas_del_dia(rng, k):
+    """Elige k franjas distintas ponderadas por hora punta (Efraimidis-Spirakis)"""
+    claves = sorted(
+        ((rng.random() ** (1 / peso), franja) for franja, peso in zip(FRANJAS, PESOS_FRANJA)),
+        reverse=True
+    )
+    return sorted(franja for _, franja in claves[:k])
+
+
+def _poisson(rng, media):
+    """Muestra de una distribución de Poisson (método de Knuth, medias pequeñas)"""
+    if media > 30:
+        return max(0, int(round(rng.gauss(media, math.sqrt(media)))))
+    limite, k, p = math.exp(-media), 0, 1.0
+    while True:
+        p *= rng.random()
+        if p <= limite:
+            return k
+        k += 1
+
+
+def generar_citas(semilla, n_citas, especialidades_doctor, centros_doctor, ids_pacientes,
+                  ids_registradores=(1,), hoy=None, dias_historia=730, dias_futuro=60,
+                  tasa_cancelacion=0.12):
+    """Histórico de citas ordenado por día.
+
+    Recorre día a día la agenda de cada doctor eligiendo franjas sin
+    solapamiento, por lo que nunca genera dobles reservas. Las citas pasadas
+    quedan COMPLETADA o CANCELADA y las futuras PROGRAMADA o CANCELADA.
+    Los pacientes se eligen de `ids_pacientes` (ver pacientes_activos(): el
+    servicio de citas rechaza las de pacientes inactivos).
+    """
+    rng = rng_para(semilla, 'citas')
+    hoy = hoy or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    inicio = hoy - timedelta(days=dias_historia)
+    n_doctores = len(especialidades_doctor)
+
+    # La demanda de cada centro ya se refleja en cuántos doctores tiene;
+    # cada doctor añade solo una variación individual de agenda
+    carga = [rng.uniform(0.7, 1.3) for _ in range(n_doctores)]
+    carga_media = sum(carga) / n_doctores
+    dias_laborables = sum(
+        PESO_DIA_SEMANA[(inicio + timedelta(days=d)).weekday()]
+        for d in range(dias_historia + dias_futuro)
+    )
+    # Ligero exceso sobre la media para alcanzar n_citas antes de agotar el periodo
+    media_base = 1.05 * n_citas / max(1.0, dias_laborables * n_doctores)
+
+    generadas = 0
+    for d in range(dias_historia + dias_futuro):
+        dia = inicio + timedelta(days=d)
+        factor_dia = PESO_DIA_SEMANA[dia.weekday()]
+        if not factor_dia:
+            continue
+        for i in range(n_doctores):
+            media = media_base * factor_dia * carga[i] / carga_media
+            k = min(len(FRANJAS), _poisson(rng, media))
+            if not k:
+                continue
+            for hora, minuto in _franjas_del_dia(rng, k):
+                fecha = dia.replace(hour=hora, minute=minuto)
+                if rng.random() < tasa_cancelacion:
+                    estado = 'CANCELADA'
+                else:
+                    estado = 'COMPLETADA' if fecha < hoy else 'PROGRAMADA'
+                yield {
+                    'fecha': fecha.isoformat(),
+                    'motivo': rng.choice(MOTIVOS[especialidades_doctor[i]]),
+                    'estado': estado,
+                    'id_paciente': rng.choice(ids_pacientes),
+                    'id_doctor': i + 1,
+                    'id_centro': centros_doctor[i],
+                    'id_user_registrado': rng.choice(ids_registradores),
+                }
+                generadas += 1
+                if generadas >= n_citas:
+                    return
+
+
+# ==================== ESCRITURA ====================
+
+def escribir_csv(ruta, campos, filas):
+    """Escribe las filas en streaming y retorna cuántas se escribieron"""
+    total = 0
+    with open(ruta, 'w', encoding='utf-8', newline='') as archivo:
+        writer = csv.DictWriter(archivo, fieldnames=campos)
+        writer.writeheader()
+        for fila in filas:
+            writer.writerow(fila)
+            total += 1
+    return total
+
+
+def generar(directorio, semilla=42, centros=20, doctores=None, pacientes=10000, citas=50000,
+            secretarias=None, proporcion_con_usuario=0.01, tasa_cancelacion=0.12, hoy=None):
+    """Genera todos los CSV en el directorio y retorna el número de filas por tabla"""
+    doctores = doctores or max(1, pacientes // 200)
+    secretarias = secretarias or centros * 2
+    os.makedirs(directorio, exist_ok=True)
+    ruta = lambda tabla: os.path.join(directorio, f'{tabla}.csv')
+
+    totales = {
+        'usuarios': escribir_csv(ruta('usuarios'), CAMPOS['usuarios'], generar_usuarios(secretarias)),
+        'centros': escribir_csv(ruta('centros'), CAMPOS['centros'], generar_centros(semilla, centros)),
+    }
+
+    especialidades = []
+
+    def doctores_con_registro():
+        for doctor in generar_doctores(semilla, doctores):
+            especialidades.append(doctor['especialidad'])
+            yield doctor
+
+    totales['doctores'] = escribir_csv(ruta('doctores'), CAMPOS['doctores'], doctores_con_registro())
+    totales['pacientes'] = escribir_csv(
+        ruta('pacientes'), CAMPOS['pacientes'],
+        generar_pacientes(semilla, pacientes, proporcion_con_usuario)
+    )
+
+    # admin es id_user 1 y las secretarías se cargan a continuación
+    registradores = tuple(range(2, secretarias + 2))
+    totales['citas'] = escribir_csv(ruta('citas'), CAMPOS['citas'], generar_citas(
+        semilla, citas, especialidades, asignar_centros(semilla, doctores, centros),
+        pacientes_activos(semilla, pacientes),
+        ids_registradores=registradores, hoy=hoy, tasa_cancelacion=tasa_cancelacion
+    ))
+    return totales
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generador de datos sintéticos de OdontoCare')
+    parser.add_argument('--salida', default='datos_generados', help='Directorio de salida')
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--centros', type=int, default=20)
+    parser.add_argument('--doctores', type=int, default=None, help='Por defecto, pacientes / 200')
+    parser.add_argument('--pacientes', type=int, default=10000)
+    parser.add_argument('--citas', type=int, default=50000)
+    parser.add_argument('--secretarias', type=int, default=None, help='Por defecto, 2 por centro')
+    parser.add_argument('--con-usuario', type=float, default=0.01,
+                        help='Proporción de pacientes con cuenta de acceso')
+    parser.add_argument('--cancelacion', type=float, default=0.12, help='Tasa de cancelación')
+    parser.add_argument('--hoy', type=datetime.fromisoformat, default=None,
+                        help='Fecha de referencia (YYYY-MM-DD) para resultados reproducibles entre días')
+    args = parser.parse_args()
+
+    totales = generar(
+        args.salida, semilla=args.semilla, centros=args.centros, doctores=args.doctores,
+        pacientes=args.pacientes, citas=args.citas, secretarias=args.secretarias,
+        proporcion_con_usuario=args.con_usuario, tasa_cancelacion=args.cancelacion, hoy=args.hoy
+    )
+    for tabla, total in totales.items():
+        print(f"  [OK] {tabla}.csv: {total} filas")
+    if totales['citas'] < args.citas:
+        print(f"  [AVISO] Solo caben {totales['citas']} citas en el periodo; aumente --doctores")
+
+
+if __name__ == '__main__':
+    main()
@@ -17,18 +17,37 @@ def create_app():
     
     # URL del servicio de usuarios (para comunicación entre microservicios)
     app.config['SERVICIO_USUARIOS_URL'] = os.environ.get('SERVICIO_USUARIOS_URL', 'http://localhost:5000')
+    # Segundos que se guarda en memoria el paciente/doctor asociado a cada usuario
+    app.config['PERFIL_CACHE_TTL'] = int(os.environ.get('PERFIL_CACHE_TTL', 300))
     
-    # Inicializar extensiones
+    # Inicializar extensiones (los shards de citas se registran como binds antes que db)
+    from app.shards import shards
+    shards.init_app(app)
     db.init_app(app)
     jwt.init_app(app)
     
+    from odontocare_comun.metricas import metricas
+    from odontocare_comun.trazas import trazador
+    from odontocare_comun.perfilador import perfilador
+    from odontocare_comun.compresion import compresion
+    from odontocare_comun.limitador import limitador
+    from odontocare_comun.idempotencia import idempotencia
+    from app.tareas import tareas
+    from app.recordatorios import recordatorios
+    metricas.init_app(app)
+    trazador.init_app(app)
+    perfilador.init_app(app)
+    compresion.init_app(app)
+    limitador.init_app(app)
+    idempotencia.init_app(app)
+    recordatorios.init_app(app)
+    tareas.init_app(app)
+    
     # Registrar blueprints
     from app.blueprints.citas import citas_bp
     
     app.register_blueprint(citas_bp, url_prefix='/citas')
     
-    # Crear tablas
-    with app.app_context():
-        db.create_all()
+    # El esquema se gestiona con migraciones versionadas (python migrate.py)
     
     return app
@@ -0,0 +1,70 @@
+"""
+Archivo de citas antiguas (particionado caliente/frío).
+
+Las citas COMPLETADA o CANCELADA con fecha anterior al horizonte
+(ARCHIVO_HORIZONTE_DIAS, 365 por defecto) se mueven por lotes de la tabla
+citas a citas_archivo con `python archivar.py`. Así la tabla citas y sus
+índices crecen con las citas vigentes y no con el histórico.
+
+Los listados añaden el archivo solo cuando el rango de fechas pedido llega
+a la fecha más reciente archivada, y la consulta de una cita por id lo usa
+si la cita no está en citas.
+"""
+
+from datetime import datetime, timedelta
+from sqlalchemy import bindparam, func, text
+from app import db
+from app.models import CitaArchivada
+
+ESTADOS_ARCHIVABLES = ('COMPLETADA', 'CANCELADA')
+
+_COLUMNAS = 'id_cita, fecha, motivo, estado, id_paciente, id_doctor, id_centro, id_user_registrado, created_at'
+_ARCHIVABLE = "fecha < :antes_de AND estado IN ('COMPLETADA', 'CANCELADA')"
+
+_SQL_PENDIENTES = text(f'SELECT id_cita FROM citas WHERE {_ARCHIVABLE} ORDER BY fecha LIMIT :limite')
+_SQL_COPIAR = text(
+    f'INSERT INTO citas_archivo ({_COLUMNAS}, archivada_en) '
+    f'SELECT {_COLUMNAS}, :ahora FROM citas WHERE id_cita IN :ids AND {_ARCHIVABLE}'
+).bindparams(bindparam('ids', expanding=True))
+_SQL_BORRAR = text(
+    f'DELETE FROM citas WHERE id_cita IN :ids AND {_ARCHIVABLE}'
+).bindparams(bindparam('ids', expanding=True))
+
+
+def horizonte(dias):
+    """Fecha a partir de la cual las citas se mantienen en la tabla citas
+    (hora local, como las fechas de las citas)"""
+    return datetime.combine(datetime.now().date() - timedelta(days=dias), datetime.min.time())
+
+
+def archivar_citas(engine, antes_de, tamano_lote=1000):
+    """Mueve a citas_archivo las citas terminadas con fecha < antes_de.
+
+    Cada lote se copia y se borra en su propia transacción, de modo que los
+    bloqueos son cortos y una interrupción no deja filas duplicadas ni
+    perdidas. Retorna el número de citas archivadas.
+    """
+    total = 0
+    while True:
+        with engine.begin() as conn:
+            ids = [fila[0] for fila in conn.execute(_SQL_PENDIENTES, {'antes_de': antes_de, 'limite': tamano_lote})]
+            if not ids:
+                return total
+            parametros = {'ids': ids, 'antes_de': antes_de}
+            conn.execute(_SQL_COPIAR, {**parametros, 'ahora': datetime.utcnow()})
+            conn.execute(_SQL_BORRAR, parametros)
+        total += len(ids)
+
+
+def fecha_limite_archivo(sesion=None):
+    """Fecha de la cita archivada más reciente, o None si el archivo está vacío"""
+    return (sesion or db.session).query(func.max(CitaArchivada.fecha)).scalar()
+
+
+def incluir_archivo(inicio, estado=None, sesion=None):
+    """Indica si un listado desde `inicio` (None: sin límite) con el filtro
+    de `estado` puede contener citas archivadas (en el shard de `sesion`)"""
+    if estado and estado not in ESTADOS_ARCHIVABLES:
+        return False
+    limite = fecha_limite_archivo(sesion)
+    return limite is not None and (inicio is None or inicio <= limite)
@@ -1,12 +1,36 @@
+import heapq
+import itertools
+import operator
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from datetime import datetime
-from app import db
-from app.models import Cita
+from datetime import datetime, time, timedelta
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Query
+from odontocare_comun.serializacion import listado_json, listado_filas
+from odontocare_comun.limitador import limitador
+from odontocare_comun.idempotencia import idempotencia
+from app.models import Cita, CitaArchivada, CitaHistorial
+from app.archivo import incluir_archivo
 from app.services import ServicioUsuarios
+from app.shards import shards
 
 citas_bp = Blueprint('citas', __name__)
 
+# Columna de las citas propias de cada rol, resuelta con /auth/perfil
+CAMPO_PROPIO = {'paciente': 'id_paciente', 'medico': 'id_doctor'}
+
+# Estados con los que el admin puede dar de alta una cita (carga de históricos)
+ESTADOS_CITA = ('PROGRAMADA', 'COMPLETADA', 'CANCELADA')
+
+# Tamaño de página de /citas/mias
+POR_PAGINA = 20
+MAX_POR_PAGINA = 100
+
+# Columnas de los listados y clave (fecha, id_cita) con la que se mezclan
+# las filas de varios shards
+CAMPOS_CITA = sorted(Cita.CAMPOS_LISTADO)
+ORDEN_CITA = operator.itemgetter(CAMPOS_CITA.index('fecha'), CAMPOS_CITA.index('id_cita'))
+
 
 def obtener_token():
     """Obtiene el token del header Authorization"""
@@ -17,8 +41,9 @@ def obtener_token():
 
 
 def verificar_disponibilidad_doctor(id_doctor, fecha, id_cita_excluir=None):
-    """Verifica que el doctor no tenga otra cita en la misma fecha/hora"""
-    query = Cita.query.filter(
+    """Verifica que el doctor no tenga otra cita en la misma fecha/hora en
+    ningún shard: puede pasar consulta en centros de varios"""
+    query = Query(Cita).filter(
         Cita.id_doctor == id_doctor,
         Cita.fecha == fecha,
         Cita.estado != 'CANCELADA'
@@ -26,12 +51,130 @@ def verificar_disponibilidad_doctor(id_doctor, fecha, id_cita_excluir=None):
     if id_cita_excluir:
         query = query.filter(Cita.id_cita != id_cita_excluir)
     
-    cita_existente = query.first()
-    return cita_existente is None
+    ocupado = shards.reunir(lambda sesion: query.with_session(sesion).first() is not None)
+    return not any(ocupado)
+
+
+def usuarios_no_disponible(*infos, **extra):
+    """Respuesta 503 si el servicio de usuarios no pudo confirmar alguno de
+    los datos (p. ej. respondió 429): no significa que no existan"""
+    for info in infos:
+        if info and info.get('error'):
+            response = jsonify({'error': 'El servicio de usuarios no está disponible. Inténtelo de nuevo más tarde',
+                                **extra})
+            response.status_code = 503
+            response.headers['Retry-After'] = info.get('reintentar') or '1'
+            return response
+    return None
+
+
+def buscar_cita(id_cita):
+    """(cita, sesión de su shard). La cita es None si no existe y la sesión
+    también si el id no se ha usado nunca."""
+    nombre = shards.de_cita(id_cita)
+    if nombre is None:
+        return None, None
+    sesion = shards.sesion(nombre)
+    return sesion.get(Cita, id_cita), sesion
+
+
+def _parsear_limite(valor):
+    """Convierte un límite de rango a datetime; indica si venía sin hora"""
+    try:
+        return datetime.combine(datetime.strptime(valor, '%Y-%m-%d').date(), time.min), True
+    except ValueError:
+        fecha = datetime.fromisoformat(valor.replace('Z', '+00:00'))
+        if fecha.tzinfo is not None:
+            # Las citas se guardan en hora local sin zona: se convierte antes de quitarla
+            fecha = fecha.astimezone().replace(tzinfo=None)
+        return fecha, False
+
+
+def rango_fechas(args):
+    """Intervalo semiabierto [inicio, fin) pedido con fecha o desde/hasta.
+
+    fecha selecciona un día completo. desde y hasta aceptan fecha u hora
+    ISO 8601; una fecha sin hora en hasta incluye ese día entero y una hora
+    con zona (Z, +02:00) se pasa a la hora local de las citas. Lanza
+    ValueError si algún valor no tiene un formato válido.
+    """
+    inicio = fin = None
+    if args.get('fecha'):
+        inicio, _ = _parsear_limite(args['fecha'][:10])
+        fin = inicio + timedelta(days=1)
+    if args.get('desde'):
+        desde, _ = _parsear_limite(args['desde'])
+        inicio = max(inicio, desde) if inicio else desde
+    if args.get('hasta'):
+        hasta, solo_fecha = _parsear_limite(args['hasta'])
+        if solo_fecha:
+            hasta += timedelta(days=1)
+        fin = min(fin, hasta) if fin else hasta
+    return inicio, fin
+
+
+def filtrar_por_rango(query, modelo=Cita):
+    """Aplica el rango de fechas de la petición comparando la columna sin
+    funciones, de modo que se use el índice (fecha, estado). Devuelve None
+    si el rango no es válido."""
+    try:
+        inicio, fin = rango_fechas(request.args)
+    except ValueError:
+        return None
+    if inicio:
+        query = query.filter(modelo.fecha >= inicio)
+    if fin:
+        query = query.filter(modelo.fecha < fin)
+    return query
+
+
+def perfil_propio(current_user):
+    """(id, error) para los roles de CAMPO_PROPIO: id es el id_paciente o
+    id_doctor asociado al usuario del token (None si no tiene) y error la
+    respuesta a devolver si el servicio de usuarios no responde."""
+    perfil = ServicioUsuarios.obtener_perfil(current_user['id_user'], obtener_token())
+    if 'error' in perfil:
+        return None, (jsonify({'error': 'No se pudo consultar el servicio de usuarios'}), 503)
+    return perfil.get(CAMPO_PROPIO[current_user['rol']]), None
+
+
+def consulta_citas(modelo, rol, id_propio=None, query=None):
+    """Consulta de `modelo` (Cita o CitaArchivada) con los filtros de la
+    petición permitidos al rol, a partir de `query` (por defecto
+    modelo.query). Devuelve None si el rango no es válido."""
+    if query is None:
+        query = modelo.query
+    
+    # Filtros según rol
+    if rol in CAMPO_PROPIO:
+        # El doctor y el paciente solo ven sus propias citas; sin perfil
+        # asociado (id_propio None) no ven ninguna
+        query = query.filter(getattr(modelo, CAMPO_PROPIO[rol]) == id_propio)
+    
+    elif rol == 'secretaria':
+        # Secretaría puede filtrar por fecha
+        query = filtrar_por_rango(query, modelo)
+    
+    elif rol == 'admin':
+        # Admin puede filtrar por todo
+        if request.args.get('id_doctor'):
+            query = query.filter(modelo.id_doctor == request.args.get('id_doctor', type=int))
+        if request.args.get('id_centro'):
+            query = query.filter(modelo.id_centro == request.args.get('id_centro', type=int))
+        if request.args.get('id_paciente'):
+            query = query.filter(modelo.id_paciente == request.args.get('id_paciente', type=int))
+        if request.args.get('estado'):
+            query = query.filter(modelo.estado == request.args.get('estado'))
+        query = filtrar_por_rango(query, modelo)
+    
+    return query
 
 
 @citas_bp.route('', methods=['POST'])
 @jwt_required()
+@limitador.limite('crear_cita', exentos=('admin',))
+@limitador.concurrente('crear_cita')
+@idempotencia.idempotente
 def crear_cita():
     """Crear una nueva cita médica"""
     current_user = get_jwt_identity()
@@ -62,40 +205,59 @@ def crear_cita():
     except ValueError:
         return jsonify({'error': 'Formato de fecha inválido. Use ISO 8601 (YYYY-MM-DDTHH:MM:SS)'}), 400
     
-    # Validar que el doctor existe (via servicio REST)
-    doctor_info = ServicioUsuarios.verificar_doctor(id_doctor, token)
+    # Solo el admin puede fijar el estado, para cargar el histórico tal cual
+    estado = data.get('estado', 'PROGRAMADA')
+    if estado != 'PROGRAMADA' and current_user['rol'] != 'admin':
+        return jsonify({'error': 'Solo el administrador puede crear citas con otro estado'}), 403
+    if estado not in ESTADOS_CITA:
+        return jsonify({'error': f"estado debe ser uno de: {', '.join(ESTADOS_CITA)}"}), 400
+    
+    # Igual con el usuario que registró la cita, que por defecto es quien la crea
+    id_user_registrado = data.get('id_user_registrado', current_user['id_user'])
+    if id_user_registrado != current_user['id_user'] and current_user['rol'] != 'admin':
+        return jsonify({'error': 'Solo el administrador puede registrar citas a nombre de otro usuario'}), 403
+    if isinstance(id_user_registrado, bool) or not isinstance(id_user_registrado, int) or id_user_registrado < 1:
+        return jsonify({'error': 'id_user_registrado debe ser un entero positivo'}), 400
+    
+    # Validar doctor, paciente y centro (via servicio REST, en paralelo)
+    doctor_info, paciente_info, centro_info = ServicioUsuarios.verificar_cita(
+        id_doctor, id_paciente, id_centro, token
+    )
+    no_disponible = usuarios_no_disponible(doctor_info, paciente_info, centro_info)
+    if no_disponible:
+        return no_disponible
+    
+    # Validar que el doctor existe
     if not doctor_info.get('existe'):
         return jsonify({'error': 'El doctor no existe'}), 404
     
     # Validar que el paciente existe y está activo
-    paciente_info = ServicioUsuarios.verificar_paciente(id_paciente, token)
     if not paciente_info.get('existe'):
         return jsonify({'error': 'El paciente no existe'}), 404
     if not paciente_info.get('activo'):
         return jsonify({'error': 'El paciente no está activo'}), 400
     
     # Validar que el centro existe
-    centro_info = ServicioUsuarios.verificar_centro(id_centro, token)
     if not centro_info.get('existe'):
         return jsonify({'error': 'El centro médico no existe'}), 404
     
-    # Verificar disponibilidad del doctor
-    if not verificar_disponibilidad_doctor(id_doctor, fecha):
+    # Verificar disponibilidad del doctor (una cita cancelada no ocupa la franja)
+    if estado != 'CANCELADA' and not verificar_disponibilidad_doctor(id_doctor, fecha):
         return jsonify({'error': 'El doctor ya tiene una cita programada en esa fecha y hora'}), 409
     
     # Crear la cita
     nueva_cita = Cita(
         fecha=fecha,
         motivo=motivo,
-        estado='PROGRAMADA',
+        estado=estado,
         id_paciente=id_paciente,
         id_doctor=id_doctor,
         id_centro=id_centro,
-        id_user_registrado=current_user['id_user']
+        id_user_registrado=id_user_registrado
     )
     
-    db.session.add(nueva_cita)
-    db.session.commit()
+    # Se guarda en el shard de su centro
+    shards.crear(nueva_cita)
     
     return jsonify({
         'mensaje': 'Cita creada exitosamente',
@@ -105,58 +267,112 @@ def crear_cita():
 
 @citas_bp.route('', methods=['GET'])
 @jwt_required()
+@limitador.concurrente('listados')
 def listar_citas():
     """Listar citas con filtros según el rol del usuario"""
     current_user = get_jwt_identity()
     rol = current_user['rol']
     
-    query = Cita.query
+    id_propio = None
+    if rol in CAMPO_PROPIO:
+        id_propio, error = perfil_propio(current_user)
+        if error:
+            return error
+    
+    # Las citas de un centro están en su shard; el resto de listados los
+    # responden todos los shards
+    id_centro = request.args.get('id_centro', type=int) if rol == 'admin' else None
+    nombres = [shards.de_centro(id_centro)] if id_centro is not None else shards.nombres()
+    
+    sesion = shards.sesion(nombres[0]) if len(nombres) == 1 else None
+    consultas = {
+        modelo: consulta_citas(modelo, rol, id_propio, sesion.query(modelo) if sesion else Query(modelo))
+        for modelo in (Cita, CitaArchivada)
+    }
+    if consultas[Cita] is None:
+        return jsonify({'error': 'Formato de fecha inválido. Use ISO 8601 (YYYY-MM-DD o YYYY-MM-DDTHH:MM:SS)'}), 400
+    
+    # Las citas archivadas solo se consultan si el rango pedido llega hasta ellas
+    inicio = rango_fechas(request.args)[0] if rol in ('secretaria', 'admin') else None
+    estado = request.args.get('estado') if rol == 'admin' else None
+    
+    if sesion is None:
+        return listado_shards(nombres, consultas, inicio, estado)
+    if incluir_archivo(inicio, estado, sesion):
+        return listado_json('citas', consultas[Cita], Cita, (consultas[CitaArchivada], CitaArchivada))
+    return listado_json('citas', consultas[Cita], Cita)
+
+
+def listado_shards(nombres, consultas, inicio, estado):
+    """Listado de varios shards consultados en paralelo. Cada shard devuelve
+    sus citas (y las de su archivo si hace falta) ordenadas por
+    (fecha, id_cita) y la respuesta las mezcla en ese orden."""
+    def leer(sesion):
+        modelos = (Cita, CitaArchivada) if incluir_archivo(inicio, estado, sesion) else (Cita,)
+        return [
+            consultas[modelo].with_session(sesion)
+            .with_entities(*[getattr(modelo, campo) for campo in CAMPOS_CITA])
+            .order_by(modelo.fecha, modelo.id_cita).all()
+            for modelo in modelos
+        ]
+    
+    tablas = itertools.chain.from_iterable(shards.reunir(leer, nombres))
+    return listado_filas('citas', CAMPOS_CITA, heapq.merge(*tablas, key=ORDEN_CITA))
+
+
+@citas_bp.route('/mias', methods=['GET'])
+@jwt_required()
+def mis_citas():
+    """Próximas citas programadas del paciente o doctor del token, por páginas.
     
-    # Filtros según rol
-    if rol == 'medico':
-        # El doctor solo ve sus propias citas
-        # Necesitamos obtener el id_doctor asociado al usuario
-        query = query.filter(Cita.id_doctor == request.args.get('id_doctor', type=int))
+    Parámetros: limite (20, máximo 100) y cursor, el valor de "siguiente"
+    de la página anterior.
+    """
+    current_user = get_jwt_identity()
+    rol = current_user['rol']
     
-    elif rol == 'paciente':
-        # El paciente solo ve sus propias citas
-        id_paciente = request.args.get('id_paciente', type=int)
-        if id_paciente:
-            query = query.filter(Cita.id_paciente == id_paciente)
+    if rol not in CAMPO_PROPIO:
+        return jsonify({'error': 'Solo disponible para pacientes y médicos'}), 403
     
-    elif rol == 'secretaria':
-        # Secretaría puede filtrar por fecha
-        fecha_str = request.args.get('fecha')
-        if fecha_str:
-            try:
-                fecha = datetime.fromisoformat(fecha_str.replace('Z', '+00:00'))
-                query = query.filter(db.func.date(Cita.fecha) == fecha.date())
-            except ValueError:
-                pass
+    id_propio, error = perfil_propio(current_user)
+    if error:
+        return error
     
-    elif rol == 'admin':
-        # Admin puede filtrar por todo
-        if request.args.get('id_doctor'):
-            query = query.filter(Cita.id_doctor == request.args.get('id_doctor', type=int))
-        if request.args.get('id_centro'):
-            query = query.filter(Cita.id_centro == request.args.get('id_centro', type=int))
-        if request.args.get('id_paciente'):
-            query = query.filter(Cita.id_paciente == request.args.get('id_paciente', type=int))
-        if request.args.get('estado'):
-            query = query.filter(Cita.estado == request.args.get('estado'))
-        fecha_str = request.args.get('fecha')
-        if fecha_str:
-            try:
-                fecha = datetime.fromisoformat(fecha_str.replace('Z', '+00:00'))
-                query = query.filter(db.func.date(Cita.fecha) == fecha.date())
-            except ValueError:
-                pass
+    limite = min(max(request.args.get('limite', POR_PAGINA, type=int), 1), MAX_POR_PAGINA)
+    query = Query(Cita).filter(
+        getattr(Cita, CAMPO_PROPIO[rol]) == id_propio,
+        Cita.estado == 'PROGRAMADA',
+        # Las fechas de las citas son horas locales sin zona, como datetime.now()
+        Cita.fecha >= datetime.now()
+    )
     
-    citas = query.all()
+    # Paginación por clave (fecha, id_cita): cada página es un recorrido
+    # corto del índice (id_paciente, fecha) o (id_doctor, fecha)
+    if request.args.get('cursor'):
+        try:
+            fecha_cursor, id_cursor = request.args['cursor'].rsplit('_', 1)
+            fecha_cursor, id_cursor = datetime.fromisoformat(fecha_cursor), int(id_cursor)
+        except ValueError:
+            return jsonify({'error': 'cursor inválido'}), 400
+        query = query.filter(or_(
+            Cita.fecha > fecha_cursor,
+            and_(Cita.fecha == fecha_cursor, Cita.id_cita > id_cursor)
+        ))
+    
+    # Las citas de un paciente o doctor pueden estar en varios shards: cada
+    # uno devuelve su página y se mezclan
+    query = query.order_by(Cita.fecha, Cita.id_cita).limit(limite + 1)
+    paginas = shards.reunir(lambda sesion: query.with_session(sesion).all())
+    citas = list(itertools.islice(heapq.merge(*paginas, key=lambda c: (c.fecha, c.id_cita)), limite + 1))
+    siguiente = None
+    if len(citas) > limite:
+        citas = citas[:limite]
+        siguiente = f'{citas[-1].fecha.isoformat()}_{citas[-1].id_cita}'
     
     return jsonify({
+        'citas': [cita.to_dict() for cita in citas],
         'total': len(citas),
-        'citas': [c.to_dict() for c in citas]
+        'siguiente': siguiente
     }), 200
 
 
@@ -164,7 +380,9 @@ def listar_citas():
 @jwt_required()
 def obtener_cita(id_cita):
     """Obtener una cita por ID"""
-    cita = Cita.query.get(id_cita)
+    cita, sesion = buscar_cita(id_cita)
+    if sesion is not None and not cita:
+        cita = sesion.get(CitaArchivada, id_cita)
     if not cita:
         return jsonify({'error': 'Cita no encontrada'}), 404
     return jsonify(cita.to_dict()), 200
@@ -181,15 +399,16 @@ def cancelar_cita(id_cita):
     if current_user['rol'] not in roles_permitidos:
         return jsonify({'error': 'Acceso denegado'}), 403
     
-    cita = Cita.query.get(id_cita)
+    cita, sesion = buscar_cita(id_cita)
     if not cita:
         return jsonify({'error': 'Cita no encontrada'}), 404
     
     if cita.estado == 'CANCELADA':
         return jsonify({'error': 'La cita ya está cancelada'}), 400
     
+    sesion.add(CitaHistorial.desde_cita(cita, 'CANCELACION', current_user['id_user']))
     cita.estado = 'CANCELADA'
-    db.session.commit()
+    sesion.commit()
     
     return jsonify({
         'mensaje': 'Cita cancelada exitosamente',
@@ -209,7 +428,7 @@ def modificar_cita(id_cita):
     if current_user['rol'] not in roles_permitidos:
         return jsonify({'error': 'Acceso denegado'}), 403
     
-    cita = Cita.query.get(id_cita)
+    cita, sesion = buscar_cita(id_cita)
     if not cita:
         return jsonify({'error': 'Cita no encontrada'}), 404
     
@@ -233,25 +452,39 @@ def modificar_cita(id_cita):
         except ValueError:
             return jsonify({'error': 'Formato de fecha inválido'}), 400
     
+    # Consultar en paralelo solo los datos que cambian
+    doctor_info, paciente_info, centro_info = ServicioUsuarios.verificar_cita(
+        nuevo_id_doctor if nuevo_id_doctor != cita.id_doctor else None,
+        nuevo_id_paciente if nuevo_id_paciente != cita.id_paciente else None,
+        nuevo_id_centro if nuevo_id_centro != cita.id_centro else None,
+        token
+    )
+    no_disponible = usuarios_no_disponible(doctor_info, paciente_info, centro_info, cambio_realizado=False)
+    if no_disponible:
+        return no_disponible
+    
     # Validar doctor
-    if nuevo_id_doctor != cita.id_doctor:
-        doctor_info = ServicioUsuarios.verificar_doctor(nuevo_id_doctor, token)
+    if doctor_info is not None:
         if not doctor_info.get('existe'):
             return jsonify({'error': 'El doctor no existe', 'cambio_realizado': False}), 404
     
     # Validar paciente
-    if nuevo_id_paciente != cita.id_paciente:
-        paciente_info = ServicioUsuarios.verificar_paciente(nuevo_id_paciente, token)
+    if paciente_info is not None:
         if not paciente_info.get('existe'):
             return jsonify({'error': 'El paciente no existe', 'cambio_realizado': False}), 404
         if not paciente_info.get('activo'):
             return jsonify({'error': 'El paciente no está activo', 'cambio_realizado': False}), 400
     
     # Validar centro
-    if nuevo_id_centro != cita.id_centro:
-        centro_info = ServicioUsuarios.verificar_centro(nuevo_id_centro, token)
+    if centro_info is not None:
         if not centro_info.get('existe'):
             return jsonify({'error': 'El centro médico no existe', 'cambio_realizado': False}), 404
+        # El centro decide el shard de la cita, que no cambia
+        if shards.de_centro(nuevo_id_centro) != shards.de_centro(cita.id_centro):
+            return jsonify({
+                'error': 'El centro pertenece a otra región. Cancele la cita y cree una nueva en ese centro',
+                'cambio_realizado': False
+            }), 409
     
     # Verificar disponibilidad del doctor (excluyendo la cita actual)
     if not verificar_disponibilidad_doctor(nuevo_id_doctor, nueva_fecha, id_cita):
@@ -260,30 +493,54 @@ def modificar_cita(id_cita):
             'cambio_realizado': False
         }), 409
     
-    # Cancelar la cita anterior y crear una nueva (según el enunciado)
-    cita.estado = 'CANCELADA'
-    
-    nueva_cita = Cita(
-        fecha=nueva_fecha,
-        motivo=nuevo_motivo,
-        estado='PROGRAMADA',
-        id_paciente=nuevo_id_paciente,
-        id_doctor=nuevo_id_doctor,
-        id_centro=nuevo_id_centro,
-        id_user_registrado=current_user['id_user']
-    )
-    
-    db.session.add(nueva_cita)
-    db.session.commit()
+    # La cita se actualiza en su fila; el estado anterior queda en citas_historial.
+    # Solo una nueva fecha la vuelve a programar: cambiar el motivo de una cita
+    # COMPLETADA no la reabre
+    cita_anterior = cita.to_dict()
+    nuevos_valores = {
+        'fecha': nueva_fecha,
+        'motivo': nuevo_motivo,
+        'estado': 'PROGRAMADA' if nueva_fecha != cita.fecha else cita.estado,
+        'id_paciente': nuevo_id_paciente,
+        'id_doctor': nuevo_id_doctor,
+        'id_centro': nuevo_id_centro,
+    }
+    if any(getattr(cita, campo) != valor for campo, valor in nuevos_valores.items()):
+        sesion.add(CitaHistorial.desde_cita(cita, 'MODIFICACION', current_user['id_user']))
+        for campo, valor in nuevos_valores.items():
+            setattr(cita, campo, valor)
+        sesion.commit()
     
     return jsonify({
         'mensaje': 'Cita modificada exitosamente',
         'cambio_realizado': True,
-        'cita_anterior': cita.to_dict(),
-        'cita_nueva': nueva_cita.to_dict()
+        'cita_anterior': cita_anterior,
+        'cita_nueva': cita.to_dict()
     }), 200
 
 
+@citas_bp.route('/<int:id_cita>/historial', methods=['GET'])
+@jwt_required()
+def historial_cita(id_cita):
+    """Versiones anteriores de una cita, de la más antigua a la más reciente"""
+    current_user = get_jwt_identity()
+    
+    if current_user['rol'] not in ['admin', 'secretaria']:
+        return jsonify({'error': 'Acceso denegado'}), 403
+    
+    # El historial está en el shard de la cita
+    cita, sesion = buscar_cita(id_cita)
+    if sesion is None:
+        return jsonify({'error': 'Cita no encontrada'}), 404
+    consulta = sesion.query(CitaHistorial).filter_by(id_cita=id_cita).order_by(CitaHistorial.id_historial)
+    # Una cita eliminada o archivada conserva su historial; sin ninguno de los
+    # tres, el id no corresponde a ninguna cita
+    if (cita is None and sesion.get(CitaArchivada, id_cita) is None
+            and not sesion.query(consulta.exists()).scalar()):
+        return jsonify({'error': 'Cita no encontrada'}), 404
+    return listado_json('historial', consulta, CitaHistorial)
+
+
 @citas_bp.route('/<int:id_cita>', methods=['DELETE'])
 @jwt_required()
 def eliminar_cita(id_cita):
@@ -293,11 +550,12 @@ def eliminar_cita(id_cita):
     if current_user['rol'] != 'admin':
         return jsonify({'error': 'Acceso denegado. Se requiere rol admin'}), 403
     
-    cita = Cita.query.get(id_cita)
+    cita, sesion = buscar_cita(id_cita)
     if not cita:
         return jsonify({'error': 'Cita no encontrada'}), 404
     
-    db.session.delete(cita)
-    db.session.commit()
+    # La entrada del directorio se conserva, como el historial de la cita
+    sesion.delete(cita)
+    sesion.commit()
     
     return jsonify({'mensaje': 'Cita eliminada exitosamente'}), 200
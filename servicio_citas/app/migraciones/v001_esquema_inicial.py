@@ -0,0 +1,23 @@
+"""Esquema inicial: citas"""
+
+from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime
+
+
+def upgrade(conn):
+    metadata = MetaData()
+
+    Table(
+        'citas', metadata,
+        Column('id_cita', Integer, primary_key=True),
+        Column('fecha', DateTime, nullable=False),
+        Column('motivo', String(255), nullable=False),
+        Column('estado', String(20)),
+        Column('id_paciente', Integer, nullable=False),
+        Column('id_doctor', Integer, nullable=False),
+        Column('id_centro', Integer, nullable=False),
+        Column('id_user_registrado', Integer, nullable=False),
+        Column('created_at', DateTime),
+    )
+
+    # checkfirst permite adoptar bases de datos creadas antes con db.create_all()
+    metadata.create_all(conn, checkfirst=True)
@@ -0,0 +1,7 @@
+"""Índice (fecha, estado) para los listados por rango de fechas"""
+
+from app.migraciones import Indice
+
+INDICES = [
+    Indice('ix_citas_fecha_estado', 'citas', ['fecha', 'estado']),
+]
@@ -0,0 +1,23 @@
+"""Historial de cambios de las citas (modificaciones y cancelaciones)"""
+
+from sqlalchemy import MetaData, Table, Column, Index, Integer, String, DateTime
+
+
+def upgrade(conn):
+    metadata = MetaData()
+    Table(
+        'citas_historial', metadata,
+        Column('id_historial', Integer, primary_key=True),
+        Column('id_cita', Integer, nullable=False),
+        Column('operacion', String(20), nullable=False),
+        Column('fecha', DateTime, nullable=False),
+        Column('motivo', String(255), nullable=False),
+        Column('estado', String(20)),
+        Column('id_paciente', Integer, nullable=False),
+        Column('id_doctor', Integer, nullable=False),
+        Column('id_centro', Integer, nullable=False),
+        Column('id_user_modificacion', Integer, nullable=False),
+        Column('modificada_en', DateTime, nullable=False),
+        Index('ix_citas_historial_cita', 'id_cita', 'id_historial'),
+    )
+    metadata.create_all(conn, checkfirst=True)
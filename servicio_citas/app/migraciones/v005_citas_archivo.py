@@ -0,0 +1,22 @@
+"""Tabla de archivo para las citas terminadas antiguas (ver app/archivo.py)"""
+
+from sqlalchemy import MetaData, Table, Column, Index, Integer, String, DateTime
+
+
+def upgrade(conn):
+    metadata = MetaData()
+    Table(
+        'citas_archivo', metadata,
+        Column('id_cita', Integer, primary_key=True, autoincrement=False),
+        Column('fecha', DateTime, nullable=False),
+        Column('motivo', String(255), nullable=False),
+        Column('estado', String(20)),
+        Column('id_paciente', Integer, nullable=False),
+        Column('id_doctor', Integer, nullable=False),
+        Column('id_centro', Integer, nullable=False),
+        Column('id_user_registrado', Integer, nullable=False),
+        Column('created_at', DateTime),
+        Column('archivada_en', DateTime, nullable=False),
+        Index('ix_citas_archivo_fecha_estado', 'fecha', 'estado'),
+    )
+    metadata.create_all(conn, checkfirst=True)
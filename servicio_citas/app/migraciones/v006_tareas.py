@@ -0,0 +1,21 @@
+"""Turnos de las tareas periódicas (ver app/tareas.py).
+
+El índice (estado, fecha) que usan las tareas va en v011_indice_estado_fecha:
+en PostgreSQL se crea de forma concurrente, y eso no es posible dentro de la
+transacción que crea la tabla.
+"""
+
+from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime
+
+
+def upgrade(conn):
+    metadata = MetaData()
+    Table(
+        'tareas_bloqueos', metadata,
+        Column('nombre', String(100), primary_key=True),
+        Column('propietario', String(100)),
+        Column('expira', DateTime, nullable=False),
+        Column('ultima_ejecucion', DateTime),
+        Column('ultimo_resultado', Integer),
+    )
+    metadata.create_all(conn, checkfirst=True)
@@ -0,0 +1,27 @@
+"""Bandeja de salida de recordatorios de citas (ver app/recordatorios.py)"""
+
+from sqlalchemy import MetaData, Table, Column, Index, Integer, String, DateTime
+
+
+def upgrade(conn):
+    metadata = MetaData()
+    Table(
+        'recordatorios', metadata,
+        Column('id_recordatorio', Integer, primary_key=True),
+        Column('id_cita', Integer, nullable=False),
+        Column('fecha_cita', DateTime, nullable=False),
+        Column('canal', String(20), nullable=False),
+        Column('destino', String(100)),
+        Column('mensaje', String(500)),
+        Column('estado', String(20), nullable=False),
+        Column('intentos', Integer, nullable=False, default=0),
+        Column('proximo_intento', DateTime, nullable=False),
+        Column('creado', DateTime, nullable=False),
+        Column('enviado_en', DateTime),
+        Column('error', String(255)),
+        # Un recordatorio por cita, fecha y canal: una cita reprogramada
+        # recibe uno nuevo con su nueva fecha
+        Index('ux_recordatorios_cita', 'id_cita', 'fecha_cita', 'canal', unique=True),
+        Index('ix_recordatorios_estado_proximo', 'estado', 'proximo_intento'),
+    )
+    metadata.create_all(conn, checkfirst=True)
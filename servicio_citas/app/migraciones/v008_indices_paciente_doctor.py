@@ -0,0 +1,8 @@
+"""Índices (id_paciente, fecha) e (id_doctor, fecha) para las citas de cada usuario"""
+
+from app.migraciones import Indice
+
+INDICES = [
+    Indice('ix_citas_paciente_fecha', 'citas', ['id_paciente', 'fecha']),
+    Indice('ix_citas_doctor_fecha', 'citas', ['id_doctor', 'fecha']),
+]
@@ -0,0 +1,26 @@
+"""Directorio de citas: shard de cada cita y reparto de los id_cita (ver app/shards.py)"""
+
+from sqlalchemy import MetaData, Table, Column, Integer, String, text
+
+
+def upgrade(conn):
+    metadata = MetaData()
+    Table(
+        'citas_directorio', metadata,
+        Column('id_cita', Integer, primary_key=True),
+        Column('shard', String(50), nullable=False),
+    )
+    metadata.create_all(conn, checkfirst=True)
+
+    # Las citas ya existentes, vigentes o archivadas, están en el principal.
+    # Los shards nuevos se crean vacíos y su directorio no se usa.
+    conn.execute(text(
+        "INSERT INTO citas_directorio (id_cita, shard) "
+        "SELECT id_cita, 'principal' FROM citas UNION SELECT id_cita, 'principal' FROM citas_archivo"
+    ))
+    if conn.dialect.name == 'postgresql':
+        # Los id_cita nuevos salen de la secuencia del directorio
+        conn.execute(text(
+            "SELECT setval(pg_get_serial_sequence('citas_directorio', 'id_cita'), "
+            "COALESCE((SELECT MAX(id_cita) FROM citas_directorio), 0) + 1, false)"
+        ))
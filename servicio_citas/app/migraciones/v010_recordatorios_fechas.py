@@ -0,0 +1,25 @@
+"""Fechas de la bandeja de recordatorios con el formato de las columnas DateTime.
+
+En SQLite los recordatorios se guardaban con el formato de sqlite3
+('2030-01-01 10:00:00') en lugar del de SQLAlchemy ('2030-01-01
+10:00:00.000000') y la búsqueda de citas sin recordatorio no los
+encontraba. En PostgreSQL las fechas no son texto y no hay nada que hacer.
+"""
+
+from sqlalchemy import DateTime, bindparam, text
+
+_COLUMNAS = ('fecha_cita', 'proximo_intento', 'creado', 'enviado_en')
+
+
+def upgrade(conn):
+    if conn.dialect.name != 'sqlite':
+        return
+    tipos = {columna: DateTime for columna in _COLUMNAS}
+    filas = conn.execute(
+        text(f"SELECT id_recordatorio, {', '.join(_COLUMNAS)} FROM recordatorios").columns(**tipos)
+    ).mappings().all()
+    if filas:
+        conn.execute(text(
+            'UPDATE recordatorios SET ' + ', '.join(f'{c} = :{c}' for c in _COLUMNAS) +
+            ' WHERE id_recordatorio = :id_recordatorio'
+        ).bindparams(*[bindparam(c, type_=DateTime) for c in _COLUMNAS]), [dict(fila) for fila in filas])
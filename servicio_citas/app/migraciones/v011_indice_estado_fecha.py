@@ -0,0 +1,11 @@
+"""Índice (estado, fecha) para localizar las citas PROGRAMADA ya pasadas (ver app/tareas.py).
+
+Las bases de datos que aplicaron v006_tareas antes de separar el índice ya
+lo tienen; se crea si no existe.
+"""
+
+from app.migraciones import Indice
+
+INDICES = [
+    Indice('ix_citas_estado_fecha', 'citas', ['estado', 'fecha']),
+]
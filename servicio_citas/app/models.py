@@ -3,6 +3,12 @@ from datetime import datetime
 
 class Cita(db.Model):
     __tablename__ = 'citas'
+    __table_args__ = (
+        db.Index('ix_citas_fecha_estado', 'fecha', 'estado'),
+        db.Index('ix_citas_estado_fecha', 'estado', 'fecha'),
+        db.Index('ix_citas_paciente_fecha', 'id_paciente', 'fecha'),
+        db.Index('ix_citas_doctor_fecha', 'id_doctor', 'fecha'),
+    )
     
     id_cita = db.Column(db.Integer, primary_key=True)
     fecha = db.Column(db.DateTime, nullable=False)
@@ -14,6 +20,9 @@ class Cita(db.Model):
     id_user_registrado = db.Column(db.Integer, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Claves de to_dict(), usadas por la serialización rápida de listados
+    CAMPOS_LISTADO = ('id_cita', 'fecha', 'motivo', 'estado', 'id_paciente', 'id_doctor', 'id_centro', 'id_user_registrado', 'created_at')
+    
     def to_dict(self):
         return {
             'id_cita': self.id_cita,
@@ -26,3 +35,90 @@ class Cita(db.Model):
             'id_user_registrado': self.id_user_registrado,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
+
+
+class CitaArchivada(db.Model):
+    """Cita terminada y antigua movida fuera de la tabla citas (ver app/archivo.py)"""
+    __tablename__ = 'citas_archivo'
+    __table_args__ = (
+        db.Index('ix_citas_archivo_fecha_estado', 'fecha', 'estado'),
+    )
+    
+    id_cita = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    fecha = db.Column(db.DateTime, nullable=False)
+    motivo = db.Column(db.String(255), nullable=False)
+    estado = db.Column(db.String(20))
+    id_paciente = db.Column(db.Integer, nullable=False)
+    id_doctor = db.Column(db.Integer, nullable=False)
+    id_centro = db.Column(db.Integer, nullable=False)
+    id_user_registrado = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime)
+    archivada_en = db.Column(db.DateTime, nullable=False)
+    
+    # Mismo formato que Cita: los listados mezclan ambas tablas
+    CAMPOS_LISTADO = Cita.CAMPOS_LISTADO
+    to_dict = Cita.to_dict
+
+
+class CitaHistorial(db.Model):
+    """Estado de una cita antes de cada modificación o cancelación (solo inserciones).
+
+    Sin clave foránea: el historial se conserva aunque la cita se elimine.
+    """
+    __tablename__ = 'citas_historial'
+    __table_args__ = (
+        db.Index('ix_citas_historial_cita', 'id_cita', 'id_historial'),
+    )
+    
+    id_historial = db.Column(db.Integer, primary_key=True)
+    id_cita = db.Column(db.Integer, nullable=False)
+    operacion = db.Column(db.String(20), nullable=False)  # MODIFICACION, CANCELACION
+    fecha = db.Column(db.DateTime, nullable=False)
+    motivo = db.Column(db.String(255), nullable=False)
+    estado = db.Column(db.String(20))
+    id_paciente = db.Column(db.Integer, nullable=False)
+    id_doctor = db.Column(db.Integer, nullable=False)
+    id_centro = db.Column(db.Integer, nullable=False)
+    id_user_modificacion = db.Column(db.Integer, nullable=False)
+    modificada_en = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    # Claves de to_dict(), usadas por la serialización rápida de listados
+    CAMPOS_LISTADO = ('id_historial', 'id_cita', 'operacion', 'fecha', 'motivo', 'estado', 'id_paciente', 'id_doctor', 'id_centro', 'id_user_modificacion', 'modificada_en')
+    
+    @classmethod
+    def desde_cita(cls, cita, operacion, id_user):
+        """Copia del estado actual de `cita`, antes de modificarla"""
+        return cls(
+            id_cita=cita.id_cita,
+            operacion=operacion,
+            fecha=cita.fecha,
+            motivo=cita.motivo,
+            estado=cita.estado,
+            id_paciente=cita.id_paciente,
+            id_doctor=cita.id_doctor,
+            id_centro=cita.id_centro,
+            id_user_modificacion=id_user
+        )
+    
+    def to_dict(self):
+        return {
+            'id_historial': self.id_historial,
+            'id_cita': self.id_cita,
+            'operacion': self.operacion,
+            'fecha': self.fecha.isoformat() if self.fecha else None,
+            'motivo': self.motivo,
+            'estado': self.estado,
+            'id_paciente': self.id_paciente,
+            'id_doctor': self.id_doctor,
+            'id_centro': self.id_centro,
+            'id_user_modificacion': self.id_user_modificacion,
+            'modificada_en': self.modificada_en.isoformat() if self.modificada_en else None
+        }
+
+
+class CitaDirectorio(db.Model):
+    """Shard de cada cita; su clave reparte los id_cita de todos los shards (ver app/shards.py)"""
+    __tablename__ = 'citas_directorio'
+    
+    id_cita = db.Column(db.Integer, primary_key=True)
+    shard = db.Column(db.String(50), nullable=False)
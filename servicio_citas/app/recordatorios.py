@@ -0,0 +1,325 @@
+"""
+Recordatorios de citas por SMS a través de una bandeja de salida.
+
+La tarea periódica `recordatorios` (ver app/tareas.py) hace dos pasos:
+
+1. Encolar: recorre por lotes (en orden de id_cita) las citas PROGRAMADA
+   de las próximas RECORDATORIOS_ANTELACION_HORAS, descarta las que ya
+   tienen recordatorio para su fecha actual, pide los teléfonos de los
+   pacientes al servicio de usuarios con una petición por lote
+   (GET /admin/pacientes?ids=...) y guarda un recordatorio PENDIENTE por
+   cita en la tabla recordatorios. El índice único (id_cita, fecha_cita,
+   canal) evita duplicados; si la cita se reprograma, la nueva fecha recibe
+   su propio recordatorio.
+
+2. Enviar: lee los recordatorios PENDIENTE cuyo próximo intento ya llegó y
+   los entrega al enviador, como mucho RECORDATORIOS_CONCURRENCIA a la vez.
+   Los fallidos se reintentan con espera exponencial hasta
+   RECORDATORIOS_MAX_INTENTOS y luego quedan FALLIDO. Los de citas
+   canceladas, reprogramadas o ya pasadas quedan DESCARTADO sin enviarse.
+
+Las fechas de las citas son horas locales sin zona, así que la ventana y la
+comprobación de citas pasadas usan datetime.now().
+
+Cada envío lleva una clave estable ('recordatorio-<id>') para que un
+proveedor con idempotencia descarte el duplicado si el proceso se detiene
+entre el envío y la actualización de la tabla.
+
+Con varios shards (ver app/shards.py) cada uno tiene la bandeja de sus
+citas y la tarea los recorre todos; la clave de los recordatorios de un
+shard distinto del principal es 'recordatorio-<shard>-<id>'.
+
+Enviadores (RECORDATORIOS_ENVIADOR):
+    fichero   añade una línea JSON por mensaje a RECORDATORIOS_FICHERO (por defecto)
+    memoria   guarda los mensajes en la lista `enviados` del enviador (pruebas)
+    http      POST JSON a RECORDATORIOS_URL (pasarela SMS) con Idempotency-Key
+    modulo:Clase  cualquier clase con `async enviar(mensaje)` que reciba la configuración
+
+Configuración (variables de entorno):
+    RECORDATORIOS_ANTELACION_HORAS  horas antes de la cita en que se encola (24)
+    RECORDATORIOS_LOTE              citas o recordatorios por lote (200)
+    RECORDATORIOS_CONCURRENCIA      envíos simultáneos (10)
+    RECORDATORIOS_MAX_INTENTOS      intentos antes de marcar FALLIDO (5)
+    RECORDATORIOS_REINTENTO         segundos de espera tras el primer fallo (60)
+
+La tarea está desactivada por defecto; se activa con
+TAREAS_INTERVALO_RECORDATORIOS (p. ej. 60).
+"""
+
+import asyncio
+import importlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import DateTime, Integer, bindparam, text
+from sqlalchemy.exc import IntegrityError
+from odontocare_comun.cliente_http import cliente_http
+from app.shards import PRINCIPAL, shards
+from app.tareas import tareas
+
+logger = logging.getLogger('odontocare.recordatorios')
+
+CANAL_SMS = 'sms'
+
+# Las fechas se enlazan como DateTime para que SQLite las guarde con el
+# formato de las columnas escritas por el ORM. Aun así, una cita escrita con
+# otro formato ('2030-01-01 10:00:00' sin microsegundos) no sería igual como
+# texto a la fecha de su recordatorio: la fecha se compara ya leída, en Python,
+# y el recorrido avanza por id_cita para no volver nunca a las mismas citas.
+_SQL_CITAS_VENTANA = text(
+    "SELECT c.id_cita, c.fecha, c.id_paciente FROM citas c "
+    "WHERE c.estado = 'PROGRAMADA' AND c.fecha >= :desde AND c.fecha < :hasta AND c.id_cita > :desde_id "
+    "ORDER BY c.id_cita LIMIT :limite"
+).bindparams(bindparam('desde', type_=DateTime), bindparam('hasta', type_=DateTime)).columns(fecha=DateTime)
+_SQL_RECORDADAS = text(
+    'SELECT id_cita, fecha_cita FROM recordatorios WHERE canal = :canal AND id_cita IN :ids'
+).bindparams(bindparam('ids', expanding=True)).columns(fecha_cita=DateTime)
+_SQL_ENCOLAR = text(
+    'INSERT INTO recordatorios (id_cita, fecha_cita, canal, destino, mensaje, estado, '
+    'intentos, proximo_intento, creado, error) '
+    'VALUES (:id_cita, :fecha_cita, :canal, :destino, :mensaje, :estado, 0, :ahora, :ahora, :error)'
+).bindparams(bindparam('fecha_cita', type_=DateTime), bindparam('ahora', type_=DateTime))
+_SQL_PENDIENTES = text(
+    'SELECT r.id_recordatorio, r.id_cita, r.fecha_cita, r.canal, r.destino, r.mensaje, r.intentos, '
+    'c.estado AS estado_cita, c.fecha AS fecha_actual '
+    'FROM recordatorios r LEFT JOIN citas c ON c.id_cita = r.id_cita '
+    "WHERE r.estado = 'PENDIENTE' AND r.proximo_intento <= :ahora "
+    'ORDER BY r.proximo_intento LIMIT :limite'
+).bindparams(bindparam('ahora', type_=DateTime)).columns(fecha_cita=DateTime, fecha_actual=DateTime, intentos=Integer)
+_SQL_MARCAR = text(
+    'UPDATE recordatorios SET estado = :estado, enviado_en = :enviado_en '
+    'WHERE id_recordatorio IN :ids'
+).bindparams(bindparam('ids', expanding=True), bindparam('enviado_en', type_=DateTime))
+_SQL_REINTENTAR = text(
+    'UPDATE recordatorios SET estado = :estado, intentos = :intentos, '
+    'proximo_intento = :proximo_intento, error = :error WHERE id_recordatorio = :id_recordatorio'
+).bindparams(bindparam('proximo_intento', type_=DateTime))
+
+
+def _mensaje(fecha):
+    return f'OdontoCare: le recordamos su cita del {fecha:%d/%m/%Y} a las {fecha:%H:%M}.'
+
+
+# ==================== ENVIADORES ====================
+
+class EnviadorMemoria:
+    """Guarda los mensajes en memoria del proceso"""
+
+    def __init__(self, config):
+        self.enviados = []
+
+    async def enviar(self, mensaje):
+        self.enviados.append(mensaje)
+
+
+class EnviadorFichero:
+    """Añade cada mensaje como una línea JSON a un fichero"""
+
+    def __init__(self, config):
+        self.ruta = config['RECORDATORIOS_FICHERO']
+        self._lock = threading.Lock()
+
+    async def enviar(self, mensaje):
+        linea = json.dumps({**mensaje, 'enviado_en': datetime.utcnow().isoformat()}, ensure_ascii=False)
+        with self._lock, open(self.ruta, 'a', encoding='utf-8') as fichero:
+            fichero.write(linea + '\n')
+
+
+class EnviadorHTTP:
+    """Envía cada mensaje a una pasarela HTTP; un estado distinto de 2xx es un fallo"""
+
+    def __init__(self, config):
+        self.url = config['RECORDATORIOS_URL']
+        if not self.url:
+            raise ValueError('RECORDATORIOS_URL es obligatorio con RECORDATORIOS_ENVIADOR=http')
+
+    async def enviar(self, mensaje):
+        response = await cliente_http.peticion(
+            'POST', self.url, json=mensaje, headers={'Idempotency-Key': mensaje['clave']}, timeout=10
+        )
+        response.raise_for_status()
+
+
+ENVIADORES = {
+    'memoria': EnviadorMemoria,
+    'fichero': EnviadorFichero,
+    'http': EnviadorHTTP,
+}
+
+
+def crear_enviador(config):
+    nombre = config['RECORDATORIOS_ENVIADOR']
+    if nombre in ENVIADORES:
+        return ENVIADORES[nombre](config)
+    modulo, _, clase = nombre.partition(':')
+    if not clase:
+        raise ValueError(f'RECORDATORIOS_ENVIADOR desconocido: {nombre}')
+    return getattr(importlib.import_module(modulo), clase)(config)
+
+
+# ==================== BANDEJA DE SALIDA ====================
+
+class Recordatorios:
+    """Encola y envía los recordatorios de las próximas citas"""
+
+    def __init__(self):
+        self.enviador = None
+        self.lote = 200
+        self.concurrencia = 10
+        self.max_intentos = 5
+        self.reintento = 60
+        self.antelacion = timedelta(hours=24)
+
+    def init_app(self, app):
+        app.config.setdefault('RECORDATORIOS_ENVIADOR', os.environ.get('RECORDATORIOS_ENVIADOR', 'fichero'))
+        app.config.setdefault('RECORDATORIOS_FICHERO',
+                              os.environ.get('RECORDATORIOS_FICHERO', 'recordatorios_enviados.jsonl'))
+        app.config.setdefault('RECORDATORIOS_URL', os.environ.get('RECORDATORIOS_URL'))
+        app.config.setdefault('RECORDATORIOS_ANTELACION_HORAS',
+                              int(os.environ.get('RECORDATORIOS_ANTELACION_HORAS', 24)))
+        app.config.setdefault('RECORDATORIOS_LOTE', int(os.environ.get('RECORDATORIOS_LOTE', 200)))
+        app.config.setdefault('RECORDATORIOS_CONCURRENCIA', int(os.environ.get('RECORDATORIOS_CONCURRENCIA', 10)))
+        app.config.setdefault('RECORDATORIOS_MAX_INTENTOS', int(os.environ.get('RECORDATORIOS_MAX_INTENTOS', 5)))
+        app.config.setdefault('RECORDATORIOS_REINTENTO', int(os.environ.get('RECORDATORIOS_REINTENTO', 60)))
+        self.enviador = crear_enviador(app.config)
+        self.antelacion = timedelta(hours=app.config['RECORDATORIOS_ANTELACION_HORAS'])
+        self.lote = app.config['RECORDATORIOS_LOTE']
+        self.concurrencia = app.config['RECORDATORIOS_CONCURRENCIA']
+        self.max_intentos = app.config['RECORDATORIOS_MAX_INTENTOS']
+        self.reintento = app.config['RECORDATORIOS_REINTENTO']
+
+    # ==================== ENCOLAR ====================
+
+    def encolar(self, engine, ahora=None):
+        """Crea los recordatorios de las citas de la ventana de antelación.
+        Retorna el número de recordatorios creados (incluidos los DESCARTADO)."""
+        from app.services import ServicioUsuarios
+
+        ahora = ahora or datetime.now()
+        token = ServicioUsuarios.token_servicio()
+        total = 0
+        desde_id = 0
+        while True:
+            with engine.connect() as conn:
+                ventana = conn.execute(_SQL_CITAS_VENTANA, {
+                    'desde': ahora, 'hasta': ahora + self.antelacion, 'desde_id': desde_id, 'limite': self.lote,
+                }).all()
+                if not ventana:
+                    return total
+                recordadas = {(fila.id_cita, fila.fecha_cita) for fila in conn.execute(_SQL_RECORDADAS, {
+                    'canal': CANAL_SMS, 'ids': [cita.id_cita for cita in ventana],
+                })}
+            desde_id = ventana[-1].id_cita
+            citas = [cita for cita in ventana if (cita.id_cita, cita.fecha) not in recordadas]
+            if not citas:
+                continue
+
+            # Una petición por lote al servicio de usuarios, no una por cita
+            pacientes = ServicioUsuarios.obtener_pacientes([cita.id_paciente for cita in citas], token)
+            filas = []
+            for cita in citas:
+                paciente = pacientes.get(cita.id_paciente)
+                if paciente is None or paciente.get('estado') != 'ACTIVO' or not paciente.get('telefono'):
+                    estado, destino, error = 'DESCARTADO', None, 'Paciente inexistente, inactivo o sin teléfono'
+                else:
+                    estado, destino, error = 'PENDIENTE', paciente['telefono'], None
+                filas.append({
+                    'id_cita': cita.id_cita,
+                    'fecha_cita': cita.fecha,
+                    'canal': CANAL_SMS,
+                    'destino': destino,
+                    'mensaje': _mensaje(cita.fecha),
+                    'estado': estado,
+                    'ahora': ahora,
+                    'error': error,
+                })
+            try:
+                with engine.begin() as conn:
+                    conn.execute(_SQL_ENCOLAR, filas)
+            except IntegrityError:
+                # Otro proceso encoló alguna de estas citas a la vez; la
+                # siguiente ejecución recoge las que falten
+                logger.warning('Recordatorios duplicados al encolar %d citas; se reintentará', len(filas))
+                return total
+            total += len(filas)
+
+    # ==================== ENVIAR ====================
+
+    async def _enviar_todos(self, mensajes):
+        semaforo = asyncio.Semaphore(self.concurrencia)
+
+        async def enviar(mensaje):
+            async with semaforo:
+                await self.enviador.enviar(mensaje)
+
+        return await asyncio.gather(*(enviar(mensaje) for mensaje in mensajes), return_exceptions=True)
+
+    def enviar(self, engine, ahora=None, shard=PRINCIPAL):
+        """Envía los recordatorios pendientes de la bandeja del shard. Retorna
+        el número de enviados."""
+        # La clave de idempotencia de la pasarela distingue los id_recordatorio de cada shard
+        prefijo = 'recordatorio-' if shard == PRINCIPAL else f'recordatorio-{shard}-'
+        total = 0
+        while True:
+            ahora_lote = ahora or datetime.now()
+            with engine.connect() as conn:
+                pendientes = conn.execute(_SQL_PENDIENTES, {'ahora': ahora_lote, 'limite': self.lote}).all()
+            if not pendientes:
+                return total
+
+            vigentes, descartados = [], []
+            for fila in pendientes:
+                vigente = (fila.estado_cita == 'PROGRAMADA' and fila.fecha_actual == fila.fecha_cita
+                           and fila.fecha_cita > ahora_lote)
+                (vigentes if vigente else descartados).append(fila)
+
+            # Los envíos se hacen fuera de cualquier transacción
+            resultados = cliente_http.ejecutar(self._enviar_todos([{
+                'clave': f'{prefijo}{fila.id_recordatorio}',
+                'canal': fila.canal,
+                'destino': fila.destino,
+                'mensaje': fila.mensaje,
+            } for fila in vigentes]))
+
+            enviados = [fila.id_recordatorio for fila, error in zip(vigentes, resultados) if error is None]
+            reintentos = []
+            for fila, error in zip(vigentes, resultados):
+                if error is None:
+                    continue
+                intentos = fila.intentos + 1
+                reintentos.append({
+                    'id_recordatorio': fila.id_recordatorio,
+                    'estado': 'FALLIDO' if intentos >= self.max_intentos else 'PENDIENTE',
+                    'intentos': intentos,
+                    'proximo_intento': ahora_lote + timedelta(seconds=self.reintento * 2 ** fila.intentos),
+                    'error': f'{type(error).__name__}: {error}'[:255],
+                })
+            with engine.begin() as conn:
+                if enviados:
+                    conn.execute(_SQL_MARCAR, {'estado': 'ENVIADO', 'enviado_en': ahora_lote, 'ids': enviados})
+                if descartados:
+                    conn.execute(_SQL_MARCAR, {
+                        'estado': 'DESCARTADO', 'enviado_en': None,
+                        'ids': [fila.id_recordatorio for fila in descartados],
+                    })
+                if reintentos:
+                    conn.execute(_SQL_REINTENTAR, reintentos)
+            total += len(enviados)
+            if reintentos:
+                logger.warning('%d recordatorios no se pudieron enviar; se reintentarán', len(reintentos))
+
+
+recordatorios = Recordatorios()
+
+
+@tareas.periodica('recordatorios', intervalo=0)
+def _recordatorios(app):
+    encolados = enviados = 0
+    # Cada shard tiene la bandeja de sus citas
+    for nombre, engine in shards.engines().items():
+        encolados += recordatorios.encolar(engine)
+        enviados += recordatorios.enviar(engine, shard=nombre)
+    logger.info('Recordatorios: %d encolados, %d enviados', encolados, enviados)
+    return enviados
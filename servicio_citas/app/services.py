@@ -1,68 +1,228 @@
-import requests
+import threading
+import time
+from collections import OrderedDict
+import httpx
 from flask import current_app
+from flask_jwt_extended import create_access_token
+from odontocare_comun.cliente_http import cliente_http
+from odontocare_comun.metricas import metricas
+from odontocare_comun.trazas import trazador
 
 class ServicioUsuarios:
     """Cliente para comunicarse con el servicio de usuarios via REST"""
     
+    # Perfiles (/auth/perfil) en memoria del proceso: {id_user: (expira, perfil)}
+    _perfiles = OrderedDict()
+    _lock_perfiles = threading.Lock()
+    MAX_PERFILES = 10000
+    
     @staticmethod
     def _get_base_url():
         return current_app.config.get('SERVICIO_USUARIOS_URL', 'http://localhost:5000')
     
     @staticmethod
     def _get_headers(token):
-        return {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'}
+        # httpx ya anuncia gzip (y br si está instalado brotli) en Accept-Encoding;
+        # return=minimal evita los indicadores existe/activo, que se deducen aquí
+        return {
+            'Authorization': f'Bearer {token}',
+            'Content-Type': 'application/json',
+            'Prefer': 'return=minimal',
+        }
+    
+    @classmethod
+    async def _get_async(cls, operacion, url, headers):
+        """GET en el bucle del cliente HTTP registrando latencia y errores"""
+        inicio = time.perf_counter()
+        error = True
+        try:
+            response = await cliente_http.peticion('GET', url, headers=headers, timeout=5)
+            error = response.status_code >= 500
+            return response
+        finally:
+            metricas.observar_llamada('servicio_usuarios', operacion, time.perf_counter() - inicio, error)
+    
+    @classmethod
+    def _get_varios(cls, peticiones, token):
+        """GET simultáneos al servicio de usuarios, cada uno con su span de cliente.
+        
+        `peticiones` es una lista de (operacion, ruta). Devuelve en el mismo
+        orden la respuesta de cada una o el error de conexión que produjo.
+        """
+        base_url = cls._get_base_url()
+        spans, corrutinas = [], []
+        for operacion, ruta in peticiones:
+            span = trazador.iniciar_span(f'GET servicio_usuarios {operacion}', tipo='cliente', **{'http.url': ruta})
+            headers = {**cls._get_headers(token), **trazador.cabeceras(span)}
+            spans.append(span)
+            corrutinas.append(cls._get_async(operacion, f"{base_url}{ruta}", headers))
+        
+        resultados = cliente_http.reunir(*corrutinas, devolver_excepciones=True)
+        
+        for span, resultado in zip(spans, resultados):
+            if isinstance(resultado, Exception):
+                if span:
+                    span['atributos']['error'] = type(resultado).__name__
+                trazador.terminar_span(span, error=True)
+            else:
+                if span:
+                    span['atributos']['http.status_code'] = resultado.status_code
+                trazador.terminar_span(span)
+        for resultado in resultados:
+            if isinstance(resultado, Exception) and not isinstance(resultado, httpx.HTTPError):
+                raise resultado
+        return resultados
+    
+    # ==================== INTERPRETACIÓN DE RESPUESTAS ====================
+    
+    @staticmethod
+    def _fallo(response):
+        """Error de una consulta que no llegó a responder si el registro existe
+        (sin conexión, limitador o fallo del servicio), o None. `reintentar`
+        es el Retry-After del servicio de usuarios, si lo indicó."""
+        if isinstance(response, httpx.HTTPError):
+            return {'error': str(response), 'reintentar': None}
+        if response.status_code == 429 or response.status_code >= 500:
+            return {
+                'error': f'El servicio de usuarios respondió {response.status_code}',
+                'reintentar': response.headers.get('Retry-After'),
+            }
+        return None
+    
+    @classmethod
+    def _info_doctor(cls, response):
+        fallo = cls._fallo(response)
+        if fallo:
+            return {'existe': False, **fallo}
+        if response.status_code == 200:
+            data = response.json()
+            return {'existe': True, 'doctor': data}
+        return {'existe': False, 'doctor': None}
+    
+    @classmethod
+    def _info_paciente(cls, response):
+        fallo = cls._fallo(response)
+        if fallo:
+            return {'existe': False, 'activo': False, **fallo}
+        if response.status_code == 200:
+            data = response.json()
+            return {
+                'existe': True, 
+                'activo': data.get('estado') == 'ACTIVO',
+                'paciente': data
+            }
+        return {'existe': False, 'activo': False, 'paciente': None}
+    
+    @classmethod
+    def _info_centro(cls, response):
+        fallo = cls._fallo(response)
+        if fallo:
+            return {'existe': False, **fallo}
+        if response.status_code == 200:
+            data = response.json()
+            return {'existe': True, 'centro': data}
+        return {'existe': False, 'centro': None}
+    
+    # ==================== VERIFICACIONES ====================
     
     @classmethod
     def verificar_doctor(cls, id_doctor, token):
         """Verifica si un doctor existe consultando el servicio de usuarios"""
-        try:
-            url = f"{cls._get_base_url()}/admin/doctores/{id_doctor}"
-            response = requests.get(url, headers=cls._get_headers(token), timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                return {'existe': True, 'doctor': data}
-            return {'existe': False, 'doctor': None}
-        except requests.RequestException as e:
-            return {'existe': False, 'error': str(e)}
+        return cls.verificar_cita(id_doctor, None, None, token)[0]
     
     @classmethod
     def verificar_paciente(cls, id_paciente, token):
         """Verifica si un paciente existe y está activo"""
-        try:
-            url = f"{cls._get_base_url()}/admin/pacientes/{id_paciente}"
-            response = requests.get(url, headers=cls._get_headers(token), timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                return {
-                    'existe': True, 
-                    'activo': data.get('estado') == 'ACTIVO',
-                    'paciente': data
-                }
-            return {'existe': False, 'activo': False, 'paciente': None}
-        except requests.RequestException as e:
-            return {'existe': False, 'activo': False, 'error': str(e)}
+        return cls.verificar_cita(None, id_paciente, None, token)[1]
     
     @classmethod
     def verificar_centro(cls, id_centro, token):
         """Verifica si un centro médico existe"""
-        try:
-            url = f"{cls._get_base_url()}/admin/centros/{id_centro}"
-            response = requests.get(url, headers=cls._get_headers(token), timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                return {'existe': True, 'centro': data}
-            return {'existe': False, 'centro': None}
-        except requests.RequestException as e:
-            return {'existe': False, 'error': str(e)}
+        return cls.verificar_cita(None, None, id_centro, token)[2]
+    
+    @classmethod
+    def verificar_cita(cls, id_doctor, id_paciente, id_centro, token):
+        """Verifica doctor, paciente y centro de una cita con peticiones simultáneas.
+        
+        Devuelve (doctor_info, paciente_info, centro_info); los identificadores
+        None no se consultan y su resultado es None.
+        """
+        consultas = [
+            (id_doctor, 'verificar_doctor', '/admin/doctores/{}', cls._info_doctor),
+            (id_paciente, 'verificar_paciente', '/admin/pacientes/{}', cls._info_paciente),
+            (id_centro, 'verificar_centro', '/admin/centros/{}', cls._info_centro),
+        ]
+        pendientes = [c for c in consultas if c[0] is not None]
+        resultados = iter(cls._get_varios(
+            [(operacion, ruta.format(id_)) for id_, operacion, ruta, _ in pendientes], token
+        ))
+        return tuple(
+            interpretar(next(resultados)) if id_ is not None else None
+            for id_, _, _, interpretar in consultas
+        )
+    
+    # ==================== CONSULTAS EN LOTE ====================
+    
+    @staticmethod
+    def token_servicio():
+        """JWT del propio servicio para llamadas sin usuario (tareas en segundo
+        plano). El servicio de usuarios lo acepta porque comparten JWT_SECRET_KEY."""
+        return create_access_token(identity={'id_user': 0, 'nombre_usuario': 'servicio_citas', 'rol': 'admin'})
+    
+    @classmethod
+    def obtener_pacientes(cls, ids, token, tamano_lote=200):
+        """Datos de varios pacientes con una petición por cada `tamano_lote` ids,
+        todas simultáneas. Devuelve {id_paciente: paciente}, sin los que no
+        existen; lanza httpx.HTTPError si alguna petición falla."""
+        ids = sorted(set(ids))
+        respuestas = cls._get_varios([
+            ('obtener_pacientes', f"/admin/pacientes?ids={','.join(map(str, ids[i:i + tamano_lote]))}")
+            for i in range(0, len(ids), tamano_lote)
+        ], token)
+        pacientes = {}
+        for response in respuestas:
+            if isinstance(response, httpx.HTTPError):
+                raise response
+            response.raise_for_status()
+            for paciente in response.json()['pacientes']:
+                pacientes[paciente['id_paciente']] = paciente
+        return pacientes
+    
+    @classmethod
+    def obtener_perfil(cls, id_user, token):
+        """id_paciente e id_doctor asociados al usuario del token.
+        
+        La asociación casi nunca cambia, así que se guarda PERFIL_CACHE_TTL
+        segundos en memoria y la mayoría de peticiones no llaman al servicio
+        de usuarios. Si no responde, devuelve {'error': ...}.
+        """
+        ahora = time.monotonic()
+        with cls._lock_perfiles:
+            guardado = cls._perfiles.get(id_user)
+            if guardado and guardado[0] > ahora:
+                cls._perfiles.move_to_end(id_user)
+                return guardado[1]
+        
+        response, = cls._get_varios([('obtener_perfil', '/auth/perfil')], token)
+        if isinstance(response, httpx.HTTPError):
+            return {'error': str(response)}
+        if response.status_code != 200:
+            return {'error': f'El servicio de usuarios respondió {response.status_code}'}
+        perfil = response.json()
+        
+        with cls._lock_perfiles:
+            cls._perfiles[id_user] = (ahora + current_app.config.get('PERFIL_CACHE_TTL', 300), perfil)
+            cls._perfiles.move_to_end(id_user)
+            while len(cls._perfiles) > cls.MAX_PERFILES:
+                cls._perfiles.popitem(last=False)
+        return perfil
     
     @classmethod
     def verificar_token(cls, token):
         """Verifica si el token es válido"""
-        try:
-            url = f"{cls._get_base_url()}/auth/verificar"
-            response = requests.get(url, headers=cls._get_headers(token), timeout=5)
-            if response.status_code == 200:
-                return response.json()
-            return {'valido': False}
-        except requests.RequestException as e:
-            return {'valido': False, 'error': str(e)}
+        response, = cls._get_varios([('verificar_token', '/auth/verificar')], token)
+        if isinstance(response, httpx.HTTPError):
+            return {'valido': False, 'error': str(response)}
+        if response.status_code == 200:
+            return response.json()
+        return {'valido': False}
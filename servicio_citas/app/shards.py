@@ -0,0 +1,185 @@
+"""
+Reparto de las citas en varias bases de datos (shards) por centro.
+
+Cada centro pertenece a un shard, una base de datos completa del servicio
+(citas, archivo, historial y recordatorios) de una región o grupo de
+centros. La base de datos principal (DATABASE_URL) es el shard "principal"
+y guarda además lo que no depende del centro: el directorio de citas, las
+claves de idempotencia y los turnos de las tareas.
+
+El directorio (tabla citas_directorio del principal) reparte los id_cita,
+que siguen siendo únicos en todo el servicio, y guarda el shard de cada
+cita; así las operaciones por id van directamente a un shard. Con un solo
+shard (por defecto) todas las citas están en el principal y el directorio
+no se consulta.
+
+Las consultas de un solo centro leen un shard; las que abarcan varios
+centros (listados sin id_centro, citas de un paciente o un doctor) se lanzan
+a la vez en todos los shards con reunir() y sus resultados se mezclan.
+
+Configuración (variables de entorno):
+    CITAS_SHARDS          shards adicionales, "nombre=url;nombre=url" (vacío)
+    CITAS_SHARDS_CENTROS  centros de cada shard, "nombre:1,2;nombre:3" (vacío)
+    CITAS_SHARD_DEFECTO   shard de los centros no asignados (principal)
+    CITAS_SHARDS_HILOS    consultas simultáneas a los shards por proceso (8)
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import g
+from sqlalchemy.orm import Session
+from app import db
+from app.models import CitaDirectorio
+
+PRINCIPAL = 'principal'
+
+
+def _pares(valor, separador):
+    """[(clave, valor)] de una lista "clave<separador>valor;..." de la configuración"""
+    pares = []
+    for parte in (valor or '').split(';'):
+        if parte.strip():
+            clave, _, resto = parte.partition(separador)
+            pares.append((clave.strip(), resto.strip()))
+    return pares
+
+
+class Shards:
+    """Enrutado de las citas al shard de su centro"""
+
+    def __init__(self):
+        self._nombres = [PRINCIPAL]
+        self._centros = {}
+        self._defecto = PRINCIPAL
+        self._hilos = 8
+        self._ejecutor = None
+        self._ejecutor_pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Registra los shards como binds de SQLAlchemy (antes de db.init_app),
+        de modo que las métricas y el perfilador también los observan"""
+        app.config.setdefault('CITAS_SHARDS', os.environ.get('CITAS_SHARDS', ''))
+        app.config.setdefault('CITAS_SHARDS_CENTROS', os.environ.get('CITAS_SHARDS_CENTROS', ''))
+        app.config.setdefault('CITAS_SHARD_DEFECTO', os.environ.get('CITAS_SHARD_DEFECTO', PRINCIPAL))
+        app.config.setdefault('CITAS_SHARDS_HILOS', int(os.environ.get('CITAS_SHARDS_HILOS', 8)))
+
+        urls = dict(_pares(app.config['CITAS_SHARDS'], '='))
+        if PRINCIPAL in urls:
+            raise ValueError(f'CITAS_SHARDS: "{PRINCIPAL}" es la base de datos de DATABASE_URL')
+        self._nombres = [PRINCIPAL, *urls]
+        app.config['SQLALCHEMY_BINDS'] = {
+            **app.config.get('SQLALCHEMY_BINDS', {}),
+            **{self._bind(nombre): url for nombre, url in urls.items()},
+        }
+
+        self._centros = {}
+        for nombre, centros in _pares(app.config['CITAS_SHARDS_CENTROS'], ':'):
+            if nombre not in self._nombres:
+                raise ValueError(f'CITAS_SHARDS_CENTROS: shard desconocido "{nombre}"')
+            for id_centro in centros.split(','):
+                self._centros[int(id_centro)] = nombre
+        self._defecto = app.config['CITAS_SHARD_DEFECTO']
+        if self._defecto not in self._nombres:
+            raise ValueError(f'CITAS_SHARD_DEFECTO: shard desconocido "{self._defecto}"')
+        self._hilos = app.config['CITAS_SHARDS_HILOS']
+
+        app.teardown_appcontext(self._cerrar_sesiones)
+
+    @staticmethod
+    def _bind(nombre):
+        return f'citas_{nombre}'
+
+    # ==================== ENRUTADO ====================
+
+    def nombres(self):
+        """Nombres de los shards, el principal primero"""
+        return list(self._nombres)
+
+    def de_centro(self, id_centro):
+        """Shard de las citas del centro"""
+        return self._centros.get(int(id_centro), self._defecto)
+
+    def de_cita(self, id_cita):
+        """Shard de la cita, o None si no existe"""
+        if len(self._nombres) == 1:
+            return PRINCIPAL
+        return db.session.query(CitaDirectorio.shard).filter_by(id_cita=id_cita).scalar()
+
+    def engine(self, nombre):
+        return db.engine if nombre == PRINCIPAL else db.engines[self._bind(nombre)]
+
+    def engines(self):
+        """{nombre: engine} de todos los shards"""
+        return {nombre: self.engine(nombre) for nombre in self._nombres}
+
+    def sesion(self, nombre):
+        """Sesión del shard para la petición en curso (db.session en el principal)"""
+        if nombre == PRINCIPAL:
+            return db.session
+        sesiones = g.setdefault('sesiones_shards', {})
+        if nombre not in sesiones:
+            sesiones[nombre] = Session(self.engine(nombre))
+        return sesiones[nombre]
+
+    def _cerrar_sesiones(self, excepcion=None):
+        for sesion in g.pop('sesiones_shards', {}).values():
+            sesion.close()
+
+    # ==================== ESCRITURA ====================
+
+    def crear(self, cita):
+        """Guarda una cita nueva en el shard de su centro con un id_cita del
+        directorio. Retorna el nombre del shard."""
+        nombre = self.de_centro(cita.id_centro)
+        entrada = CitaDirectorio(shard=nombre)
+        db.session.add(entrada)
+        db.session.flush()
+        cita.id_cita = entrada.id_cita
+        if nombre == PRINCIPAL:
+            # Cita y directorio en la misma transacción
+            db.session.add(cita)
+            db.session.commit()
+            return nombre
+
+        db.session.commit()
+        sesion = self.sesion(nombre)
+        try:
+            sesion.add(cita)
+            sesion.commit()
+        except Exception:
+            sesion.rollback()
+            db.session.delete(entrada)
+            db.session.commit()
+            raise
+        return nombre
+
+    # ==================== CONSULTAS EN PARALELO ====================
+
+    def _ejecutor_hilos(self):
+        # Se crea en el primer uso, en cada proceso (los hilos no sobreviven a un fork)
+        if self._ejecutor_pid != os.getpid():
+            with self._lock:
+                if self._ejecutor_pid != os.getpid():
+                    self._ejecutor = ThreadPoolExecutor(self._hilos, thread_name_prefix='shards')
+                    self._ejecutor_pid = os.getpid()
+        return self._ejecutor
+
+    def reunir(self, funcion, nombres=None):
+        """Ejecuta funcion(sesion) en cada shard de `nombres` (todos por
+        defecto) a la vez, cada una con su propia sesión, y retorna los
+        resultados en el mismo orden. `funcion` no debe usar la petición:
+        se ejecuta en otro hilo."""
+        engines = [self.engine(nombre) for nombre in (nombres or self._nombres)]
+
+        def ejecutar(engine):
+            with Session(engine) as sesion:
+                return funcion(sesion)
+
+        if len(engines) == 1:
+            return [ejecutar(engines[0])]
+        return list(self._ejecutor_hilos().map(ejecutar, engines))
+
+
+shards = Shards()
@@ -0,0 +1,256 @@
+"""
+Tareas periódicas en segundo plano.
+
+Las tareas sobre citas recorren todos los shards (ver app/shards.py); los
+turnos se guardan en la base de datos principal.
+
+Cada proceso arranca, con la primera petición que atiende, un hilo que
+revisa las tareas registradas con @tareas.periodica y ejecuta las que
+toquen. El hilo no atiende peticiones, así que una tarea larga no retrasa
+ninguna respuesta.
+
+Con varios workers o réplicas, la tabla tareas_bloqueos decide quién
+ejecuta cada tarea: un UPDATE condicional toma el turno solo si no lo tiene
+otro proceso (expira ya pasó) y si la última ejecución es más antigua que
+el intervalo. Si un proceso muere con el turno tomado, otro lo recupera
+cuando expira.
+
+Tareas incluidas:
+    completar_citas   marca COMPLETADA las citas PROGRAMADA cuya hora pasó
+                      hace más de TAREAS_COMPLETAR_TRAS_MINUTOS, por lotes
+    archivar_citas    mueve al archivo las citas terminadas anteriores a
+                      ARCHIVO_HORIZONTE_DIAS (desactivada por defecto)
+
+Configuración (variables de entorno):
+    TAREAS_ACTIVAS                 1 para arrancar el hilo (1)
+    TAREAS_PULSO                   segundos entre revisiones de las tareas (15)
+    TAREAS_BLOQUEO                 segundos que dura un turno tomado (600)
+    TAREAS_LOTE                    filas modificadas por transacción (1000)
+    TAREAS_INTERVALO_<NOMBRE>      segundos entre ejecuciones de la tarea;
+                                   0 la desactiva
+    TAREAS_COMPLETAR_TRAS_MINUTOS  margen tras la hora de la cita (60)
+
+También se pueden ejecutar a mano: `python tareas.py --una-vez`.
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import DateTime, bindparam, text
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger('odontocare.tareas')
+
+_SQL_TOMAR = text(
+    'UPDATE tareas_bloqueos SET propietario = :propietario, expira = :expira '
+    'WHERE nombre = :nombre AND expira <= :ahora '
+    'AND (ultima_ejecucion IS NULL OR ultima_ejecucion <= :desde)'
+)
+_SQL_CREAR = text(
+    'INSERT INTO tareas_bloqueos (nombre, propietario, expira) VALUES (:nombre, :propietario, :expira)'
+)
+_SQL_SOLTAR = text(
+    'UPDATE tareas_bloqueos SET propietario = NULL, expira = :ahora, '
+    'ultima_ejecucion = :inicio, ultimo_resultado = :resultado '
+    'WHERE nombre = :nombre AND propietario = :propietario'
+)
+_SQL_ESTADO = text(
+    'SELECT nombre, propietario, expira, ultima_ejecucion, ultimo_resultado FROM tareas_bloqueos'
+).columns(expira=DateTime, ultima_ejecucion=DateTime)
+
+
+class Tareas:
+    """Registro de tareas periódicas y hilo que las ejecuta"""
+
+    def __init__(self):
+        self._tareas = {}
+        self._app = None
+        self._lock = threading.Lock()
+        self._pid = None
+        self._parar = threading.Event()
+
+    def init_app(self, app):
+        app.config.setdefault('TAREAS_ACTIVAS', os.environ.get('TAREAS_ACTIVAS', '1') == '1')
+        app.config.setdefault('TAREAS_PULSO', float(os.environ.get('TAREAS_PULSO', 15)))
+        app.config.setdefault('TAREAS_BLOQUEO', int(os.environ.get('TAREAS_BLOQUEO', 600)))
+        app.config.setdefault('TAREAS_LOTE', int(os.environ.get('TAREAS_LOTE', 1000)))
+        app.config.setdefault('TAREAS_COMPLETAR_TRAS_MINUTOS',
+                              int(os.environ.get('TAREAS_COMPLETAR_TRAS_MINUTOS', 60)))
+        for nombre, (_, intervalo) in self._tareas.items():
+            clave = f'TAREAS_INTERVALO_{nombre.upper()}'
+            app.config.setdefault(clave, int(os.environ.get(clave, intervalo)))
+        self._app = app
+
+        if app.config['TAREAS_ACTIVAS']:
+            # Se arranca con la primera petición y no en create_app, para que
+            # migrate.py y los demás comandos no lancen el hilo
+            app.before_request(self._arrancar)
+
+    # ==================== REGISTRO ====================
+
+    def periodica(self, nombre, intervalo):
+        """Decorador: registra `f(app)` para ejecutarse cada `intervalo`
+        segundos (0: desactivada salvo que la configuración diga otra cosa).
+        Debe devolver el número de filas tratadas o None."""
+        def registrar(f):
+            self._tareas[nombre] = (f, intervalo)
+            return f
+        return registrar
+
+    def nombres(self):
+        return list(self._tareas)
+
+    def intervalo(self, app, nombre):
+        return app.config.get(f'TAREAS_INTERVALO_{nombre.upper()}', self._tareas[nombre][1])
+
+    # ==================== TURNOS ====================
+
+    @staticmethod
+    def propietario():
+        """Identifica al proceso que tiene un turno"""
+        return f'{socket.gethostname()}:{os.getpid()}'
+
+    def _tomar(self, engine, nombre, intervalo):
+        """Toma el turno de la tarea si está libre y le toca ejecutarse"""
+        ahora = datetime.utcnow()
+        parametros = {
+            'nombre': nombre,
+            'propietario': self.propietario(),
+            'expira': ahora + timedelta(seconds=self._app.config['TAREAS_BLOQUEO']),
+            'ahora': ahora,
+            'desde': ahora - timedelta(seconds=intervalo),
+        }
+        with engine.begin() as conn:
+            if conn.execute(_SQL_TOMAR, parametros).rowcount:
+                return True
+        try:
+            with engine.begin() as conn:
+                conn.execute(_SQL_CREAR, parametros)
+            return True
+        except IntegrityError:
+            # La fila ya existe y el turno lo tiene otro proceso (o aún no toca)
+            return False
+
+    def _soltar(self, engine, nombre, inicio, resultado):
+        with engine.begin() as conn:
+            conn.execute(_SQL_SOLTAR, {
+                'nombre': nombre,
+                'propietario': self.propietario(),
+                'ahora': datetime.utcnow(),
+                'inicio': inicio,
+                'resultado': resultado,
+            })
+
+    def ejecutar(self, app, nombre, forzar=False):
+        """Ejecuta la tarea si consigue su turno. Con `forzar` no se respeta
+        el intervalo, pero sí el turno de otro proceso. Retorna
+        (ejecutada, resultado)."""
+        from app import db
+
+        funcion = self._tareas[nombre][0]
+        with app.app_context():
+            intervalo = 0 if forzar else self.intervalo(app, nombre)
+            if not self._tomar(db.engine, nombre, intervalo):
+                return False, None
+            inicio = datetime.utcnow()
+            resultado = None
+            try:
+                resultado = funcion(app)
+                logger.info('Tarea %s: %s filas en %.1fs', nombre, resultado,
+                            (datetime.utcnow() - inicio).total_seconds())
+            finally:
+                # También tras un error: se reintenta en el siguiente intervalo
+                self._soltar(db.engine, nombre, inicio, resultado)
+                db.session.remove()
+        return True, resultado
+
+    def estado(self, app):
+        from app import db
+
+        with app.app_context(), db.engine.connect() as conn:
+            return {fila.nombre: fila for fila in conn.execute(_SQL_ESTADO)}
+
+    # ==================== HILO ====================
+
+    def _arrancar(self):
+        # Un hilo por proceso: tras un fork (gunicorn) el del padre no existe
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._parar.clear()
+            threading.Thread(target=self._bucle, args=(self._app,), name='tareas', daemon=True).start()
+            self._pid = os.getpid()
+
+    def _bucle(self, app):
+        proximas = dict.fromkeys(self._tareas, 0.0)
+        while True:
+            for nombre in self._tareas:
+                intervalo = self.intervalo(app, nombre)
+                if not intervalo or time.monotonic() < proximas[nombre]:
+                    continue
+                proximas[nombre] = time.monotonic() + intervalo
+                try:
+                    self.ejecutar(app, nombre)
+                except Exception:
+                    logger.exception('Error en la tarea %s', nombre)
+            if self._parar.wait(app.config['TAREAS_PULSO']):
+                return
+
+    def parar(self):
+        self._parar.set()
+        self._pid = None
+
+
+tareas = Tareas()
+
+
+# ==================== TAREAS ====================
+
+_SQL_PASADAS = text(
+    "SELECT id_cita FROM citas WHERE estado = 'PROGRAMADA' AND fecha < :antes_de ORDER BY fecha LIMIT :limite"
+)
+_SQL_COMPLETAR = text(
+    "UPDATE citas SET estado = 'COMPLETADA' "
+    "WHERE id_cita IN :ids AND estado = 'PROGRAMADA' AND fecha < :antes_de"
+).bindparams(bindparam('ids', expanding=True))
+
+
+def completar_citas_pasadas(engine, antes_de, tamano_lote=1000):
+    """Marca COMPLETADA las citas PROGRAMADA con fecha < antes_de.
+
+    Cada lote va en su propia transacción para que los bloqueos sean cortos;
+    el índice (estado, fecha) hace que cada lote lea solo las filas que
+    cambia. Retorna el número de citas completadas.
+    """
+    total = 0
+    while True:
+        with engine.begin() as conn:
+            ids = [fila[0] for fila in conn.execute(_SQL_PASADAS, {'antes_de': antes_de, 'limite': tamano_lote})]
+            if not ids:
+                return total
+            total += conn.execute(_SQL_COMPLETAR, {'ids': ids, 'antes_de': antes_de}).rowcount
+
+
+@tareas.periodica('completar_citas', intervalo=300)
+def _completar_citas(app):
+    from app.shards import shards
+
+    # Las fechas de las citas son horas locales sin zona: se comparan con datetime.now()
+    antes_de = datetime.now() - timedelta(minutes=app.config['TAREAS_COMPLETAR_TRAS_MINUTOS'])
+    return sum(completar_citas_pasadas(engine, antes_de, app.config['TAREAS_LOTE'])
+               for engine in shards.engines().values())
+
+
+@tareas.periodica('archivar_citas', intervalo=0)
+def _archivar_citas(app):
+    from app.archivo import archivar_citas, horizonte
+    from app.shards import shards
+
+    antes_de = horizonte(int(os.environ.get('ARCHIVO_HORIZONTE_DIAS', 365)))
+    return sum(archivar_citas(engine, antes_de, app.config['TAREAS_LOTE'])
+               for engine in shards.engines().values())
@@ -0,0 +1,55 @@
+"""
+Comando de archivo del servicio de citas.
+
+Mueve a la tabla citas_archivo las citas COMPLETADA o CANCELADA anteriores
+al horizonte, por lotes y sin detener el servicio, en cada shard.
+
+Uso:
+    python archivar.py                # archiva con ARCHIVO_HORIZONTE_DIAS (365)
+    python archivar.py --dias 180     # archiva lo anterior a 180 días
+    python archivar.py --estado       # muestra el tamaño de cada tabla
+"""
+
+import argparse
+import os
+import time
+from app import create_app
+from app.archivo import ESTADOS_ARCHIVABLES, archivar_citas, fecha_limite_archivo, horizonte
+from app.models import Cita, CitaArchivada
+from app.shards import shards
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Archivo de citas antiguas')
+    parser.add_argument('--dias', type=int, default=int(os.environ.get('ARCHIVO_HORIZONTE_DIAS', 365)),
+                        help='Antigüedad mínima (en días) de las citas a archivar')
+    parser.add_argument('--lote', type=int, default=1000, help='Citas movidas por transacción')
+    parser.add_argument('--estado', action='store_true', help='Solo mostrar el tamaño de cada tabla')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        antes_de = horizonte(args.dias)
+
+        if args.estado:
+            for shard in shards.nombres():
+                sesion = shards.sesion(shard)
+                archivables = sesion.query(Cita).filter(
+                    Cita.fecha < antes_de, Cita.estado.in_(ESTADOS_ARCHIVABLES)
+                ).count()
+                print(f"Shard {shard}:")
+                print(f"  citas:          {sesion.query(Cita).count()}")
+                print(f"  archivables:    {archivables} (anteriores a {antes_de:%Y-%m-%d})")
+                print(f"  citas_archivo:  {sesion.query(CitaArchivada).count()}")
+                print(f"  más reciente:   {fecha_limite_archivo(sesion) or '-'}")
+            return
+
+        for shard, engine in shards.engines().items():
+            inicio = time.perf_counter()
+            total = archivar_citas(engine, antes_de, args.lote)
+            print(f"[OK] Shard {shard}: citas archivadas: {total} (anteriores a {antes_de:%Y-%m-%d}) "
+                  f"en {time.perf_counter() - inicio:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Comando de migración del servicio de citas.
+
+Aplica las migraciones de esquema pendientes en la base de datos principal
+y en cada shard de CITAS_SHARDS. Debe ejecutarse antes de arrancar los
+workers de la aplicación, que ya no ejecutan DDL al iniciar.
+
+Uso:
+    python migrate.py              # aplica todas las migraciones pendientes
+    python migrate.py --estado     # muestra las migraciones pendientes
+    python migrate.py --hasta 3    # aplica las pendientes hasta la versión 3
+"""
+
+import argparse
+from app import create_app
+from app.migraciones import aplicar_migraciones, migraciones_pendientes
+from app.shards import shards
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Migraciones del servicio de citas')
+    parser.add_argument('--estado', action='store_true', help='Solo mostrar migraciones pendientes')
+    parser.add_argument('--hasta', type=int, default=None, help='Versión máxima a aplicar')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        engines = shards.engines()
+        for shard, engine in engines.items():
+            if len(engines) > 1:
+                print(f"Shard {shard}:")
+
+            if args.estado:
+                pendientes = migraciones_pendientes(engine)
+                if not pendientes:
+                    print("[OK] Esquema actualizado, no hay migraciones pendientes")
+                for version, nombre in pendientes:
+                    print(f"  [PENDIENTE] {nombre}")
+                continue
+
+            aplicadas = aplicar_migraciones(engine, hasta=args.hasta)
+            for nombre in aplicadas:
+                print(f"  [OK] Migración aplicada: {nombre}")
+            print(f"\nTotal migraciones aplicadas: {len(aplicadas)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Comando de tareas periódicas del servicio de citas.
+
+Los workers ejecutan las tareas en un hilo propio (ver app/tareas.py); este
+comando permite lanzarlas a mano o desde cron con TAREAS_ACTIVAS=0.
+
+Uso:
+    python tareas.py --una-vez                    # ejecuta las tareas a las que les toca
+    python tareas.py --una-vez --forzar           # ejecuta todas las activas ya
+    python tareas.py --tarea completar_citas      # ejecuta solo esa tarea (forzada)
+    python tareas.py --estado                     # muestra la última ejecución de cada tarea
+"""
+
+import argparse
+from app import create_app
+from app.tareas import tareas
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tareas periódicas del servicio de citas')
+    parser.add_argument('--una-vez', action='store_true', help='Ejecutar las tareas activas y terminar')
+    parser.add_argument('--forzar', action='store_true', help='No esperar al intervalo de cada tarea')
+    parser.add_argument('--tarea', default=None, help='Nombre de la única tarea a ejecutar')
+    parser.add_argument('--estado', action='store_true', help='Solo mostrar el estado de las tareas')
+    args = parser.parse_args()
+
+    app = create_app()
+
+    if args.estado or not (args.una_vez or args.tarea):
+        estado = tareas.estado(app)
+        for nombre in tareas.nombres():
+            fila = estado.get(nombre)
+            intervalo = tareas.intervalo(app, nombre)
+            periodo = f"cada {intervalo}s" if intervalo else 'desactivada'
+            ultima = f"{fila.ultima_ejecucion:%Y-%m-%d %H:%M:%S} ({fila.ultimo_resultado} filas)" \
+                if fila and fila.ultima_ejecucion else '-'
+            en_curso = f"  [EN CURSO: {fila.propietario}]" if fila and fila.propietario else ''
+            print(f"  {nombre:<18} {periodo:<12}  última: {ultima}{en_curso}")
+        return
+
+    if args.tarea:
+        if args.tarea not in tareas.nombres():
+            parser.error(f"Tarea desconocida: {args.tarea}")
+        nombres, forzar = [args.tarea], True
+    else:
+        nombres = [nombre for nombre in tareas.nombres() if tareas.intervalo(app, nombre)]
+        forzar = args.forzar
+
+    for nombre in nombres:
+        ejecutada, resultado = tareas.ejecutar(app, nombre, forzar=forzar)
+        if ejecutada:
+            print(f"  [OK] {nombre}: {resultado} filas")
+        else:
+            print(f"  [OMITIDA] {nombre}: no le toca o la está ejecutando otro proceso")
+
+
+if __name__ == '__main__':
+    main()
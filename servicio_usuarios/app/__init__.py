@@ -1,10 +1,11 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from flask_jwt_extended import JWTManager
 import os
+from app.identidad import JWTManagerCacheado
 
 db = SQLAlchemy()
-jwt = JWTManager()
+# JWTManager con caché de tokens ya verificados (ver app/identidad.py)
+jwt = JWTManagerCacheado()
 
 def create_app():
     app = Flask(__name__)
@@ -14,11 +15,30 @@ def create_app():
     app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///odontocare_usuarios.db')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'jwt-odontocare-secret-2024')
+    # Carga de paciente/doctor en /admin/usuarios/perfiles: selectin o joined
+    app.config['USUARIOS_CARGA_PERFILES'] = os.environ.get('USUARIOS_CARGA_PERFILES', 'selectin')
     
     # Inicializar extensiones
     db.init_app(app)
     jwt.init_app(app)
     
+    from odontocare_comun.metricas import metricas
+    from odontocare_comun.trazas import trazador
+    from odontocare_comun.perfilador import perfilador
+    from odontocare_comun.compresion import compresion
+    from app.cache_http import cache_http
+    from odontocare_comun.limitador import limitador
+    from odontocare_comun.idempotencia import idempotencia
+    from app.identidad import identidad
+    metricas.init_app(app)
+    trazador.init_app(app)
+    perfilador.init_app(app)
+    compresion.init_app(app)
+    cache_http.init_app(app)
+    limitador.init_app(app)
+    idempotencia.init_app(app)
+    identidad.init_app(app)
+    
     # Registrar blueprints
     from app.blueprints.auth import auth_bp
     from app.blueprints.admin import admin_bp
@@ -26,20 +46,6 @@ def create_app():
     app.register_blueprint(auth_bp, url_prefix='/auth')
     app.register_blueprint(admin_bp, url_prefix='/admin')
     
-    # Crear tablas
-    with app.app_context():
-        db.create_all()
-        # Crear usuario admin por defecto si no existe
-        from app.models import Usuario
-        admin = Usuario.query.filter_by(nombre_usuario='admin').first()
-        if not admin:
-            from werkzeug.security import generate_password_hash
-            admin = Usuario(
-                nombre_usuario='admin',
-                password=generate_password_hash('admin123'),
-                rol='admin'
-            )
-            db.session.add(admin)
-            db.session.commit()
+    # El esquema se gestiona con migraciones versionadas (python migrate.py)
     
     return app
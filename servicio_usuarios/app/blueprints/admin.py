@@ -1,11 +1,29 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, selectinload
 from werkzeug.security import generate_password_hash
+from odontocare_comun.trazas import trazador
+from odontocare_comun.limitador import limitador
+from odontocare_comun.idempotencia import idempotencia
 from app import db
-from app.models import Usuario, Paciente, Doctor, Centro
+from app.models import Usuario, Paciente, Doctor, Centro, normalizar_nombre
+from app.paginacion import listado
+from app.cache_http import cache_http
+from app.identidad import identidad
 
 admin_bp = Blueprint('admin', __name__)
 
+# Límite de ?ids= en los listados, para que la URL y el IN de SQL sean acotados
+MAX_IDS_POR_CONSULTA = 200
+
+# Estrategias de carga de Usuario.paciente y Usuario.doctor en los listados
+# combinados: selectin hace una consulta más por relación (IN con los ids de
+# la página) y joined lo resuelve todo en una con LEFT OUTER JOIN
+CARGAS_PERFILES = {'selectin': selectinload, 'joined': joinedload}
+POR_PAGINA_PERFILES = 50
+MAX_POR_PAGINA_PERFILES = 500
+
 
 def requiere_admin(func):
     """Decorador para verificar rol admin"""
@@ -20,10 +38,27 @@ def requiere_admin(func):
     return wrapper
 
 
+def respuesta_detalle(datos, **indicadores):
+    """Detalle de un registro con sus indicadores (existe, activo).
+
+    Con la cabecera "Prefer: return=minimal" se omiten los indicadores, que
+    el cliente deduce del código de estado y de los propios campos. Las dos
+    formas llevan "Vary: Prefer" para que ninguna caché sirva una por otra.
+    """
+    if 'return=minimal' in request.headers.get('Prefer', ''):
+        respuesta = jsonify(datos)
+        respuesta.headers['Preference-Applied'] = 'return=minimal'
+    else:
+        respuesta = jsonify({**datos, **indicadores})
+    respuesta.vary.add('Prefer')
+    return respuesta, 200
+
+
 # ==================== USUARIOS ====================
 
 @admin_bp.route('/usuario', methods=['POST'])
 @requiere_admin
+@idempotencia.idempotente
 def crear_usuario():
     """Crear un nuevo usuario"""
     data = request.get_json()
@@ -42,17 +77,23 @@ def crear_usuario():
     if rol not in roles_validos:
         return jsonify({'error': f'Rol inválido. Roles válidos: {roles_validos}'}), 400
     
-    if Usuario.query.filter_by(nombre_usuario=nombre_usuario).first():
-        return jsonify({'error': 'El nombre de usuario ya existe'}), 409
+    with trazador.span('password.hash'):
+        password_hash = generate_password_hash(password)
     
     nuevo_usuario = Usuario(
         nombre_usuario=nombre_usuario,
-        password=generate_password_hash(password),
+        password=password_hash,
         rol=rol
     )
     
+    # El índice único de nombre_normalizado decide si el nombre está libre,
+    # también entre altas simultáneas
     db.session.add(nuevo_usuario)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'El nombre de usuario ya existe'}), 409
     
     return jsonify({
         'mensaje': 'Usuario creado exitosamente',
@@ -62,12 +103,48 @@ def crear_usuario():
 
 @admin_bp.route('/usuarios', methods=['GET'])
 @requiere_admin
+@limitador.concurrente('listados')
 def listar_usuarios():
-    """Listar todos los usuarios"""
-    usuarios = Usuario.query.all()
+    """Listar usuarios: todos, o por páginas (ver app/paginacion.py)"""
+    return listado('usuarios', Usuario.query, Usuario)
+
+
+@admin_bp.route('/usuarios/perfiles', methods=['GET'])
+@requiere_admin
+@limitador.concurrente('listados')
+def listar_usuarios_perfiles():
+    """Usuarios con su paciente y su doctor, por páginas de id_user.
+    
+    Parámetros: limite (50, máximo 500), cursor (valor de "siguiente" de la
+    página anterior), rol y carga (selectin o joined; por defecto
+    USUARIOS_CARGA_PERFILES). El número de consultas no depende del tamaño
+    de la página.
+    """
+    carga = request.args.get('carga') or current_app.config['USUARIOS_CARGA_PERFILES']
+    if carga not in CARGAS_PERFILES:
+        return jsonify({'error': f'carga inválida. Valores válidos: {list(CARGAS_PERFILES)}'}), 400
+    
+    cargar = CARGAS_PERFILES[carga]
+    limite = min(max(request.args.get('limite', POR_PAGINA_PERFILES, type=int), 1), MAX_POR_PAGINA_PERFILES)
+    query = Usuario.query.options(cargar(Usuario.paciente), cargar(Usuario.doctor))
+    if request.args.get('rol'):
+        query = query.filter(Usuario.rol == request.args['rol'])
+    if request.args.get('cursor'):
+        try:
+            query = query.filter(Usuario.id_user > int(request.args['cursor']))
+        except ValueError:
+            return jsonify({'error': 'cursor inválido'}), 400
+    
+    usuarios = query.order_by(Usuario.id_user).limit(limite + 1).all()
+    siguiente = None
+    if len(usuarios) > limite:
+        usuarios = usuarios[:limite]
+        siguiente = str(usuarios[-1].id_user)
+    
     return jsonify({
+        'usuarios': [usuario.to_dict_perfiles() for usuario in usuarios],
         'total': len(usuarios),
-        'usuarios': [u.to_dict() for u in usuarios]
+        'siguiente': siguiente
     }), 200
 
 
@@ -75,16 +152,17 @@ def listar_usuarios():
 @requiere_admin
 def obtener_usuario(id_user):
     """Obtener un usuario por ID"""
-    usuario = Usuario.query.get(id_user)
+    usuario = identidad.usuario(id_user)
     if not usuario:
         return jsonify({'error': 'Usuario no encontrado'}), 404
-    return jsonify(usuario.to_dict()), 200
+    return jsonify(usuario), 200
 
 
 # ==================== DOCTORES ====================
 
 @admin_bp.route('/doctores', methods=['POST'])
 @requiere_admin
+@idempotencia.idempotente
 def crear_doctor():
     """Crear un nuevo doctor (y su usuario asociado)"""
     data = request.get_json()
@@ -104,16 +182,20 @@ def crear_doctor():
     
     # Si se proporcionan credenciales, crear usuario
     if nombre_usuario and password:
-        if Usuario.query.filter_by(nombre_usuario=nombre_usuario).first():
-            return jsonify({'error': 'El nombre de usuario ya existe'}), 409
+        with trazador.span('password.hash'):
+            password_hash = generate_password_hash(password)
         
         nuevo_usuario = Usuario(
             nombre_usuario=nombre_usuario,
-            password=generate_password_hash(password),
+            password=password_hash,
             rol='medico'
         )
         db.session.add(nuevo_usuario)
-        db.session.flush()
+        try:
+            db.session.flush()
+        except IntegrityError:
+            db.session.rollback()
+            return jsonify({'error': 'El nombre de usuario ya existe'}), 409
         id_user = nuevo_usuario.id_user
     
     nuevo_doctor = Doctor(
@@ -133,13 +215,11 @@ def crear_doctor():
 
 @admin_bp.route('/doctores', methods=['GET'])
 @jwt_required()
+@cache_http.condicional('doctores')
+@limitador.concurrente('listados')
 def listar_doctores():
-    """Listar todos los doctores"""
-    doctores = Doctor.query.all()
-    return jsonify({
-        'total': len(doctores),
-        'doctores': [d.to_dict() for d in doctores]
-    }), 200
+    """Listar doctores: todos, o por páginas (ver app/paginacion.py)"""
+    return listado('doctores', Doctor.query, Doctor)
 
 
 @admin_bp.route('/doctores/<int:id_doctor>', methods=['GET'])
@@ -149,13 +229,14 @@ def obtener_doctor(id_doctor):
     doctor = Doctor.query.get(id_doctor)
     if not doctor:
         return jsonify({'error': 'Doctor no encontrado', 'existe': False}), 404
-    return jsonify({**doctor.to_dict(), 'existe': True}), 200
+    return respuesta_detalle(doctor.to_dict(), existe=True)
 
 
 # ==================== PACIENTES ====================
 
 @admin_bp.route('/pacientes', methods=['POST'])
 @requiere_admin
+@idempotencia.idempotente
 def crear_paciente():
     """Crear un nuevo paciente (y su usuario asociado)"""
     data = request.get_json()
@@ -176,16 +257,20 @@ def crear_paciente():
     
     # Si se proporcionan credenciales, crear usuario
     if nombre_usuario and password:
-        if Usuario.query.filter_by(nombre_usuario=nombre_usuario).first():
-            return jsonify({'error': 'El nombre de usuario ya existe'}), 409
+        with trazador.span('password.hash'):
+            password_hash = generate_password_hash(password)
         
         nuevo_usuario = Usuario(
             nombre_usuario=nombre_usuario,
-            password=generate_password_hash(password),
+            password=password_hash,
             rol='paciente'
         )
         db.session.add(nuevo_usuario)
-        db.session.flush()
+        try:
+            db.session.flush()
+        except IntegrityError:
+            db.session.rollback()
+            return jsonify({'error': 'El nombre de usuario ya existe'}), 409
         id_user = nuevo_usuario.id_user
     
     nuevo_paciente = Paciente(
@@ -206,13 +291,21 @@ def crear_paciente():
 
 @admin_bp.route('/pacientes', methods=['GET'])
 @jwt_required()
+@cache_http.condicional('pacientes')
+@limitador.concurrente('listados')
 def listar_pacientes():
-    """Listar todos los pacientes"""
-    pacientes = Paciente.query.all()
-    return jsonify({
-        'total': len(pacientes),
-        'pacientes': [p.to_dict() for p in pacientes]
-    }), 200
+    """Listar pacientes: todos, o por páginas (ver app/paginacion.py); con
+    ?ids=1,2,3 (hasta MAX_IDS_POR_CONSULTA) solo los indicados"""
+    consulta = Paciente.query
+    if request.args.get('ids'):
+        try:
+            ids = {int(id_) for id_ in request.args['ids'].split(',')}
+        except ValueError:
+            return jsonify({'error': 'ids debe ser una lista de enteros separados por comas'}), 400
+        if len(ids) > MAX_IDS_POR_CONSULTA:
+            return jsonify({'error': f'Se admiten como mucho {MAX_IDS_POR_CONSULTA} ids por consulta'}), 400
+        consulta = consulta.filter(Paciente.id_paciente.in_(ids))
+    return listado('pacientes', consulta, Paciente)
 
 
 @admin_bp.route('/pacientes/<int:id_paciente>', methods=['GET'])
@@ -222,17 +315,14 @@ def obtener_paciente(id_paciente):
     paciente = Paciente.query.get(id_paciente)
     if not paciente:
         return jsonify({'error': 'Paciente no encontrado', 'existe': False, 'activo': False}), 404
-    return jsonify({
-        **paciente.to_dict(), 
-        'existe': True, 
-        'activo': paciente.estado == 'ACTIVO'
-    }), 200
+    return respuesta_detalle(paciente.to_dict(), existe=True, activo=paciente.estado == 'ACTIVO')
 
 
 # ==================== CENTROS ====================
 
 @admin_bp.route('/centros', methods=['POST'])
 @requiere_admin
+@idempotencia.idempotente
 def crear_centro():
     """Crear un nuevo centro médico"""
     data = request.get_json()
@@ -262,13 +352,11 @@ def crear_centro():
 
 @admin_bp.route('/centros', methods=['GET'])
 @jwt_required()
+@cache_http.condicional('centros')
+@limitador.concurrente('listados')
 def listar_centros():
-    """Listar todos los centros"""
-    centros = Centro.query.all()
-    return jsonify({
-        'total': len(centros),
-        'centros': [c.to_dict() for c in centros]
-    }), 200
+    """Listar centros: todos, o por páginas (ver app/paginacion.py)"""
+    return listado('centros', Centro.query, Centro)
 
 
 @admin_bp.route('/centros/<int:id_centro>', methods=['GET'])
@@ -278,4 +366,128 @@ def obtener_centro(id_centro):
     centro = Centro.query.get(id_centro)
     if not centro:
         return jsonify({'error': 'Centro no encontrado', 'existe': False}), 404
-    return jsonify({**centro.to_dict(), 'existe': True}), 200
+    return respuesta_detalle(centro.to_dict(), existe=True)
+
+
+# ==================== CARGA POR LOTES ====================
+
+# Registros por petición en /admin/lote/<tipo>
+MAX_REGISTROS_LOTE = 500
+
+# tipo -> (campos requeridos, rol del usuario asociado, modelo, clave de la respuesta)
+TIPOS_LOTE = {
+    'usuarios': (('nombre_usuario', 'password', 'rol'), None, Usuario, 'id_user'),
+    'doctores': (('nombre', 'especialidad'), 'medico', Doctor, 'id_doctor'),
+    'pacientes': (('nombre', 'telefono'), 'paciente', Paciente, 'id_paciente'),
+    'centros': (('nombre', 'direccion'), None, Centro, 'id_centro'),
+}
+ROLES_VALIDOS = ['admin', 'medico', 'secretaria', 'paciente']
+
+
+def _registro_lote(tipo, registro):
+    """Datos a insertar para un registro de la carga, (usuario, entidad), con
+    el usuario solo si trae credenciales; o (estado, error) si no es válido"""
+    requeridos, rol, _, _ = TIPOS_LOTE[tipo]
+    if not isinstance(registro, dict) or not all(registro.get(campo) for campo in requeridos):
+        return None, (400, f"{', '.join(requeridos)} son requeridos")
+    
+    usuario = None
+    if tipo == 'usuarios' or (registro.get('nombre_usuario') and registro.get('password')):
+        rol = registro['rol'] if tipo == 'usuarios' else rol
+        if rol not in ROLES_VALIDOS:
+            return None, (400, f'Rol inválido. Roles válidos: {ROLES_VALIDOS}')
+        with trazador.span('password.hash'):
+            password_hash = generate_password_hash(registro['password'])
+        usuario = {'nombre_usuario': registro['nombre_usuario'], 'password': password_hash, 'rol': rol}
+    
+    if tipo == 'usuarios':
+        return (usuario, None), None
+    if tipo == 'doctores':
+        return (usuario, {'nombre': registro['nombre'], 'especialidad': registro['especialidad']}), None
+    if tipo == 'pacientes':
+        return (usuario, {'nombre': registro['nombre'], 'telefono': registro['telefono'],
+                          'estado': registro.get('estado') or 'ACTIVO'}), None
+    return (None, {'nombre': registro['nombre'], 'direccion': registro['direccion']}), None
+
+
+def _insertar_lote(tipo, preparados, resultados):
+    """Inserta los registros válidos (índice, usuario, entidad) y completa
+    `resultados`. Los nombres de usuario ya existentes, comparados ya
+    normalizados, se buscan con una sola consulta."""
+    normalizados = {normalizar_nombre(usuario['nombre_usuario']) for _, usuario, _ in preparados if usuario}
+    usados = {fila.nombre_normalizado for fila in db.session.query(Usuario.nombre_normalizado).filter(
+        Usuario.nombre_normalizado.in_(normalizados))} if normalizados else set()
+    
+    nuevos = []
+    for indice, usuario, entidad in preparados:
+        if usuario:
+            normalizado = normalizar_nombre(usuario['nombre_usuario'])
+            if normalizado in usados:
+                resultados[indice] = {'estado': 409, 'error': 'El nombre de usuario ya existe'}
+                continue
+            usados.add(normalizado)
+            usuario = Usuario(**usuario)
+        if tipo == 'usuarios':
+            objeto = usuario
+        elif usuario:
+            objeto = TIPOS_LOTE[tipo][2](usuario=usuario, **entidad)
+        else:
+            objeto = TIPOS_LOTE[tipo][2](**entidad)
+        db.session.add(objeto)
+        nuevos.append((indice, objeto))
+    
+    db.session.flush()
+    clave_id = TIPOS_LOTE[tipo][3]
+    for indice, objeto in nuevos:
+        resultados[indice] = {'estado': 201, clave_id: getattr(objeto, clave_id)}
+    db.session.commit()
+    return len(nuevos)
+
+
+@admin_bp.route('/lote/<tipo>', methods=['POST'])
+@requiere_admin
+@idempotencia.idempotente
+def crear_lote(tipo):
+    """Crear hasta MAX_REGISTROS_LOTE registros de un tipo en una transacción.
+    
+    Cuerpo: {"registros": [{...}, ...]} con los mismos campos que el alta
+    individual. Los registros inválidos o con nombre de usuario repetido no
+    se insertan y no impiden insertar los demás; la respuesta trae el
+    resultado de cada uno en el mismo orden.
+    """
+    if tipo not in TIPOS_LOTE:
+        return jsonify({'error': f'Tipo inválido. Tipos válidos: {list(TIPOS_LOTE)}'}), 400
+    
+    data = request.get_json()
+    registros = data.get('registros') if isinstance(data, dict) else None
+    if not isinstance(registros, list) or not registros:
+        return jsonify({'error': 'registros (lista no vacía) es requerido'}), 400
+    if len(registros) > MAX_REGISTROS_LOTE:
+        return jsonify({'error': f'Se admiten como mucho {MAX_REGISTROS_LOTE} registros por lote'}), 400
+    
+    # Validación y hash de contraseñas una sola vez, fuera de la transacción
+    resultados = [None] * len(registros)
+    preparados = []
+    for indice, registro in enumerate(registros):
+        datos, error = _registro_lote(tipo, registro)
+        if error:
+            resultados[indice] = {'estado': error[0], 'error': error[1]}
+        else:
+            preparados.append((indice, *datos))
+    
+    # Si otra carga simultánea inserta un nombre tras la consulta, el índice
+    # único rechaza el lote: se repite y esta vez ese nombre sale como 409
+    for _ in range(3):
+        try:
+            creados = _insertar_lote(tipo, preparados, resultados) if preparados else 0
+            break
+        except IntegrityError:
+            db.session.rollback()
+    else:
+        return jsonify({'error': 'Conflicto con otras altas simultáneas, reintente el lote'}), 409
+    
+    return jsonify({
+        'creados': creados,
+        'errores': len(registros) - creados,
+        'resultados': resultados
+    }), 200
@@ -1,13 +1,19 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from sqlalchemy.exc import IntegrityError
 from werkzeug.security import check_password_hash, generate_password_hash
+from odontocare_comun.trazas import trazador
+from odontocare_comun.limitador import limitador
 from app import db
-from app.models import Usuario
+from app.models import Usuario, Paciente, Doctor
+from app.identidad import identidad
 
 auth_bp = Blueprint('auth', __name__)
 
 
 @auth_bp.route('/login', methods=['POST'])
+@limitador.limite('login')
+@limitador.concurrente('login')
 def login():
     """Inicio de sesión - Retorna token JWT"""
     data = request.get_json()
@@ -23,7 +29,12 @@ def login():
     
     usuario = Usuario.query.filter_by(nombre_usuario=nombre_usuario).first()
     
-    if not usuario or not check_password_hash(usuario.password, password):
+    if not usuario:
+        return jsonify({'error': 'Credenciales inválidas'}), 401
+    
+    with trazador.span('password.verificar'):
+        password_valida = check_password_hash(usuario.password, password)
+    if not password_valida:
         return jsonify({'error': 'Credenciales inválidas'}), 401
     
     # Crear token con información del usuario
@@ -42,6 +53,29 @@ def login():
     }), 200
 
 
+@auth_bp.route('/renovar', methods=['POST'])
+@jwt_required()
+def renovar():
+    """Nuevo token para el usuario del token actual, antes de que caduque
+    (p. ej. para un proceso largo como una carga masiva)"""
+    current_user = get_jwt_identity()
+    
+    # El rol se lee de nuevo: un cambio o una baja no sobreviven a la renovación
+    usuario = db.session.get(Usuario, current_user['id_user'])
+    if not usuario:
+        return jsonify({'error': 'Usuario no encontrado'}), 401
+    
+    access_token = create_access_token(
+        identity={
+            'id_user': usuario.id_user,
+            'nombre_usuario': usuario.nombre_usuario,
+            'rol': usuario.rol
+        }
+    )
+    
+    return jsonify({'token': access_token}), 200
+
+
 @auth_bp.route('/registro', methods=['POST'])
 @jwt_required()
 def registro():
@@ -67,18 +101,22 @@ def registro():
     if rol not in roles_validos:
         return jsonify({'error': f'Rol inválido. Roles válidos: {roles_validos}'}), 400
     
-    # Verificar si el usuario ya existe
-    if Usuario.query.filter_by(nombre_usuario=nombre_usuario).first():
-        return jsonify({'error': 'El nombre de usuario ya existe'}), 409
+    with trazador.span('password.hash'):
+        password_hash = generate_password_hash(password)
     
     nuevo_usuario = Usuario(
         nombre_usuario=nombre_usuario,
-        password=generate_password_hash(password),
+        password=password_hash,
         rol=rol
     )
     
+    # Si el nombre (normalizado) ya existe, lo rechaza el índice único
     db.session.add(nuevo_usuario)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'El nombre de usuario ya existe'}), 409
     
     return jsonify({
         'mensaje': 'Usuario registrado exitosamente',
@@ -97,13 +135,31 @@ def verificar_token():
     }), 200
 
 
+@auth_bp.route('/perfil', methods=['GET'])
+@jwt_required()
+def perfil():
+    """Paciente y doctor asociados al usuario del token (None si no tiene)"""
+    current_user = get_jwt_identity()
+    id_user = current_user['id_user']
+    
+    paciente = db.session.query(Paciente.id_paciente).filter_by(id_user=id_user).first()
+    doctor = db.session.query(Doctor.id_doctor).filter_by(id_user=id_user).first()
+    
+    return jsonify({
+        'id_user': id_user,
+        'rol': current_user['rol'],
+        'id_paciente': paciente.id_paciente if paciente else None,
+        'id_doctor': doctor.id_doctor if doctor else None
+    }), 200
+
+
 @auth_bp.route('/usuario/<int:id_user>', methods=['GET'])
 @jwt_required()
 def obtener_usuario(id_user):
     """Obtener información de un usuario por ID"""
-    usuario = Usuario.query.get(id_user)
+    usuario = identidad.usuario(id_user)
     
     if not usuario:
         return jsonify({'error': 'Usuario no encontrado'}), 404
     
-    return jsonify(usuario.to_dict()), 200
+    return jsonify(usuario), 200
@@ -0,0 +1,125 @@
+"""
+Caché HTTP de los listados de referencia (ETag, Last-Modified y GET condicional).
+
+Cada tabla tiene un contador en versiones_tablas que se incrementa, en la
+misma transacción, cada vez que un flush de la sesión inserta, modifica o
+borra filas suyas. El ETag de un listado se deriva de ese contador, de modo
+que una petición con If-None-Match (o If-Modified-Since) se responde con 304
+consultando una sola fila y sin cargar el listado.
+
+Last-Modified tiene resolución de segundos, así que cada cambio adelanta
+la fecha de la tabla al menos un segundo respecto a la anterior: dos
+escrituras en el mismo segundo no pueden dejar el mismo Last-Modified, y un
+If-Modified-Since de entre ambas no recibe un 304 con datos viejos. Con
+muchas escrituras por segundo la fecha puede ir por delante del reloj.
+
+Las escrituras que no pasan por la sesión del ORM deben llamar a
+incrementar_version() sobre su conexión.
+"""
+
+import calendar
+import os
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+from flask import current_app, request
+from sqlalchemy import DateTime, Integer, event, text
+from odontocare_comun.compresion import CODIFICACIONES
+
+_SQL_VERSION = text(
+    'SELECT version, modificada FROM versiones_tablas WHERE tabla = :tabla'
+).columns(version=Integer, modificada=DateTime)
+_SQL_INCREMENTAR = text('UPDATE versiones_tablas SET version = version + 1 WHERE tabla = :tabla')
+_SQL_MODIFICADA = text(
+    'SELECT modificada FROM versiones_tablas WHERE tabla = :tabla'
+).columns(modificada=DateTime)
+_SQL_FECHAR = text('UPDATE versiones_tablas SET modificada = :modificada WHERE tabla = :tabla')
+
+
+def incrementar_version(conn, *tablas):
+    """Marca como modificadas las tablas indicadas dentro de la transacción de `conn`"""
+    ahora = datetime.utcnow().replace(microsecond=0)
+    for tabla in sorted(set(tablas)):
+        # El primer UPDATE bloquea la fila: ninguna otra escritura lee la
+        # misma fecha anterior antes de que esta transacción termine
+        if not conn.execute(_SQL_INCREMENTAR, {'tabla': tabla}).rowcount:
+            continue
+        anterior = conn.execute(_SQL_MODIFICADA, {'tabla': tabla}).scalar()
+        modificada = ahora
+        if anterior is not None:
+            modificada = max(ahora, anterior.replace(microsecond=0) + timedelta(seconds=1))
+        conn.execute(_SQL_FECHAR, {'tabla': tabla, 'modificada': modificada})
+
+
+class CacheHTTP:
+    """Cabeceras de validación y respuestas 304 basadas en la versión de cada tabla"""
+
+    def __init__(self):
+        self.max_age = 0
+
+    def init_app(self, app):
+        from app import db
+
+        app.config.setdefault('CACHE_REFERENCIA_MAX_AGE', int(os.environ.get('CACHE_REFERENCIA_MAX_AGE', 0)))
+        self.max_age = app.config['CACHE_REFERENCIA_MAX_AGE']
+
+        if not event.contains(db.session, 'after_flush', self._despues_de_flush):
+            event.listen(db.session, 'after_flush', self._despues_de_flush)
+
+    def _despues_de_flush(self, session, contexto_flush):
+        modificados = list(session.new) + list(session.deleted)
+        modificados += [obj for obj in session.dirty if session.is_modified(obj)]
+        tablas = {obj.__table__.name for obj in modificados if hasattr(obj, '__table__')}
+        if tablas:
+            incrementar_version(session.connection(), *tablas)
+
+    def version(self, tabla):
+        """(version, modificada) de la tabla, o None si no tiene contador"""
+        from app import db
+        return db.session.execute(_SQL_VERSION, {'tabla': tabla}).first()
+
+    def cache_control(self):
+        # Respuestas ligadas al token: solo cachés privadas. Sin max-age el
+        # cliente revalida siempre, lo que cuesta un intercambio de cabeceras.
+        if self.max_age > 0:
+            return f'private, max-age={self.max_age}'
+        return 'private, no-cache'
+
+    def condicional(self, tabla):
+        """Decorador de vistas GET cuyo contenido depende solo de `tabla`"""
+        def decorador(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                fila = self.version(tabla)
+                if fila is None:
+                    return func(*args, **kwargs)
+
+                version, modificada = fila
+                modificada = modificada.replace(microsecond=0, tzinfo=timezone.utc)
+                etag = f'{tabla}-{version}-{calendar.timegm(modificada.timetuple())}'
+
+                # El cliente puede tener la representación comprimida, cuyo
+                # ETag lleva la codificación como sufijo
+                coincidencia = None
+                if request.if_none_match:
+                    candidatos = [etag] + [f'{etag}-{c}' for c in CODIFICACIONES]
+                    coincidencia = next((c for c in candidatos if request.if_none_match.contains(c)), None)
+                    no_modificado = coincidencia is not None
+                else:
+                    no_modificado = bool(request.if_modified_since and modificada <= request.if_modified_since)
+
+                if no_modificado:
+                    respuesta = current_app.response_class(status=304)
+                else:
+                    respuesta = current_app.make_response(func(*args, **kwargs))
+                    if respuesta.status_code != 200:
+                        return respuesta
+
+                respuesta.set_etag(coincidencia or etag)
+                respuesta.last_modified = modificada
+                respuesta.headers['Cache-Control'] = self.cache_control()
+                return respuesta
+            return wrapper
+        return decorador
+
+
+cache_http = CacheHTTP()
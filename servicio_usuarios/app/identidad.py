@@ -0,0 +1,146 @@
+"""
+Caché en memoria del proceso para la identidad de las peticiones.
+
+- Tokens: JWTManagerCacheado guarda el contenido ya verificado de cada
+  token, indexado por su hash SHA-256, hasta que caduca (o como mucho
+  IDENTIDAD_CACHE_TTL segundos). Cada petición verifica el token dos veces,
+  en el limitador y en @jwt_required, y un cliente repite el mismo token
+  durante toda la sesión: tras la primera vez verificarlo es una consulta
+  al diccionario.
+- Usuarios: identidad.usuario(id_user) devuelve el to_dict() de la fila, que
+  se guarda IDENTIDAD_CACHE_TTL segundos y se invalida cuando una sesión del
+  ORM que modifica ese usuario hace commit. Con varios workers, cada proceso
+  invalida solo su caché; los demás se actualizan al caducar la entrada.
+
+Configuración (variables de entorno):
+    IDENTIDAD_CACHE_TTL   segundos máximos de cada entrada (300); 0 la desactiva
+    IDENTIDAD_CACHE_MAX   entradas por caché (10000)
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from flask_jwt_extended import JWTManager
+from sqlalchemy import event
+
+
+class CacheTTL:
+    """Diccionario LRU con caducidad por entrada, compartido entre hilos"""
+
+    def __init__(self, maximo=10000):
+        self.maximo = maximo
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return None
+            if entrada[0] <= time.time():
+                del self._datos[clave]
+                return None
+            self._datos.move_to_end(clave)
+            return entrada[1]
+
+    def guardar(self, clave, valor, ttl):
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._datos[clave] = (time.time() + ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.maximo:
+                self._datos.popitem(last=False)
+
+    def borrar(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def vaciar(self):
+        with self._lock:
+            self._datos.clear()
+
+
+class Identidad:
+    """Cachés de tokens verificados y de usuarios por id"""
+
+    def __init__(self):
+        self.ttl = 300
+        self.tokens = CacheTTL()
+        self.usuarios = CacheTTL()
+
+    def init_app(self, app):
+        from app import db
+
+        app.config.setdefault('IDENTIDAD_CACHE_TTL', int(os.environ.get('IDENTIDAD_CACHE_TTL', 300)))
+        app.config.setdefault('IDENTIDAD_CACHE_MAX', int(os.environ.get('IDENTIDAD_CACHE_MAX', 10000)))
+        self.ttl = app.config['IDENTIDAD_CACHE_TTL']
+        self.tokens.maximo = self.usuarios.maximo = app.config['IDENTIDAD_CACHE_MAX']
+
+        for nombre, funcion in (('after_flush', self._despues_de_flush),
+                                ('after_commit', self._despues_de_commit),
+                                ('after_rollback', self._despues_de_rollback)):
+            if not event.contains(db.session, nombre, funcion):
+                event.listen(db.session, nombre, funcion)
+
+    # ==================== USUARIOS ====================
+
+    def usuario(self, id_user):
+        """to_dict() del usuario, o None si no existe (los inexistentes no se guardan)"""
+        from app.models import Usuario
+
+        datos = self.usuarios.obtener(id_user)
+        if datos is None:
+            usuario = Usuario.query.get(id_user)
+            if usuario is None:
+                return None
+            datos = usuario.to_dict()
+            self.usuarios.guardar(id_user, datos, self.ttl)
+        return datos
+
+    def _despues_de_flush(self, session, contexto_flush):
+        from app.models import Usuario
+
+        modificados = session.info.setdefault('usuarios_modificados', set())
+        for obj in [*session.new, *session.dirty, *session.deleted]:
+            if isinstance(obj, Usuario) and obj.id_user is not None:
+                modificados.add(obj.id_user)
+
+    def _despues_de_commit(self, session):
+        # Se invalida tras el commit: antes, otra petición podría volver a
+        # guardar la fila antigua
+        for id_user in session.info.pop('usuarios_modificados', ()):
+            self.usuarios.borrar(id_user)
+
+    def _despues_de_rollback(self, session):
+        session.info.pop('usuarios_modificados', None)
+
+    # ==================== TOKENS ====================
+
+    def token(self, token, verificar):
+        """Contenido verificado del token; `verificar()` lo decodifica si no está guardado"""
+        clave = hashlib.sha256(token.encode()).digest()
+        datos = self.tokens.obtener(clave)
+        if datos is None:
+            datos = verificar()
+            ttl = self.ttl
+            if 'exp' in datos:
+                ttl = min(ttl, datos['exp'] - time.time())
+            self.tokens.guardar(clave, datos, ttl)
+        return datos
+
+
+identidad = Identidad()
+
+
+class JWTManagerCacheado(JWTManager):
+    """JWTManager que reutiliza la verificación de los tokens ya vistos"""
+
+    def _decode_jwt_from_config(self, encoded_token, csrf_value=None, allow_expired=False):
+        if csrf_value is not None or allow_expired:
+            return super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+        return identidad.token(
+            encoded_token, lambda: super(JWTManagerCacheado, self)._decode_jwt_from_config(encoded_token)
+        )
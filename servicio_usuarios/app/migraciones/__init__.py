@@ -0,0 +1,35 @@
+"""
+Migraciones versionadas del esquema de base de datos.
+
+Cada migración es un módulo ``vNNN_descripcion.py`` de este paquete que
+define una función ``upgrade(conn)`` o, si solo crea índices, una lista
+``INDICES`` de ``Indice`` (se crean sin bloquear la tabla en PostgreSQL). Las
+versiones aplicadas se registran en la tabla ``schema_migraciones`` y se
+ejecutan con ``python migrate.py``, de modo que los workers de la aplicación
+arrancan sin ejecutar DDL.
+
+La lógica está en odontocare_comun.migraciones, compartida con el otro
+servicio; aquí solo se le indica este paquete.
+"""
+
+import sys
+from odontocare_comun import migraciones as _migraciones
+from odontocare_comun.migraciones import TABLA_VERSIONES, Indice, versiones_aplicadas  # noqa: F401
+
+_PAQUETE = sys.modules[__name__]
+
+
+def listar_migraciones():
+    """Retorna las migraciones disponibles como [(version, nombre_modulo)] ordenadas"""
+    return _migraciones.listar_migraciones(_PAQUETE)
+
+
+def migraciones_pendientes(engine):
+    """Retorna las migraciones que aún no se han aplicado"""
+    return _migraciones.migraciones_pendientes(engine, _PAQUETE)
+
+
+def aplicar_migraciones(engine, hasta=None):
+    """Aplica en orden las migraciones pendientes (opcionalmente hasta una versión).
+    Retorna la lista de módulos aplicados."""
+    return _migraciones.aplicar_migraciones(engine, _PAQUETE, hasta)
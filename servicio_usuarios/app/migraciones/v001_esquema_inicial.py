@@ -0,0 +1,39 @@
+"""Esquema inicial: usuarios, pacientes, doctores y centros"""
+
+from sqlalchemy import MetaData, Table, Column, Integer, String, ForeignKey
+
+
+def upgrade(conn):
+    metadata = MetaData()
+
+    Table(
+        'usuarios', metadata,
+        Column('id_user', Integer, primary_key=True),
+        Column('nombre_usuario', String(80), unique=True, nullable=False),
+        Column('password', String(255), nullable=False),
+        Column('rol', String(20), nullable=False),
+    )
+    Table(
+        'pacientes', metadata,
+        Column('id_paciente', Integer, primary_key=True),
+        Column('id_user', Integer, ForeignKey('usuarios.id_user'), nullable=True),
+        Column('nombre', String(100), nullable=False),
+        Column('telefono', String(20), nullable=False),
+        Column('estado', String(10)),
+    )
+    Table(
+        'doctores', metadata,
+        Column('id_doctor', Integer, primary_key=True),
+        Column('id_user', Integer, ForeignKey('usuarios.id_user'), nullable=True),
+        Column('nombre', String(100), nullable=False),
+        Column('especialidad', String(100), nullable=False),
+    )
+    Table(
+        'centros', metadata,
+        Column('id_centro', Integer, primary_key=True),
+        Column('nombre', String(100), nullable=False),
+        Column('direccion', String(200), nullable=False),
+    )
+
+    # checkfirst permite adoptar bases de datos creadas antes con db.create_all()
+    metadata.create_all(conn, checkfirst=True)
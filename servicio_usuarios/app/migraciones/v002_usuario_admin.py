@@ -0,0 +1,16 @@
+"""Usuario admin por defecto"""
+
+from sqlalchemy import text
+from werkzeug.security import generate_password_hash
+
+
+def upgrade(conn):
+    existe = conn.execute(
+        text('SELECT 1 FROM usuarios WHERE nombre_usuario = :nombre'),
+        {'nombre': 'admin'}
+    ).first()
+    if not existe:
+        conn.execute(
+            text('INSERT INTO usuarios (nombre_usuario, password, rol) VALUES (:nombre, :password, :rol)'),
+            {'nombre': 'admin', 'password': generate_password_hash('admin123'), 'rol': 'admin'}
+        )
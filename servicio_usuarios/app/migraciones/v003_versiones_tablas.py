@@ -0,0 +1,28 @@
+"""Contador de versión por tabla para ETag/Last-Modified de los listados"""
+
+from datetime import datetime
+from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime, text
+
+TABLAS = ('usuarios', 'pacientes', 'doctores', 'centros')
+
+
+def upgrade(conn):
+    metadata = MetaData()
+    Table(
+        'versiones_tablas', metadata,
+        Column('tabla', String(50), primary_key=True),
+        Column('version', Integer, nullable=False),
+        Column('modificada', DateTime, nullable=False),
+    )
+    metadata.create_all(conn, checkfirst=True)
+
+    ahora = datetime.utcnow().replace(microsecond=0)
+    for tabla in TABLAS:
+        existe = conn.execute(
+            text('SELECT 1 FROM versiones_tablas WHERE tabla = :tabla'), {'tabla': tabla}
+        ).first()
+        if not existe:
+            conn.execute(
+                text('INSERT INTO versiones_tablas (tabla, version, modificada) VALUES (:tabla, 1, :ahora)'),
+                {'tabla': tabla, 'ahora': ahora}
+            )
@@ -0,0 +1,20 @@
+"""Respuestas guardadas por Idempotency-Key (ver odontocare_comun/idempotencia.py)"""
+
+from sqlalchemy import MetaData, Table, Column, Index, Integer, String, DateTime, LargeBinary
+
+
+def upgrade(conn):
+    metadata = MetaData()
+    Table(
+        'claves_idempotencia', metadata,
+        Column('usuario', String(50), primary_key=True),
+        Column('clave', String(255), primary_key=True),
+        Column('huella', String(64), nullable=False),
+        Column('estado_http', Integer, nullable=True),
+        Column('tipo', String(100), nullable=True),
+        Column('cuerpo', LargeBinary, nullable=True),
+        Column('creada', DateTime, nullable=False),
+        Column('expira', DateTime, nullable=False),
+        Index('ix_claves_idempotencia_expira', 'expira'),
+    )
+    metadata.create_all(conn, checkfirst=True)
@@ -0,0 +1,8 @@
+"""Índices por id_user en pacientes y doctores, para resolver el perfil del token"""
+
+from app.migraciones import Indice
+
+INDICES = [
+    Indice('ix_pacientes_id_user', 'pacientes', ['id_user']),
+    Indice('ix_doctores_id_user', 'doctores', ['id_user']),
+]
@@ -0,0 +1,11 @@
+"""Índices de los órdenes y filtros de los listados paginados de la administración"""
+
+from app.migraciones import Indice
+
+INDICES = [
+    Indice('ix_usuarios_rol', 'usuarios', ['rol', 'id_user']),
+    Indice('ix_pacientes_nombre', 'pacientes', ['nombre', 'id_paciente']),
+    Indice('ix_doctores_nombre', 'doctores', ['nombre', 'id_doctor']),
+    Indice('ix_doctores_especialidad', 'doctores', ['especialidad', 'id_doctor']),
+    Indice('ix_centros_nombre', 'centros', ['nombre', 'id_centro']),
+]
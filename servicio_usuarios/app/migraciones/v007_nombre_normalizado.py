@@ -0,0 +1,47 @@
+"""Columna nombre_normalizado de usuarios, rellenada para las filas existentes.
+
+Si dos usuarios existentes coinciden al normalizar ("Ana" y "ana"), el de id
+menor conserva el nombre normalizado y los demás reciben el sufijo "#<id>",
+para que v008 pueda crear el índice único. Esos usuarios siguen entrando con
+su nombre de siempre.
+
+La normalización es una copia de app.models.normalizar_nombre en el momento
+de escribir la migración: un cambio posterior de esa función no debe cambiar
+lo que hace esta migración.
+"""
+
+import unicodedata
+from sqlalchemy import bindparam, text
+
+FILAS_POR_LOTE = 1000
+LONGITUD = 80  # VARCHAR(80), como nombre_usuario
+
+_SQL_ACTUALIZAR = text(
+    'UPDATE usuarios SET nombre_normalizado = :normalizado WHERE id_user = :id'
+).bindparams(bindparam('id'), bindparam('normalizado'))
+
+
+def _normalizar(nombre_usuario):
+    descompuesto = unicodedata.normalize('NFKD', nombre_usuario.strip())
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c)).casefold()
+
+
+def upgrade(conn):
+    conn.execute(text('ALTER TABLE usuarios ADD COLUMN nombre_normalizado VARCHAR(80)'))
+
+    usados = set()
+    lote = []
+    for id_user, nombre_usuario in conn.execute(text('SELECT id_user, nombre_usuario FROM usuarios ORDER BY id_user')).all():
+        # casefold puede alargar el nombre ("ß" -> "ss"); el sufijo se añade
+        # tras recortar para no pasar de la longitud de la columna
+        normalizado = _normalizar(nombre_usuario)[:LONGITUD]
+        if normalizado in usados:
+            sufijo = f'#{id_user}'
+            normalizado = normalizado[:LONGITUD - len(sufijo)] + sufijo
+        usados.add(normalizado)
+        lote.append({'id': id_user, 'normalizado': normalizado})
+        if len(lote) == FILAS_POR_LOTE:
+            conn.execute(_SQL_ACTUALIZAR, lote)
+            lote = []
+    if lote:
+        conn.execute(_SQL_ACTUALIZAR, lote)
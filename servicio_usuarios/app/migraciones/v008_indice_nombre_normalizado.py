@@ -0,0 +1,12 @@
+"""Índice único sobre usuarios.nombre_normalizado.
+
+Va en su propia migración porque en PostgreSQL el índice se crea de forma
+concurrente, y eso no es posible dentro de la transacción que rellena la
+columna.
+"""
+
+from app.migraciones import Indice
+
+INDICES = [
+    Indice('ux_usuarios_nombre_normalizado', 'usuarios', ['nombre_normalizado'], unico=True),
+]
@@ -1,11 +1,37 @@
+import unicodedata
+from sqlalchemy.orm import validates
 from app import db
 from datetime import datetime
 
+
+# Longitud de nombre_usuario y de nombre_normalizado
+LONGITUD_NOMBRE = 80
+
+
+def normalizar_nombre(nombre_usuario):
+    """Forma canónica de un nombre de usuario: sin espacios en los extremos,
+    sin tildes ni diacríticos y sin distinguir mayúsculas ("José" == "jose").
+
+    NFKD y casefold pueden alargar el nombre ("ß" -> "ss", "ﬃ" -> "ffi"): se
+    recorta a LONGITUD_NOMBRE, igual que hizo la migración v007 con las filas
+    existentes, para que quepa en la columna y todas las filas se comparen
+    con la misma forma."""
+    descompuesto = unicodedata.normalize('NFKD', nombre_usuario.strip())
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c)).casefold()[:LONGITUD_NOMBRE]
+
+
 class Usuario(db.Model):
     __tablename__ = 'usuarios'
+    __table_args__ = (
+        db.Index('ix_usuarios_rol', 'rol', 'id_user'),
+        db.Index('ux_usuarios_nombre_normalizado', 'nombre_normalizado', unique=True),
+    )
     
     id_user = db.Column(db.Integer, primary_key=True)
-    nombre_usuario = db.Column(db.String(80), unique=True, nullable=False)
+    nombre_usuario = db.Column(db.String(LONGITUD_NOMBRE), unique=True, nullable=False)
+    # Lo rellena el validador de nombre_usuario; su índice único impide
+    # registrar "Jose" si ya existe "josé"
+    nombre_normalizado = db.Column(db.String(LONGITUD_NOMBRE), nullable=False)
     password = db.Column(db.String(255), nullable=False)
     rol = db.Column(db.String(20), nullable=False)  # admin, medico, secretaria, paciente
     
@@ -13,16 +39,42 @@ class Usuario(db.Model):
     paciente = db.relationship('Paciente', backref='usuario', uselist=False)
     doctor = db.relationship('Doctor', backref='usuario', uselist=False)
     
+    # Claves de to_dict(), usadas por la serialización rápida de listados
+    CAMPOS_LISTADO = ('id_user', 'nombre_usuario', 'rol')
+    # Paginación de la administración (app/paginacion.py)
+    CAMPOS_ORDEN = ('id_user', 'nombre_usuario', 'rol')
+    CAMPOS_FILTRO = ('rol',)
+    CAMPO_BUSQUEDA = 'nombre_usuario'
+    
+    @validates('nombre_usuario')
+    def _normalizar(self, clave, nombre_usuario):
+        self.nombre_normalizado = normalizar_nombre(nombre_usuario)
+        return nombre_usuario
+    
     def to_dict(self):
         return {
             'id_user': self.id_user,
             'nombre_usuario': self.nombre_usuario,
             'rol': self.rol
         }
+    
+    def to_dict_perfiles(self):
+        """to_dict() más el paciente y el doctor asociados. Al listar, cargar
+        antes las relaciones (ver CARGAS_PERFILES en admin.py) para no hacer
+        una consulta por usuario."""
+        return {
+            **self.to_dict(),
+            'paciente': self.paciente.to_dict() if self.paciente else None,
+            'doctor': self.doctor.to_dict() if self.doctor else None
+        }
 
 
 class Paciente(db.Model):
     __tablename__ = 'pacientes'
+    __table_args__ = (
+        db.Index('ix_pacientes_id_user', 'id_user'),
+        db.Index('ix_pacientes_nombre', 'nombre', 'id_paciente'),
+    )
     
     id_paciente = db.Column(db.Integer, primary_key=True)
     id_user = db.Column(db.Integer, db.ForeignKey('usuarios.id_user'), nullable=True)
@@ -30,6 +82,13 @@ class Paciente(db.Model):
     telefono = db.Column(db.String(20), nullable=False)
     estado = db.Column(db.String(10), default='ACTIVO')  # ACTIVO/INACTIVO
     
+    # Claves de to_dict(), usadas por la serialización rápida de listados
+    CAMPOS_LISTADO = ('id_paciente', 'id_user', 'nombre', 'telefono', 'estado')
+    # Paginación de la administración (app/paginacion.py)
+    CAMPOS_ORDEN = ('id_paciente', 'nombre', 'telefono')
+    CAMPOS_FILTRO = ('estado',)
+    CAMPO_BUSQUEDA = 'nombre'
+    
     def to_dict(self):
         return {
             'id_paciente': self.id_paciente,
@@ -42,12 +101,24 @@ class Paciente(db.Model):
 
 class Doctor(db.Model):
     __tablename__ = 'doctores'
+    __table_args__ = (
+        db.Index('ix_doctores_id_user', 'id_user'),
+        db.Index('ix_doctores_nombre', 'nombre', 'id_doctor'),
+        db.Index('ix_doctores_especialidad', 'especialidad', 'id_doctor'),
+    )
     
     id_doctor = db.Column(db.Integer, primary_key=True)
     id_user = db.Column(db.Integer, db.ForeignKey('usuarios.id_user'), nullable=True)
     nombre = db.Column(db.String(100), nullable=False)
     especialidad = db.Column(db.String(100), nullable=False)
     
+    # Claves de to_dict(), usadas por la serialización rápida de listados
+    CAMPOS_LISTADO = ('id_doctor', 'id_user', 'nombre', 'especialidad')
+    # Paginación de la administración (app/paginacion.py)
+    CAMPOS_ORDEN = ('id_doctor', 'nombre', 'especialidad')
+    CAMPOS_FILTRO = ('especialidad',)
+    CAMPO_BUSQUEDA = 'nombre'
+    
     def to_dict(self):
         return {
             'id_doctor': self.id_doctor,
@@ -59,11 +130,21 @@ class Doctor(db.Model):
 
 class Centro(db.Model):
     __tablename__ = 'centros'
+    __table_args__ = (
+        db.Index('ix_centros_nombre', 'nombre', 'id_centro'),
+    )
     
     id_centro = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(100), nullable=False)
     direccion = db.Column(db.String(200), nullable=False)
     
+    # Claves de to_dict(), usadas por la serialización rápida de listados
+    CAMPOS_LISTADO = ('id_centro', 'nombre', 'direccion')
+    # Paginación de la administración (app/paginacion.py)
+    CAMPOS_ORDEN = ('id_centro', 'nombre')
+    CAMPOS_FILTRO = ()
+    CAMPO_BUSQUEDA = 'nombre'
+    
     def to_dict(self):
         return {
             'id_centro': self.id_centro,
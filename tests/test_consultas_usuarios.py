@@ -0,0 +1,109 @@
+"""
+Pruebas del número de consultas SQL de los listados del servicio de usuarios.
+No requieren los servicios en ejecución: crean la aplicación en el propio
+proceso sobre una base de datos SQLite temporal.
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'servicio_usuarios'))
+
+from flask_jwt_extended import create_access_token  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from app import create_app, db  # noqa: E402
+from app.migraciones import aplicar_migraciones  # noqa: E402
+from app.models import Usuario, Paciente, Doctor  # noqa: E402
+
+USUARIOS_CON_PERFIL = 40
+
+
+class TestConsultasUsuariosPerfiles(unittest.TestCase):
+    """/admin/usuarios/perfiles hace las mismas consultas para cualquier tamaño de página"""
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.directorio = tempfile.TemporaryDirectory()
+        cls.database_url = os.environ.get('DATABASE_URL')
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(cls.directorio.name, 'usuarios.db')}"
+        cls.app = create_app()
+        with cls.app.app_context():
+            aplicar_migraciones(db.engine)
+            for i in range(USUARIOS_CON_PERFIL):
+                rol = 'medico' if i % 2 else 'paciente'
+                usuario = Usuario(nombre_usuario=f'perfil{i}', password='x', rol=rol)
+                if rol == 'medico':
+                    db.session.add(Doctor(usuario=usuario, nombre=f'Doctor {i}', especialidad='General'))
+                else:
+                    db.session.add(Paciente(usuario=usuario, nombre=f'Paciente {i}', telefono='600000000'))
+            db.session.commit()
+            token = create_access_token(identity={'id_user': 1, 'nombre_usuario': 'admin', 'rol': 'admin'})
+        cls.headers = {'Authorization': f'Bearer {token}'}
+        cls.client = cls.app.test_client()
+    
+    @classmethod
+    def tearDownClass(cls):
+        with cls.app.app_context():
+            db.engine.dispose()
+        cls.directorio.cleanup()
+        if cls.database_url is None:
+            os.environ.pop('DATABASE_URL', None)
+        else:
+            os.environ['DATABASE_URL'] = cls.database_url
+    
+    def consultas(self, **params):
+        """(respuesta JSON, número de sentencias SQL ejecutadas por la petición)"""
+        sentencias = []
+        
+        def contar(conn, cursor, sentencia, parametros, contexto, executemany):
+            sentencias.append(sentencia)
+        
+        with self.app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', contar)
+        try:
+            response = self.client.get('/admin/usuarios/perfiles', headers=self.headers, query_string=params)
+        finally:
+            event.remove(engine, 'before_cursor_execute', contar)
+        self.assertEqual(response.status_code, 200)
+        return response.get_json(), len(sentencias)
+    
+    def test_selectin_consultas_constantes(self):
+        """Test: Con selectin, una pagina de 5 y una de 41 usuarios cuestan lo mismo"""
+        pequena, consultas_pequena = self.consultas(limite=5, carga='selectin')
+        grande, consultas_grande = self.consultas(limite=100, carga='selectin')
+        
+        self.assertEqual(len(pequena['usuarios']), 5)
+        self.assertEqual(len(grande['usuarios']), USUARIOS_CON_PERFIL + 1)
+        self.assertEqual(consultas_pequena, consultas_grande)
+        self.assertLessEqual(consultas_grande, 3)
+    
+    def test_joined_una_consulta(self):
+        """Test: Con joined, usuarios, pacientes y doctores salen de una sola consulta"""
+        datos, consultas = self.consultas(limite=100, carga='joined')
+        
+        self.assertEqual(consultas, 1)
+        medico = next(u for u in datos['usuarios'] if u['rol'] == 'medico')
+        paciente = next(u for u in datos['usuarios'] if u['rol'] == 'paciente')
+        self.assertEqual(medico['doctor']['id_user'], medico['id_user'])
+        self.assertIsNone(medico['paciente'])
+        self.assertEqual(paciente['paciente']['id_user'], paciente['id_user'])
+    
+    def test_paginas_con_cursor(self):
+        """Test: Recorrer todas las paginas con el cursor devuelve cada usuario una vez"""
+        ids, cursor = [], None
+        while True:
+            datos, _ = self.consultas(limite=15, **({'cursor': cursor} if cursor else {}))
+            ids += [u['id_user'] for u in datos['usuarios']]
+            cursor = datos['siguiente']
+            if cursor is None:
+                break
+        
+        self.assertEqual(ids, sorted(set(ids)))
+        self.assertEqual(len(ids), USUARIOS_CON_PERFIL + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
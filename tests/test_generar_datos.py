@@ -0,0 +1,75 @@
+"""
+Pruebas del generador de datos sintéticos (generar_datos.py).
+No requieren los servicios en ejecución.
+"""
+
+import csv
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import generar_datos  # noqa: E402
+
+HOY = datetime(2026, 1, 1)
+
+
+class TestGenerarDatos(unittest.TestCase):
+    """Pruebas de consistencia y determinismo del generador"""
+    
+    def generar(self, directorio, semilla=7):
+        return generar_datos.generar(
+            directorio, semilla=semilla, centros=5, pacientes=2000, citas=3000, hoy=HOY
+        )
+    
+    def leer(self, directorio, tabla):
+        with open(os.path.join(directorio, f'{tabla}.csv'), encoding='utf-8') as archivo:
+            return list(csv.DictReader(archivo))
+    
+    def test_misma_semilla_mismos_ficheros(self):
+        """Test: Con la misma semilla la salida es idéntica"""
+        with tempfile.TemporaryDirectory() as a, tempfile.TemporaryDirectory() as b:
+            self.generar(a)
+            self.generar(b)
+            for tabla in generar_datos.CAMPOS:
+                with open(os.path.join(a, f'{tabla}.csv'), 'rb') as fa, \
+                        open(os.path.join(b, f'{tabla}.csv'), 'rb') as fb:
+                    self.assertEqual(fa.read(), fb.read(), tabla)
+    
+    def test_referencias_consistentes(self):
+        """Test: Las citas referencian filas existentes, solo de pacientes activos, y no hay dobles reservas"""
+        with tempfile.TemporaryDirectory() as directorio:
+            totales = self.generar(directorio)
+            citas = self.leer(directorio, 'citas')
+            
+            self.assertEqual(totales['citas'], 3000)
+            self.assertEqual(len(citas), 3000)
+            for cita in citas:
+                self.assertTrue(1 <= int(cita['id_paciente']) <= totales['pacientes'])
+                self.assertTrue(1 <= int(cita['id_doctor']) <= totales['doctores'])
+                self.assertTrue(1 <= int(cita['id_centro']) <= totales['centros'])
+            
+            inactivos = {str(i) for i, p in enumerate(self.leer(directorio, 'pacientes'), start=1)
+                         if p['estado'] != 'ACTIVO'}
+            self.assertTrue(inactivos)
+            self.assertFalse(inactivos & {c['id_paciente'] for c in citas})
+            
+            agenda = {(c['id_doctor'], c['fecha']) for c in citas}
+            self.assertEqual(len(agenda), len(citas))
+    
+    def test_estados_segun_fecha(self):
+        """Test: Las citas pasadas nunca quedan PROGRAMADA"""
+        with tempfile.TemporaryDirectory() as directorio:
+            self.generar(directorio)
+            for cita in self.leer(directorio, 'citas'):
+                if datetime.fromisoformat(cita['fecha']) < HOY:
+                    self.assertNotEqual(cita['estado'], 'PROGRAMADA')
+                else:
+                    self.assertNotEqual(cita['estado'], 'COMPLETADA')
+
+
+if __name__ == '__main__':
+    unittest.main()
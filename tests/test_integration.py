@@ -4,6 +4,7 @@ Valida la comunicación entre servicios y el acceso a endpoints.
 """
 
 import unittest
+import uuid
 import requests
 import json
 
@@ -43,6 +44,33 @@ class TestAuthEndpoints(unittest.TestCase):
         
         self.assertEqual(response.status_code, 401)
     
+    def test_login_consume_cuota(self):
+        """Test: Cada login consume un token del limitador"""
+        url = f"{SERVICIO_USUARIOS_URL}/auth/login"
+        payload = {"nombre_usuario": "admin", "password": "admin123"}
+        
+        primera = requests.post(url, json=payload)
+        segunda = requests.post(url, json=payload)
+        
+        self.assertIn('RateLimit-Remaining', primera.headers)
+        self.assertLess(int(segunda.headers['RateLimit-Remaining']),
+                        int(primera.headers['RateLimit-Remaining']))
+    
+    def test_login_cuota_por_ip_reenviada(self):
+        """Test: A través de un proxy de confianza, cada IP de X-Forwarded-For tiene su cuota"""
+        url = f"{SERVICIO_USUARIOS_URL}/auth/login"
+        payload = {"nombre_usuario": "admin", "password": "incorrecta"}
+        ip = f"203.0.113.{uuid.uuid4().int % 250 + 1}"
+        
+        primera = requests.post(url, json=payload, headers={"X-Forwarded-For": ip})
+        segunda = requests.post(url, json=payload, headers={"X-Forwarded-For": ip})
+        otra = requests.post(url, json=payload, headers={"X-Forwarded-For": f"198.51.100.{uuid.uuid4().int % 250 + 1}"})
+        
+        self.assertLess(int(segunda.headers['RateLimit-Remaining']),
+                        int(primera.headers['RateLimit-Remaining']))
+        self.assertGreater(int(otra.headers['RateLimit-Remaining']),
+                           int(segunda.headers['RateLimit-Remaining']))
+    
     def test_verificar_token(self):
         """Test: Verificar token válido"""
         # Primero obtener token
@@ -60,6 +88,21 @@ class TestAuthEndpoints(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         data = response.json()
         self.assertTrue(data['valido'])
+    
+    def test_renovar_token(self):
+        """Test: Renovar el token devuelve otro válido del mismo usuario"""
+        login_url = f"{SERVICIO_USUARIOS_URL}/auth/login"
+        login_payload = {"nombre_usuario": "admin", "password": "admin123"}
+        token = requests.post(login_url, json=login_payload).json()['token']
+        
+        response = requests.post(f"{SERVICIO_USUARIOS_URL}/auth/renovar",
+                                 headers={"Authorization": f"Bearer {token}"})
+        
+        self.assertEqual(response.status_code, 200)
+        nuevo = response.json()['token']
+        verificado = requests.get(f"{SERVICIO_USUARIOS_URL}/auth/verificar",
+                                  headers={"Authorization": f"Bearer {nuevo}"}).json()
+        self.assertEqual(verificado['usuario']['nombre_usuario'], 'admin')
 
 
 class TestAdminEndpoints(unittest.TestCase):
@@ -96,6 +139,35 @@ class TestAdminEndpoints(unittest.TestCase):
         self.assertIn('total', data)
         self.assertIn('pacientes', data)
     
+    def test_listar_pacientes_por_ids(self):
+        """Test: Listar solo los pacientes pedidos con ?ids="""
+        url = f"{SERVICIO_USUARIOS_URL}/admin/pacientes"
+        
+        response = requests.get(url, headers=self.headers, params={"ids": "9998,9999"})
+        invalida = requests.get(url, headers=self.headers, params={"ids": "uno,dos"})
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'pacientes': [], 'total': 0})
+        self.assertEqual(invalida.status_code, 400)
+    
+    def test_listar_centros_paginado(self):
+        """Test: Recorrer los centros por paginas con filtro, cursor, orden y proyeccion"""
+        url = f"{SERVICIO_USUARIOS_URL}/admin/centros"
+        prefijo = f"Paginado {uuid.uuid4().hex[:8]} "
+        for nombre in ("A", "B"):
+            requests.post(url, json={"nombre": prefijo + nombre, "direccion": "Calle 3"}, headers=self.headers)
+        params = {"q": prefijo, "limite": 1, "orden": "-nombre", "campos": "nombre", "contar": 1}
+        
+        primera = requests.get(url, headers=self.headers, params=params).json()
+        segunda = requests.get(url, headers=self.headers, params={**params, "cursor": primera['siguiente']}).json()
+        invalida = requests.get(url, headers=self.headers, params={"orden": "direccion"})
+        
+        self.assertEqual(primera['centros'], [{'nombre': prefijo + 'B'}])
+        self.assertEqual(primera['cuenta'], 2)
+        self.assertEqual(segunda['centros'], [{'nombre': prefijo + 'A'}])
+        self.assertIsNone(segunda['siguiente'])
+        self.assertEqual(invalida.status_code, 400)
+    
     def test_listar_centros(self):
         """Test: Listar todos los centros"""
         url = f"{SERVICIO_USUARIOS_URL}/admin/centros"
@@ -107,6 +179,101 @@ class TestAdminEndpoints(unittest.TestCase):
         self.assertIn('total', data)
         self.assertIn('centros', data)
     
+    def test_listar_centros_condicional(self):
+        """Test: Listar centros con If-None-Match devuelve 304"""
+        url = f"{SERVICIO_USUARIOS_URL}/admin/centros"
+        
+        response = requests.get(url, headers=self.headers)
+        etag = response.headers.get('ETag')
+        self.assertIsNotNone(etag)
+        
+        response = requests.get(url, headers={**self.headers, "If-None-Match": etag})
+        
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers.get('ETag'), etag)
+    
+    def test_listar_centros_modificado_en_el_mismo_segundo(self):
+        """Test: Un alta justo después de leer el listado invalida su Last-Modified"""
+        url = f"{SERVICIO_USUARIOS_URL}/admin/centros"
+        requests.post(url, json={"nombre": "Centro Fecha A", "direccion": "Calle 5"}, headers=self.headers)
+        last_modified = requests.get(url, headers=self.headers).headers.get('Last-Modified')
+        requests.post(url, json={"nombre": "Centro Fecha B", "direccion": "Calle 5"}, headers=self.headers)
+        
+        response = requests.get(url, headers={**self.headers, "If-Modified-Since": last_modified})
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers.get('Last-Modified'), last_modified)
+    
+    def test_crear_centro_idempotente(self):
+        """Test: Reintentar con la misma Idempotency-Key no duplica el centro"""
+        url = f"{SERVICIO_USUARIOS_URL}/admin/centros"
+        payload = {"nombre": "Centro Idempotente", "direccion": "Calle 1"}
+        headers = {**self.headers, "Idempotency-Key": str(uuid.uuid4())}
+        
+        primera = requests.post(url, json=payload, headers=headers)
+        segunda = requests.post(url, json=payload, headers=headers)
+        
+        self.assertEqual(primera.status_code, 201)
+        self.assertEqual(segunda.status_code, 201)
+        self.assertEqual(segunda.headers.get('Idempotent-Replayed'), 'true')
+        self.assertEqual(segunda.json()['centro']['id_centro'], primera.json()['centro']['id_centro'])
+    
+    def test_crear_lote_centros(self):
+        """Test: Un lote inserta los registros validos y devuelve el error de cada uno de los demas"""
+        url = f"{SERVICIO_USUARIOS_URL}/admin/lote/centros"
+        payload = {"registros": [{"nombre": "Centro Lote", "direccion": "Calle 2"}, {"nombre": "Sin direccion"}]}
+        
+        response = requests.post(url, json=payload, headers=self.headers)
+        
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['creados'], data['errores']), (1, 1))
+        self.assertEqual(data['resultados'][0]['estado'], 201)
+        self.assertIn('id_centro', data['resultados'][0])
+        self.assertEqual(data['resultados'][1]['estado'], 400)
+    
+    def test_crear_usuario_nombre_normalizado_duplicado(self):
+        """Test: Un nombre que solo cambia en mayusculas o tildes se rechaza con 409"""
+        url = f"{SERVICIO_USUARIOS_URL}/admin/usuario"
+        sufijo = uuid.uuid4().hex[:8]
+        
+        primera = requests.post(url, json={"nombre_usuario": f"José.{sufijo}", "password": "x", "rol": "secretaria"},
+                                headers=self.headers)
+        segunda = requests.post(url, json={"nombre_usuario": f" JOSE.{sufijo}", "password": "x", "rol": "secretaria"},
+                                headers=self.headers)
+        
+        self.assertEqual(primera.status_code, 201)
+        self.assertEqual(segunda.status_code, 409)
+    
+    def test_crear_usuario_nombre_normalizado_largo(self):
+        """Test: Un nombre que se alarga al normalizarse ("ß" -> "ss") se recorta a 80 caracteres"""
+        url = f"{SERVICIO_USUARIOS_URL}/admin/usuario"
+        sufijo = uuid.uuid4().hex[:8]
+        
+        primera = requests.post(url, json={"nombre_usuario": sufijo + "ß" * 72, "password": "x", "rol": "secretaria"},
+                                headers=self.headers)
+        # Coincide con el primero en los 80 caracteres normalizados
+        segunda = requests.post(url, json={"nombre_usuario": sufijo + "ss" * 36, "password": "x", "rol": "secretaria"},
+                                headers=self.headers)
+        
+        self.assertEqual(primera.status_code, 201)
+        self.assertEqual(segunda.status_code, 409)
+    
+    def test_obtener_doctor_prefer_minimal(self):
+        """Test: El detalle con y sin return=minimal varía según Prefer"""
+        creado = requests.post(f"{SERVICIO_USUARIOS_URL}/admin/doctores",
+                               json={"nombre": "Dra. Vary", "especialidad": "Ortodoncia"}, headers=self.headers)
+        url = f"{SERVICIO_USUARIOS_URL}/admin/doctores/{creado.json()['doctor']['id_doctor']}"
+        
+        completo = requests.get(url, headers=self.headers)
+        minimo = requests.get(url, headers={**self.headers, "Prefer": "return=minimal"})
+        
+        self.assertIn('existe', completo.json())
+        self.assertNotIn('existe', minimo.json())
+        self.assertEqual(minimo.headers.get('Preference-Applied'), 'return=minimal')
+        for response in (completo, minimo):
+            self.assertIn('prefer', response.headers.get('Vary', '').lower())
+    
     def test_obtener_doctor_inexistente(self):
         """Test: Obtener doctor que no existe"""
         url = f"{SERVICIO_USUARIOS_URL}/admin/doctores/9999"
@@ -139,6 +306,88 @@ class TestCitasEndpoints(unittest.TestCase):
         self.assertIn('total', data)
         self.assertIn('citas', data)
     
+    def test_listar_citas_rango_fechas(self):
+        """Test: Listar citas en un rango de fechas"""
+        url = f"{SERVICIO_CITAS_URL}/citas"
+        params = {"desde": "2025-12-01", "hasta": "2025-12-31"}
+        
+        response = requests.get(url, headers=self.headers, params=params)
+        
+        self.assertEqual(response.status_code, 200)
+        for cita in response.json()['citas']:
+            self.assertTrue("2025-12-01" <= cita['fecha'][:10] <= "2025-12-31")
+    
+    def test_listar_citas_fecha_invalida(self):
+        """Test: Listar citas con un formato de fecha inválido"""
+        url = f"{SERVICIO_CITAS_URL}/citas"
+        
+        response = requests.get(url, headers=self.headers, params={"desde": "ayer"})
+        
+        self.assertEqual(response.status_code, 400)
+    
+    def test_mis_citas_solo_pacientes_y_medicos(self):
+        """Test: /citas/mias no está disponible para el rol admin"""
+        url = f"{SERVICIO_CITAS_URL}/citas/mias"
+        
+        response = requests.get(url, headers=self.headers)
+        
+        self.assertEqual(response.status_code, 403)
+    
+    def test_historial_cita_inexistente(self):
+        """Test: El historial de una cita que no existe responde 404"""
+        url = f"{SERVICIO_CITAS_URL}/citas/9999/historial"
+        
+        response = requests.get(url, headers=self.headers)
+        
+        self.assertEqual(response.status_code, 404)
+    
+    def test_modificar_cita_completada_conserva_estado(self):
+        """Test: Cambiar el motivo de una cita COMPLETADA no la vuelve a programar"""
+        admin = f"{SERVICIO_USUARIOS_URL}/admin"
+        id_doctor = requests.post(f"{admin}/doctores", json={"nombre": "Dr. Estado", "especialidad": "General"},
+                                  headers=self.headers).json()['doctor']['id_doctor']
+        id_paciente = requests.post(f"{admin}/pacientes", json={"nombre": "Paciente Estado", "telefono": "600000000"},
+                                    headers=self.headers).json()['paciente']['id_paciente']
+        id_centro = requests.post(f"{admin}/centros", json={"nombre": "Centro Estado", "direccion": "Calle 4"},
+                                  headers=self.headers).json()['centro']['id_centro']
+        cita = requests.post(f"{SERVICIO_CITAS_URL}/citas", json={
+            "id_paciente": id_paciente, "id_doctor": id_doctor, "id_centro": id_centro,
+            "fecha": "2025-01-15T10:00:00", "motivo": "Revisión", "estado": "COMPLETADA"
+        }, headers=self.headers).json()['cita']
+        url = f"{SERVICIO_CITAS_URL}/citas/{cita['id_cita']}"
+        
+        response = requests.put(url, json={"motivo": "Revisión y limpieza"}, headers=self.headers)
+        historial = requests.get(f"{url}/historial", headers=self.headers)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(requests.get(url, headers=self.headers).json()['estado'], 'COMPLETADA')
+        self.assertEqual(historial.status_code, 200)
+        self.assertEqual(historial.json()['total'], 1)
+    
+    def test_crear_cita_a_nombre_de_otro_usuario(self):
+        """Test: El admin puede registrar una cita a nombre de otro usuario al cargar el histórico"""
+        admin = f"{SERVICIO_USUARIOS_URL}/admin"
+        id_doctor = requests.post(f"{admin}/doctores", json={"nombre": "Dr. Registro", "especialidad": "General"},
+                                  headers=self.headers).json()['doctor']['id_doctor']
+        id_paciente = requests.post(f"{admin}/pacientes", json={"nombre": "Paciente Registro", "telefono": "600000000"},
+                                    headers=self.headers).json()['paciente']['id_paciente']
+        id_centro = requests.post(f"{admin}/centros", json={"nombre": "Centro Registro", "direccion": "Calle 5"},
+                                  headers=self.headers).json()['centro']['id_centro']
+        url = f"{SERVICIO_CITAS_URL}/citas"
+        payload = {
+            "id_paciente": id_paciente, "id_doctor": id_doctor, "id_centro": id_centro,
+            "fecha": "2025-02-10T09:00:00", "motivo": "Limpieza", "estado": "COMPLETADA",
+            "id_user_registrado": 7
+        }
+        
+        response = requests.post(url, json=payload, headers=self.headers)
+        invalido = requests.post(url, json={**payload, "fecha": "2025-02-10T10:00:00", "id_user_registrado": "7"},
+                                 headers=self.headers)
+        
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['cita']['id_user_registrado'], 7)
+        self.assertEqual(invalido.status_code, 400)
+    
     def test_crear_cita_sin_datos(self):
         """Test: Crear cita sin datos requeridos"""
         url = f"{SERVICIO_CITAS_URL}/citas"
@@ -148,6 +397,22 @@ class TestCitasEndpoints(unittest.TestCase):
         
         self.assertEqual(response.status_code, 400)
     
+    def test_crear_cita_estado_invalido(self):
+        """Test: Crear cita con un estado que no existe"""
+        url = f"{SERVICIO_CITAS_URL}/citas"
+        payload = {
+            "id_paciente": 1,
+            "id_doctor": 1,
+            "id_centro": 1,
+            "fecha": "2025-12-20T10:00:00",
+            "motivo": "Revisión",
+            "estado": "ARCHIVADA"
+        }
+        
+        response = requests.post(url, json=payload, headers=self.headers)
+        
+        self.assertEqual(response.status_code, 400)
+    
     def test_obtener_cita_inexistente(self):
         """Test: Obtener cita que no existe"""
         url = f"{SERVICIO_CITAS_URL}/citas/9999"
@@ -0,0 +1,151 @@
+"""
+Pruebas del reparto de citas en shards por centro.
+No requieren los servicios en ejecución: crean el servicio de citas en el
+propio proceso con dos bases de datos SQLite temporales, la principal y el
+shard "norte" (centros 2 y 3).
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+SERVICIO_CITAS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'servicio_citas')
+
+
+def _modulos_app():
+    return {nombre: modulo for nombre, modulo in sys.modules.items() if nombre == 'app' or nombre.startswith('app.')}
+
+
+class TestShardsCitas(unittest.TestCase):
+    """Las citas se guardan en el shard de su centro y los listados las reúnen"""
+    
+    @classmethod
+    def setUpClass(cls):
+        # Cada servicio tiene su paquete app: se aparta el que haya cargado
+        # otra prueba y se restaura al terminar
+        cls.modulos_previos = _modulos_app()
+        for nombre in cls.modulos_previos:
+            del sys.modules[nombre]
+        sys.path.insert(0, SERVICIO_CITAS)
+        
+        cls.directorio = tempfile.TemporaryDirectory()
+        cls.entorno_previo = {v: os.environ.get(v) for v in ('DATABASE_URL', 'CITAS_SHARDS', 'CITAS_SHARDS_CENTROS', 'TAREAS_ACTIVAS')}
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(cls.directorio.name, 'principal.db')}"
+        os.environ['CITAS_SHARDS'] = f"norte=sqlite:///{os.path.join(cls.directorio.name, 'norte.db')}"
+        os.environ['CITAS_SHARDS_CENTROS'] = 'norte:2,3'
+        os.environ['TAREAS_ACTIVAS'] = '0'
+        
+        from flask_jwt_extended import create_access_token
+        from app import create_app
+        from app.migraciones import aplicar_migraciones
+        from app.models import Cita
+        from app.shards import shards
+        
+        cls.app = create_app()
+        cls.shards = shards
+        cls.Cita = Cita
+        cls.inicio = datetime(2030, 1, 7, 9, 0)
+        with cls.app.app_context():
+            for engine in shards.engines().values():
+                aplicar_migraciones(engine)
+            # Citas intercaladas en el tiempo entre los centros 1 (principal), 2 y 3 (norte)
+            cls.ids = {}
+            for i in range(12):
+                cita = Cita(fecha=cls.inicio + timedelta(hours=i), motivo=f'Revision {i}', estado='PROGRAMADA',
+                            id_paciente=1, id_doctor=100 + i, id_centro=i % 3 + 1, id_user_registrado=1)
+                shards.crear(cita)
+                cls.ids[i] = cita.id_cita
+            token = create_access_token(identity={'id_user': 1, 'nombre_usuario': 'admin', 'rol': 'admin'})
+        cls.headers = {'Authorization': f'Bearer {token}'}
+        cls.client = cls.app.test_client()
+    
+    @classmethod
+    def tearDownClass(cls):
+        with cls.app.app_context():
+            for engine in cls.shards.engines().values():
+                engine.dispose()
+        cls.directorio.cleanup()
+        for variable, valor in cls.entorno_previo.items():
+            if valor is None:
+                os.environ.pop(variable, None)
+            else:
+                os.environ[variable] = valor
+        sys.path.remove(SERVICIO_CITAS)
+        for nombre in _modulos_app():
+            del sys.modules[nombre]
+        sys.modules.update(cls.modulos_previos)
+    
+    def citas_en(self, shard):
+        with self.app.app_context():
+            return {cita.id_cita: cita.id_centro for cita in self.shards.sesion(shard).query(self.Cita)}
+    
+    def test_cada_cita_en_el_shard_de_su_centro(self):
+        """Test: Los centros 2 y 3 van a norte, el resto al principal, con ids únicos"""
+        principal, norte = self.citas_en('principal'), self.citas_en('norte')
+        
+        self.assertEqual(set(principal.values()), {1})
+        self.assertEqual(set(norte.values()), {2, 3})
+        self.assertEqual(len(principal) + len(norte), 12)
+        self.assertFalse(set(principal) & set(norte))
+    
+    def test_listado_reune_los_shards_ordenado(self):
+        """Test: Sin id_centro el listado mezcla los shards por fecha"""
+        response = self.client.get('/citas', headers=self.headers)
+        
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data['total'], 12)
+        self.assertEqual([c['id_cita'] for c in data['citas']], [self.ids[i] for i in range(12)])
+    
+    def test_listado_de_un_centro_lee_un_shard(self):
+        """Test: Con id_centro solo se consulta el shard del centro"""
+        from sqlalchemy import event
+        
+        sentencias = {}
+        with self.app.app_context():
+            engines = self.shards.engines()
+        oyentes = {}
+        for nombre, engine in engines.items():
+            def contar(*args, nombre=nombre):
+                sentencias[nombre] = sentencias.get(nombre, 0) + 1
+            oyentes[nombre] = contar
+            event.listen(engine, 'before_cursor_execute', contar)
+        try:
+            response = self.client.get('/citas?id_centro=2', headers=self.headers)
+        finally:
+            for nombre, engine in engines.items():
+                event.remove(engine, 'before_cursor_execute', oyentes[nombre])
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({c['id_centro'] for c in response.get_json()['citas']}, {2})
+        self.assertEqual(response.get_json()['total'], 4)
+        self.assertNotIn('principal', sentencias)
+    
+    def test_cita_por_id_en_otro_shard(self):
+        """Test: Obtener y cancelar una cita del shard norte por su id"""
+        id_cita = self.ids[1]  # centro 2
+        
+        response = self.client.get(f'/citas/{id_cita}', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['id_centro'], 2)
+        
+        response = self.client.put(f'/citas/{self.ids[4]}/cancelar', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        historial = self.client.get(f'/citas/{self.ids[4]}/historial', headers=self.headers).get_json()
+        self.assertEqual([h['operacion'] for h in historial['historial']], ['CANCELACION'])
+        
+        self.assertEqual(self.client.get('/citas/999999', headers=self.headers).status_code, 404)
+    
+    def test_disponibilidad_del_doctor_en_todos_los_shards(self):
+        """Test: Un doctor ocupado en un centro de norte no está libre en el principal"""
+        from app.blueprints.citas import verificar_disponibilidad_doctor
+        
+        with self.app.app_context():
+            self.assertFalse(verificar_disponibilidad_doctor(101, self.inicio + timedelta(hours=1)))
+            self.assertTrue(verificar_disponibilidad_doctor(101, self.inicio + timedelta(hours=2)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,12 +3,17 @@ Aplicación Web para Administración de Citas - Sistema OdontoCare
 """
 
 from flask import Flask, render_template, request, redirect, url_for, flash, session
-import requests
+import httpx
 from datetime import datetime
+import uuid
 from functools import wraps
+from odontocare_comun.trazas import trazador
+from odontocare_comun.cliente_http import cliente_http
+from odontocare_comun.cache_http import cache_http
 
 app = Flask(__name__)
 app.secret_key = 'odontocare-web-citas-secret-2024'
+trazador.init_app(app)
 
 # URLs de los servicios backend
 SERVICIO_USUARIOS_URL = "http://localhost:5000"
@@ -30,10 +35,21 @@ def get_headers():
     """Obtiene headers con token de autorización"""
     return {
         'Authorization': f"Bearer {session.get('token', '')}",
-        'Content-Type': 'application/json'
+        'Content-Type': 'application/json',
+        **trazador.cabeceras()
     }
 
 
+def referencias(*otras):
+    """Consulta a la vez `otras` peticiones y los listados de doctores, pacientes y centros"""
+    return cliente_http.reunir(
+        *otras,
+        cache_http.obtener(f"{SERVICIO_USUARIOS_URL}/admin/doctores", headers=get_headers()),
+        cache_http.obtener(f"{SERVICIO_USUARIOS_URL}/admin/pacientes", headers=get_headers()),
+        cache_http.obtener(f"{SERVICIO_USUARIOS_URL}/admin/centros", headers=get_headers())
+    )
+
+
 @app.route('/')
 def index():
     """Página principal"""
@@ -50,9 +66,11 @@ def login():
         password = request.form.get('password')
         
         try:
-            response = requests.post(
+            response = cliente_http.post(
                 f"{SERVICIO_USUARIOS_URL}/auth/login",
-                json={'nombre_usuario': nombre_usuario, 'password': password}
+                json={'nombre_usuario': nombre_usuario, 'password': password},
+                # El servicio limita los intentos de login por la IP del navegador
+                headers={**trazador.cabeceras(), 'X-Forwarded-For': ', '.join(request.access_route)}
             )
             
             if response.status_code == 200:
@@ -63,7 +81,7 @@ def login():
                 return redirect(url_for('citas'))
             else:
                 flash('Credenciales inválidas', 'danger')
-        except requests.RequestException:
+        except httpx.HTTPError:
             flash('Error de conexión con el servidor', 'danger')
     
     return render_template('login.html')
@@ -90,32 +108,22 @@ def citas():
             filtros['id_paciente'] = request.args.get('id_paciente')
         if request.args.get('estado'):
             filtros['estado'] = request.args.get('estado')
-        if request.args.get('fecha'):
-            filtros['fecha'] = request.args.get('fecha')
+        for campo in ('fecha', 'desde', 'hasta'):
+            if request.args.get(campo):
+                filtros[campo] = request.args.get(campo)
         
-        # Obtener citas
-        response = requests.get(
-            f"{SERVICIO_CITAS_URL}/citas",
-            headers=get_headers(),
-            params=filtros
+        # Obtener citas, doctores y pacientes (para los filtros) a la vez
+        response, doctores_response, pacientes_response = cliente_http.reunir(
+            cliente_http.peticion('GET', f"{SERVICIO_CITAS_URL}/citas", headers=get_headers(), params=filtros),
+            cache_http.obtener(f"{SERVICIO_USUARIOS_URL}/admin/doctores", headers=get_headers()),
+            cache_http.obtener(f"{SERVICIO_USUARIOS_URL}/admin/pacientes", headers=get_headers())
         )
         
         citas_data = []
         if response.status_code == 200:
             citas_data = response.json().get('citas', [])
         
-        # Obtener doctores para el filtro
-        doctores_response = requests.get(
-            f"{SERVICIO_USUARIOS_URL}/admin/doctores",
-            headers=get_headers()
-        )
         doctores = doctores_response.json().get('doctores', []) if doctores_response.status_code == 200 else []
-        
-        # Obtener pacientes para el filtro
-        pacientes_response = requests.get(
-            f"{SERVICIO_USUARIOS_URL}/admin/pacientes",
-            headers=get_headers()
-        )
         pacientes = pacientes_response.json().get('pacientes', []) if pacientes_response.status_code == 200 else []
         
         return render_template('citas.html', 
@@ -124,7 +132,7 @@ def citas():
                              pacientes=pacientes,
                              filtros=filtros)
     
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         flash(f'Error de conexión: {str(e)}', 'danger')
         return render_template('citas.html', citas=[], doctores=[], pacientes=[], filtros={})
 
@@ -133,6 +141,10 @@ def citas():
 @login_required
 def nueva_cita():
     """Crear nueva cita"""
+    # Cada formulario lleva su Idempotency-Key: reenviarlo o reintentar la
+    # petición tras un timeout no duplica la cita
+    clave_idempotencia = str(uuid.uuid4())
+    
     if request.method == 'POST':
         try:
             payload = {
@@ -143,10 +155,12 @@ def nueva_cita():
                 'motivo': request.form.get('motivo')
             }
             
-            response = requests.post(
+            clave_formulario = request.form.get('idempotency_key') or clave_idempotencia
+            response = cliente_http.post(
                 f"{SERVICIO_CITAS_URL}/citas",
-                headers=get_headers(),
-                json=payload
+                headers={**get_headers(), 'Idempotency-Key': clave_formulario},
+                json=payload,
+                reintentos=2
             )
             
             if response.status_code == 201:
@@ -156,18 +170,22 @@ def nueva_cita():
                 error = response.json().get('error', 'Error al crear la cita')
                 flash(error, 'danger')
         
-        except requests.RequestException as e:
+        except httpx.HTTPError as e:
             flash(f'Error de conexión: {str(e)}', 'danger')
+            # Sin respuesta no se sabe si la cita se creó: se conserva la clave
+            clave_idempotencia = request.form.get('idempotency_key') or clave_idempotencia
     
     # Obtener datos para los selectores
     try:
-        doctores = requests.get(f"{SERVICIO_USUARIOS_URL}/admin/doctores", headers=get_headers()).json().get('doctores', [])
-        pacientes = requests.get(f"{SERVICIO_USUARIOS_URL}/admin/pacientes", headers=get_headers()).json().get('pacientes', [])
-        centros = requests.get(f"{SERVICIO_USUARIOS_URL}/admin/centros", headers=get_headers()).json().get('centros', [])
+        doctores_response, pacientes_response, centros_response = referencias()
+        doctores = doctores_response.json().get('doctores', [])
+        pacientes = pacientes_response.json().get('pacientes', [])
+        centros = centros_response.json().get('centros', [])
     except:
         doctores, pacientes, centros = [], [], []
     
-    return render_template('nueva_cita.html', doctores=doctores, pacientes=pacientes, centros=centros)
+    return render_template('nueva_cita.html', doctores=doctores, pacientes=pacientes, centros=centros,
+                           idempotency_key=clave_idempotencia)
 
 
 @app.route('/citas/<int:id_cita>/cancelar', methods=['POST'])
@@ -175,7 +193,7 @@ def nueva_cita():
 def cancelar_cita(id_cita):
     """Cancelar una cita"""
     try:
-        response = requests.put(
+        response = cliente_http.put(
             f"{SERVICIO_CITAS_URL}/citas/{id_cita}/cancelar",
             headers=get_headers()
         )
@@ -186,7 +204,7 @@ def cancelar_cita(id_cita):
             error = response.json().get('error', 'Error al cancelar la cita')
             flash(error, 'danger')
     
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         flash(f'Error de conexión: {str(e)}', 'danger')
     
     return redirect(url_for('citas'))
@@ -206,7 +224,7 @@ def editar_cita(id_cita):
                 'motivo': request.form.get('motivo')
             }
             
-            response = requests.put(
+            response = cliente_http.put(
                 f"{SERVICIO_CITAS_URL}/citas/{id_cita}",
                 headers=get_headers(),
                 json=payload
@@ -219,17 +237,19 @@ def editar_cita(id_cita):
                 error = response.json().get('error', 'Error al modificar la cita')
                 flash(error, 'danger')
         
-        except requests.RequestException as e:
+        except httpx.HTTPError as e:
             flash(f'Error de conexión: {str(e)}', 'danger')
     
     # Obtener datos de la cita
     try:
-        cita_response = requests.get(f"{SERVICIO_CITAS_URL}/citas/{id_cita}", headers=get_headers())
+        cita_response, doctores_response, pacientes_response, centros_response = referencias(
+            cliente_http.peticion('GET', f"{SERVICIO_CITAS_URL}/citas/{id_cita}", headers=get_headers())
+        )
         cita = cita_response.json() if cita_response.status_code == 200 else None
         
-        doctores = requests.get(f"{SERVICIO_USUARIOS_URL}/admin/doctores", headers=get_headers()).json().get('doctores', [])
-        pacientes = requests.get(f"{SERVICIO_USUARIOS_URL}/admin/pacientes", headers=get_headers()).json().get('pacientes', [])
-        centros = requests.get(f"{SERVICIO_USUARIOS_URL}/admin/centros", headers=get_headers()).json().get('centros', [])
+        doctores = doctores_response.json().get('doctores', [])
+        pacientes = pacientes_response.json().get('pacientes', [])
+        centros = centros_response.json().get('centros', [])
     except:
         cita, doctores, pacientes, centros = None, [], [], []
     
@@ -2,14 +2,18 @@
 Aplicación Web para Mantenimiento de Usuarios - Sistema OdontoCare
 """
 
-from flask import Flask, render_template, request, redirect, url_for, flash, session
-import requests
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_file
+import httpx
+import os
 from functools import wraps
-import csv
-import io
+from odontocare_comun.trazas import trazador
+from odontocare_comun.cliente_http import cliente_http
+from odontocare_comun.cache_http import cache_http
+from cargas import cargas
 
 app = Flask(__name__)
 app.secret_key = 'odontocare-web-usuarios-secret-2024'
+trazador.init_app(app)
 
 # URL del servicio de usuarios
 SERVICIO_USUARIOS_URL = "http://localhost:5000"
@@ -40,11 +44,63 @@ def admin_required(f):
     return decorated_function
 
 
+@app.after_request
+def invalidar_cache(response):
+    """Tras un formulario que escribe en el servicio (altas, carga masiva) se
+    descartan los listados guardados, para que la redirección ya los muestre"""
+    if request.method == 'POST' and request.endpoint != 'login':
+        cache_http.invalidar(f"{SERVICIO_USUARIOS_URL}/admin/")
+    return response
+
+
+# Filas por página de los listados y filtros que admite cada uno en la URL
+POR_PAGINA = 50
+ORDENES_LISTADO = {
+    'usuarios': [('id_user', 'ID'), ('nombre_usuario', 'Usuario'), ('rol', 'Rol')],
+    'doctores': [('id_doctor', 'ID'), ('nombre', 'Nombre'), ('especialidad', 'Especialidad')],
+    'pacientes': [('id_paciente', 'ID'), ('nombre', 'Nombre'), ('telefono', 'Teléfono')],
+    'centros': [('id_centro', 'ID'), ('nombre', 'Nombre')],
+}
+FILTROS_LISTADO = {'usuarios': 'rol', 'doctores': 'especialidad', 'pacientes': 'estado', 'centros': None}
+OPCIONES_FILTRO = {'rol': ['admin', 'medico', 'secretaria', 'paciente'], 'estado': ['ACTIVO', 'INACTIVO']}
+
+
+def pagina_listado(clave):
+    """Pide al servicio la página del listado que indica la URL (q, orden,
+    filtro y cursor). Retorna (filas, datos de la página para la plantilla)."""
+    filtro = FILTROS_LISTADO[clave]
+    actuales = {nombre: request.args[nombre] for nombre in ('q', 'orden', filtro, 'cursor')
+                if nombre and request.args.get(nombre)}
+    pagina = {
+        'actuales': actuales,
+        'ordenes': ORDENES_LISTADO[clave],
+        'filtro': filtro,
+        'opciones_filtro': OPCIONES_FILTRO.get(filtro),
+        'siguiente': None,
+        'cuenta': None,
+    }
+    try:
+        response = cache_http.get(
+            f"{SERVICIO_USUARIOS_URL}/admin/{clave}",
+            headers=get_headers(),
+            params={**actuales, 'limite': POR_PAGINA, 'contar': 1}
+        )
+        if response.status_code != 200:
+            return [], pagina
+        data = response.json()
+    except (httpx.HTTPError, ValueError):
+        return [], pagina
+    pagina['siguiente'] = data.get('siguiente')
+    pagina['cuenta'] = data.get('cuenta')
+    return data.get(clave, []), pagina
+
+
 def get_headers():
     """Obtiene headers con token de autorización"""
     return {
         'Authorization': f"Bearer {session.get('token', '')}",
-        'Content-Type': 'application/json'
+        'Content-Type': 'application/json',
+        **trazador.cabeceras()
     }
 
 
@@ -64,9 +120,11 @@ def login():
         password = request.form.get('password')
         
         try:
-            response = requests.post(
+            response = cliente_http.post(
                 f"{SERVICIO_USUARIOS_URL}/auth/login",
-                json={'nombre_usuario': nombre_usuario, 'password': password}
+                json={'nombre_usuario': nombre_usuario, 'password': password},
+                # El servicio limita los intentos de login por la IP del navegador
+                headers={**trazador.cabeceras(), 'X-Forwarded-For': ', '.join(request.access_route)}
             )
             
             if response.status_code == 200:
@@ -77,7 +135,7 @@ def login():
                 return redirect(url_for('dashboard'))
             else:
                 flash('Credenciales inválidas', 'danger')
-        except requests.RequestException:
+        except httpx.HTTPError:
             flash('Error de conexión con el servidor', 'danger')
     
     return render_template('login.html')
@@ -98,21 +156,27 @@ def dashboard():
     stats = {'usuarios': 0, 'doctores': 0, 'pacientes': 0, 'centros': 0}
     
     try:
-        usuarios_resp = requests.get(f"{SERVICIO_USUARIOS_URL}/admin/usuarios", headers=get_headers())
+        # Las cuatro consultas se lanzan a la vez; cada una pide solo la
+        # cuenta y una fila, no el listado completo
+        cuenta = {'limite': 1, 'contar': 1}
+        usuarios_resp, doctores_resp, pacientes_resp, centros_resp = cliente_http.reunir(
+            cliente_http.peticion('GET', f"{SERVICIO_USUARIOS_URL}/admin/usuarios", headers=get_headers(), params=cuenta),
+            cache_http.obtener(f"{SERVICIO_USUARIOS_URL}/admin/doctores", headers=get_headers(), params=cuenta),
+            cache_http.obtener(f"{SERVICIO_USUARIOS_URL}/admin/pacientes", headers=get_headers(), params=cuenta),
+            cache_http.obtener(f"{SERVICIO_USUARIOS_URL}/admin/centros", headers=get_headers(), params=cuenta)
+        )
+        
         if usuarios_resp.status_code == 200:
-            stats['usuarios'] = usuarios_resp.json().get('total', 0)
+            stats['usuarios'] = usuarios_resp.json().get('cuenta', 0)
         
-        doctores_resp = requests.get(f"{SERVICIO_USUARIOS_URL}/admin/doctores", headers=get_headers())
         if doctores_resp.status_code == 200:
-            stats['doctores'] = doctores_resp.json().get('total', 0)
+            stats['doctores'] = doctores_resp.json().get('cuenta', 0)
         
-        pacientes_resp = requests.get(f"{SERVICIO_USUARIOS_URL}/admin/pacientes", headers=get_headers())
         if pacientes_resp.status_code == 200:
-            stats['pacientes'] = pacientes_resp.json().get('total', 0)
+            stats['pacientes'] = pacientes_resp.json().get('cuenta', 0)
         
-        centros_resp = requests.get(f"{SERVICIO_USUARIOS_URL}/admin/centros", headers=get_headers())
         if centros_resp.status_code == 200:
-            stats['centros'] = centros_resp.json().get('total', 0)
+            stats['centros'] = centros_resp.json().get('cuenta', 0)
     except:
         pass
     
@@ -124,14 +188,9 @@ def dashboard():
 @app.route('/usuarios')
 @admin_required
 def usuarios():
-    """Listado de usuarios"""
-    try:
-        response = requests.get(f"{SERVICIO_USUARIOS_URL}/admin/usuarios", headers=get_headers())
-        usuarios_data = response.json().get('usuarios', []) if response.status_code == 200 else []
-    except:
-        usuarios_data = []
-    
-    return render_template('usuarios.html', usuarios=usuarios_data)
+    """Listado de usuarios, por páginas"""
+    usuarios_data, pagina = pagina_listado('usuarios')
+    return render_template('usuarios.html', usuarios=usuarios_data, pagina=pagina)
 
 
 @app.route('/usuarios/nuevo', methods=['GET', 'POST'])
@@ -152,7 +211,7 @@ def nuevo_usuario():
                     'nombre_usuario': nombre_usuario,
                     'password': password
                 }
-                response = requests.post(
+                response = cliente_http.post(
                     f"{SERVICIO_USUARIOS_URL}/admin/doctores",
                     headers=get_headers(),
                     json=payload
@@ -173,7 +232,7 @@ def nuevo_usuario():
                     'nombre_usuario': nombre_usuario,
                     'password': password
                 }
-                response = requests.post(
+                response = cliente_http.post(
                     f"{SERVICIO_USUARIOS_URL}/admin/pacientes",
                     headers=get_headers(),
                     json=payload
@@ -191,7 +250,7 @@ def nuevo_usuario():
                     'password': password,
                     'rol': rol
                 }
-                response = requests.post(
+                response = cliente_http.post(
                     f"{SERVICIO_USUARIOS_URL}/admin/usuario",
                     headers=get_headers(),
                     json=payload
@@ -203,7 +262,7 @@ def nuevo_usuario():
                     error = response.json().get('error', 'Error al crear el usuario')
                     flash(error, 'danger')
                     
-        except requests.RequestException as e:
+        except httpx.HTTPError as e:
             flash(f'Error de conexion: {str(e)}', 'danger')
     
     return render_template('nuevo_usuario.html')
@@ -214,14 +273,9 @@ def nuevo_usuario():
 @app.route('/doctores')
 @login_required
 def doctores():
-    """Listado de doctores"""
-    try:
-        response = requests.get(f"{SERVICIO_USUARIOS_URL}/admin/doctores", headers=get_headers())
-        doctores_data = response.json().get('doctores', []) if response.status_code == 200 else []
-    except:
-        doctores_data = []
-    
-    return render_template('doctores.html', doctores=doctores_data)
+    """Listado de doctores, por páginas"""
+    doctores_data, pagina = pagina_listado('doctores')
+    return render_template('doctores.html', doctores=doctores_data, pagina=pagina)
 
 
 @app.route('/doctores/nuevo', methods=['GET', 'POST'])
@@ -237,7 +291,7 @@ def nuevo_doctor():
                 'password': request.form.get('password')
             }
             
-            response = requests.post(
+            response = cliente_http.post(
                 f"{SERVICIO_USUARIOS_URL}/admin/doctores",
                 headers=get_headers(),
                 json=payload
@@ -249,7 +303,7 @@ def nuevo_doctor():
             else:
                 error = response.json().get('error', 'Error al crear el doctor')
                 flash(error, 'danger')
-        except requests.RequestException as e:
+        except httpx.HTTPError as e:
             flash(f'Error de conexión: {str(e)}', 'danger')
     
     return render_template('nuevo_doctor.html')
@@ -260,14 +314,9 @@ def nuevo_doctor():
 @app.route('/pacientes')
 @login_required
 def pacientes():
-    """Listado de pacientes"""
-    try:
-        response = requests.get(f"{SERVICIO_USUARIOS_URL}/admin/pacientes", headers=get_headers())
-        pacientes_data = response.json().get('pacientes', []) if response.status_code == 200 else []
-    except:
-        pacientes_data = []
-    
-    return render_template('pacientes.html', pacientes=pacientes_data)
+    """Listado de pacientes, por páginas"""
+    pacientes_data, pagina = pagina_listado('pacientes')
+    return render_template('pacientes.html', pacientes=pacientes_data, pagina=pagina)
 
 
 @app.route('/pacientes/nuevo', methods=['GET', 'POST'])
@@ -284,7 +333,7 @@ def nuevo_paciente():
                 'password': request.form.get('password')
             }
             
-            response = requests.post(
+            response = cliente_http.post(
                 f"{SERVICIO_USUARIOS_URL}/admin/pacientes",
                 headers=get_headers(),
                 json=payload
@@ -296,7 +345,7 @@ def nuevo_paciente():
             else:
                 error = response.json().get('error', 'Error al crear el paciente')
                 flash(error, 'danger')
-        except requests.RequestException as e:
+        except httpx.HTTPError as e:
             flash(f'Error de conexión: {str(e)}', 'danger')
     
     return render_template('nuevo_paciente.html')
@@ -307,14 +356,9 @@ def nuevo_paciente():
 @app.route('/centros')
 @login_required
 def centros():
-    """Listado de centros"""
-    try:
-        response = requests.get(f"{SERVICIO_USUARIOS_URL}/admin/centros", headers=get_headers())
-        centros_data = response.json().get('centros', []) if response.status_code == 200 else []
-    except:
-        centros_data = []
-    
-    return render_template('centros.html', centros=centros_data)
+    """Listado de centros, por páginas"""
+    centros_data, pagina = pagina_listado('centros')
+    return render_template('centros.html', centros=centros_data, pagina=pagina)
 
 
 @app.route('/centros/nuevo', methods=['GET', 'POST'])
@@ -328,7 +372,7 @@ def nuevo_centro():
                 'direccion': request.form.get('direccion')
             }
             
-            response = requests.post(
+            response = cliente_http.post(
                 f"{SERVICIO_USUARIOS_URL}/admin/centros",
                 headers=get_headers(),
                 json=payload
@@ -340,7 +384,7 @@ def nuevo_centro():
             else:
                 error = response.json().get('error', 'Error al crear el centro')
                 flash(error, 'danger')
-        except requests.RequestException as e:
+        except httpx.HTTPError as e:
             flash(f'Error de conexión: {str(e)}', 'danger')
     
     return render_template('nuevo_centro.html')
@@ -348,6 +392,9 @@ def nuevo_centro():
 
 # ==================== CARGA MASIVA CSV ====================
 
+TIPOS_CARGA = ['usuarios', 'doctores', 'pacientes', 'centros']
+
+
 @app.route('/carga-masiva')
 @admin_required
 def carga_masiva():
@@ -358,102 +405,81 @@ def carga_masiva():
 @app.route('/carga-masiva/procesar', methods=['POST'])
 @admin_required
 def procesar_carga_masiva():
-    """Procesar archivo CSV y cargar registros"""
+    """Guardar el archivo CSV y procesarlo por lotes en segundo plano"""
     tipo = request.form.get('tipo')
     archivo = request.files.get('archivo_csv')
     
     if not archivo or not tipo:
         flash('Debe seleccionar un tipo y un archivo CSV', 'danger')
         return redirect(url_for('carga_masiva'))
+    if tipo not in TIPOS_CARGA:
+        flash('Tipo de carga no valido', 'danger')
+        return redirect(url_for('carga_masiva'))
     
     try:
-        # Leer el archivo CSV
-        stream = io.StringIO(archivo.stream.read().decode('utf-8'))
-        reader = csv.DictReader(stream)
-        
-        creados = 0
-        errores = 0
-        mensajes_error = []
-        
-        for row in reader:
-            try:
-                if tipo == 'usuarios':
-                    payload = {
-                        'nombre_usuario': row.get('nombre_usuario'),
-                        'password': row.get('password'),
-                        'rol': row.get('rol')
-                    }
-                    response = requests.post(
-                        f"{SERVICIO_USUARIOS_URL}/admin/usuario",
-                        headers=get_headers(),
-                        json=payload
-                    )
-                    
-                elif tipo == 'doctores':
-                    payload = {
-                        'nombre': row.get('nombre'),
-                        'especialidad': row.get('especialidad'),
-                        'nombre_usuario': row.get('nombre_usuario', ''),
-                        'password': row.get('password', '')
-                    }
-                    response = requests.post(
-                        f"{SERVICIO_USUARIOS_URL}/admin/doctores",
-                        headers=get_headers(),
-                        json=payload
-                    )
-                    
-                elif tipo == 'pacientes':
-                    payload = {
-                        'nombre': row.get('nombre'),
-                        'telefono': row.get('telefono'),
-                        'estado': row.get('estado', 'ACTIVO'),
-                        'nombre_usuario': row.get('nombre_usuario', ''),
-                        'password': row.get('password', '')
-                    }
-                    response = requests.post(
-                        f"{SERVICIO_USUARIOS_URL}/admin/pacientes",
-                        headers=get_headers(),
-                        json=payload
-                    )
-                    
-                elif tipo == 'centros':
-                    payload = {
-                        'nombre': row.get('nombre'),
-                        'direccion': row.get('direccion')
-                    }
-                    response = requests.post(
-                        f"{SERVICIO_USUARIOS_URL}/admin/centros",
-                        headers=get_headers(),
-                        json=payload
-                    )
-                else:
-                    flash('Tipo de carga no valido', 'danger')
-                    return redirect(url_for('carga_masiva'))
-                
-                if response.status_code == 201:
-                    creados += 1
-                elif response.status_code == 409:
-                    errores += 1
-                    mensajes_error.append(f"Duplicado: {row.get('nombre_usuario') or row.get('nombre')}")
-                else:
-                    errores += 1
-                    mensajes_error.append(f"Error: {row.get('nombre_usuario') or row.get('nombre')}")
-                    
-            except Exception as e:
-                errores += 1
-                mensajes_error.append(str(e))
-        
-        flash(f'Carga completada: {creados} registros creados, {errores} errores', 
-              'success' if errores == 0 else 'warning')
-        
-        if mensajes_error and len(mensajes_error) <= 5:
-            for msg in mensajes_error:
-                flash(msg, 'info')
-                
-    except Exception as e:
-        flash(f'Error procesando archivo: {str(e)}', 'danger')
+        # El token de la sesión se copia ahora: el hilo no tiene acceso a ella
+        id_carga = cargas.iniciar(
+            tipo, archivo, get_headers(),
+            f"{SERVICIO_USUARIOS_URL}/admin/lote/{tipo}",
+            f"{SERVICIO_USUARIOS_URL}/auth/renovar",
+            prefijo_cache=f"{SERVICIO_USUARIOS_URL}/admin/"
+        )
+    except OSError as e:
+        flash(f'Error guardando el archivo: {str(e)}', 'danger')
+        return redirect(url_for('carga_masiva'))
     
-    return redirect(url_for('carga_masiva'))
+    return redirect(url_for('estado_carga_masiva', id_carga=id_carga))
+
+
+@app.route('/carga-masiva/<id_carga>')
+@admin_required
+def estado_carga_masiva(id_carga):
+    """Pagina con el progreso de una carga"""
+    carga = cargas.estado(id_carga)
+    if carga is None:
+        flash('Carga no encontrada', 'danger')
+        return redirect(url_for('carga_masiva'))
+    return render_template('carga_masiva_estado.html', carga=carga)
+
+
+@app.route('/carga-masiva/<id_carga>/reanudar', methods=['POST'])
+@admin_required
+def reanudar_carga_masiva(id_carga):
+    """Continuar una carga interrumpida con el token de la sesión actual"""
+    carga = cargas.estado(id_carga)
+    if carga is None:
+        flash('Carga no encontrada', 'danger')
+        return redirect(url_for('carga_masiva'))
+    if not cargas.reanudar(
+        id_carga, get_headers(),
+        f"{SERVICIO_USUARIOS_URL}/admin/lote/{carga['tipo']}",
+        f"{SERVICIO_USUARIOS_URL}/auth/renovar",
+        prefijo_cache=f"{SERVICIO_USUARIOS_URL}/admin/"
+    ):
+        flash('La carga no se puede reanudar', 'warning')
+    return redirect(url_for('estado_carga_masiva', id_carga=id_carga))
+
+
+@app.route('/carga-masiva/<id_carga>/estado')
+@admin_required
+def estado_carga_masiva_json(id_carga):
+    """Progreso de una carga en JSON (lo consulta la pagina de progreso)"""
+    carga = cargas.estado(id_carga)
+    if carga is None:
+        return jsonify({'error': 'Carga no encontrada'}), 404
+    return jsonify(carga)
+
+
+@app.route('/carga-masiva/<id_carga>/errores.csv')
+@admin_required
+def errores_carga_masiva(id_carga):
+    """Descargar el informe de filas con error de una carga"""
+    ruta = cargas.ruta_errores(id_carga)
+    if ruta is None or not os.path.exists(ruta):
+        flash('Informe de errores no disponible', 'warning')
+        return redirect(url_for('carga_masiva'))
+    return send_file(ruta, mimetype='text/csv', as_attachment=True,
+                     download_name=f'errores_carga_{id_carga[:8]}.csv')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,247 @@
+"""
+Cargas masivas de CSV en segundo plano.
+
+El fichero subido se guarda en CARGAS_DIR y un hilo lo lee por trozos de
+CARGA_LOTE filas, que envía a POST /admin/lote/<tipo> del servicio de
+usuarios, CARGA_CONCURRENCIA lotes a la vez. La petición del formulario
+termina en cuanto el fichero está en disco, así que un fichero grande ya no
+agota el tiempo de la petición.
+
+El progreso se guarda en <id>.json y los errores por fila en
+<id>.errores.csv, junto al fichero subido. Cualquier worker puede servir el
+estado y el informe de una carga iniciada en otro. Cada lote lleva una
+Idempotency-Key propia (<id>-<número de lote>), así que reenviarlo tras un
+error de conexión no duplica registros.
+
+El hilo usa el token del admin que inició la carga y lo renueva con
+POST /auth/renovar cada CARGA_RENOVAR_TOKEN segundos, antes de que caduque.
+Si la carga se interrumpe (token rechazado, error inesperado) queda en ERROR
+con el fichero en disco, y reanudar() la continúa desde el primer lote sin
+terminar.
+
+Configuración (variables de entorno):
+    CARGAS_DIR           directorio de las cargas (<tmp>/odontocare_cargas)
+    CARGA_LOTE           filas por petición al servicio (50)
+    CARGA_CONCURRENCIA   peticiones simultáneas (4)
+    CARGAS_RETENCION     segundos que se conservan los ficheros de una carga (86400)
+    CARGA_RENOVAR_TOKEN  segundos entre renovaciones del token (300)
+"""
+
+import csv
+import itertools
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from odontocare_comun.cache_http import cache_http
+from odontocare_comun.cliente_http import cliente_http
+
+_PATRON_ID = re.compile(r'^[0-9a-f]{32}$')
+
+COLUMNAS_ERRORES = ['fila', 'registro', 'estado', 'error']
+
+
+class CargaInterrumpida(Exception):
+    """El servicio rechaza el token: el resto de lotes fallaría igual"""
+
+
+class CargasMasivas:
+    """Cargas de CSV procesadas por lotes en un hilo, con su estado en disco"""
+
+    def __init__(self):
+        self.directorio = os.environ.get('CARGAS_DIR') or os.path.join(tempfile.gettempdir(), 'odontocare_cargas')
+        self.tamano_lote = int(os.environ.get('CARGA_LOTE', 50))
+        self.concurrencia = int(os.environ.get('CARGA_CONCURRENCIA', 4))
+        self.retencion = int(os.environ.get('CARGAS_RETENCION', 86400))
+        self.renovar_cada = int(os.environ.get('CARGA_RENOVAR_TOKEN', 300))
+
+    def _ruta(self, id_carga, sufijo):
+        return os.path.join(self.directorio, f'{id_carga}{sufijo}')
+
+    def _escribir_estado(self, estado):
+        estado['actualizada'] = time.time()
+        temporal = self._ruta(estado['id'], f'.json.{threading.get_ident()}')
+        with open(temporal, 'w', encoding='utf-8') as fichero:
+            json.dump(estado, fichero)
+        os.replace(temporal, self._ruta(estado['id'], '.json'))
+
+    def _purgar(self):
+        limite = time.time() - self.retencion
+        for nombre in os.listdir(self.directorio):
+            ruta = os.path.join(self.directorio, nombre)
+            try:
+                if os.path.getmtime(ruta) < limite:
+                    os.remove(ruta)
+            except OSError:
+                pass
+
+    # ==================== CONSULTA ====================
+
+    def estado(self, id_carga):
+        """Estado de la carga, o None si no existe"""
+        if not _PATRON_ID.match(id_carga or ''):
+            return None
+        try:
+            with open(self._ruta(id_carga, '.json'), encoding='utf-8') as fichero:
+                return json.load(fichero)
+        except FileNotFoundError:
+            return None
+
+    def ruta_errores(self, id_carga):
+        """Ruta del informe de errores, o None si la carga no existe"""
+        if self.estado(id_carga) is None:
+            return None
+        return self._ruta(id_carga, '.errores.csv')
+
+    # ==================== PROCESO ====================
+
+    def iniciar(self, tipo, archivo, headers, url_lote, url_renovar, prefijo_cache=''):
+        """Guarda el fichero subido (FileStorage) y lanza su proceso. Retorna el id de la carga."""
+        os.makedirs(self.directorio, exist_ok=True)
+        self._purgar()
+
+        id_carga = uuid.uuid4().hex
+        archivo.save(self._ruta(id_carga, '.csv'))
+        estado = {
+            'id': id_carga,
+            'tipo': tipo,
+            'nombre_archivo': archivo.filename,
+            'estado': 'PENDIENTE',
+            'total': None,
+            'procesados': 0,
+            'creados': 0,
+            'errores': 0,
+            'lotes': 0,
+            'error': None,
+            'creada': time.time(),
+        }
+        self._escribir_estado(estado)
+        self._lanzar(estado, headers, url_lote, url_renovar, prefijo_cache)
+        return id_carga
+
+    def reanudar(self, id_carga, headers, url_lote, url_renovar, prefijo_cache=''):
+        """Continúa una carga en ERROR desde su primer lote sin terminar, con
+        el token de `headers`. Retorna False si no se puede reanudar."""
+        estado = self.estado(id_carga)
+        if not estado or estado['estado'] != 'ERROR' or not os.path.exists(self._ruta(id_carga, '.csv')):
+            return False
+        estado['estado'] = 'PENDIENTE'
+        estado['error'] = None
+        self._escribir_estado(estado)
+        self._lanzar(estado, headers, url_lote, url_renovar, prefijo_cache)
+        return True
+
+    def _lanzar(self, estado, headers, url_lote, url_renovar, prefijo_cache):
+        threading.Thread(
+            target=self._procesar, args=(estado, dict(headers), url_lote, url_renovar, prefijo_cache),
+            name=f'carga-{estado["id"][:8]}', daemon=True
+        ).start()
+
+    def _lotes(self, lector):
+        """(número de lote, fila CSV del primer registro, registros) por cada trozo del fichero"""
+        fila = 2  # la 1 es la cabecera
+        for numero in itertools.count():
+            registros = list(itertools.islice(lector, self.tamano_lote))
+            if not registros:
+                return
+            yield numero, fila, registros
+            fila += len(registros)
+
+    @staticmethod
+    def _resultados(respuesta, cantidad):
+        """Resultado por registro de la respuesta de un lote (o del error que la sustituye)"""
+        if not isinstance(respuesta, Exception) and respuesta.status_code in (401, 403, 422):
+            raise CargaInterrumpida(f'El servicio rechazó el token ({respuesta.status_code}). '
+                                    'Inicie sesión de nuevo y reanude la carga')
+        if isinstance(respuesta, Exception):
+            return [{'estado': None, 'error': f'Error de conexión: {respuesta}'}] * cantidad
+        if respuesta.status_code != 200:
+            try:
+                error = respuesta.json().get('error')
+            except ValueError:
+                error = None
+            return [{'estado': respuesta.status_code, 'error': error or 'Error del servicio'}] * cantidad
+        return respuesta.json()['resultados']
+
+    def _enviar(self, url_lote, headers, id_carga, numero, registros):
+        return cliente_http.peticion(
+            'POST', url_lote, json={'registros': registros},
+            headers={**headers, 'Idempotency-Key': f'{id_carga}-{numero}'}, reintentos=2, timeout=300
+        )
+
+    def _renovar(self, headers, url_renovar):
+        """Sustituye el token de `headers` por uno nuevo del mismo usuario"""
+        respuesta = cliente_http.post(url_renovar, headers=headers, reintentos=2)
+        if respuesta.status_code != 200:
+            raise CargaInterrumpida(f'No se pudo renovar el token ({respuesta.status_code}). '
+                                    'Inicie sesión de nuevo y reanude la carga')
+        headers['Authorization'] = f"Bearer {respuesta.json()['token']}"
+
+    def _procesar(self, estado, headers, url_lote, url_renovar, prefijo_cache):
+        id_carga = estado['id']
+        ruta = self._ruta(id_carga, '.csv')
+        try:
+            # Primera pasada solo para contar filas, sin guardarlas en memoria
+            with open(ruta, newline='', encoding='utf-8-sig') as fichero:
+                estado['total'] = sum(1 for _ in csv.DictReader(fichero))
+            estado['estado'] = 'PROCESANDO'
+            self._escribir_estado(estado)
+
+            # Al reanudar se conserva el informe de los lotes ya terminados
+            reanudada = estado['lotes'] > 0
+            # El token de la sesión puede estar a punto de caducar: se renueva ya
+            renovado = None
+            with open(ruta, newline='', encoding='utf-8-sig') as fichero, \
+                    open(self._ruta(id_carga, '.errores.csv'), 'a' if reanudada else 'w',
+                         newline='', encoding='utf-8') as errores:
+                informe = csv.writer(errores)
+                if not reanudada:
+                    informe.writerow(COLUMNAS_ERRORES)
+                lotes = itertools.islice(self._lotes(csv.DictReader(fichero)), estado['lotes'], None)
+                while True:
+                    ventana = list(itertools.islice(lotes, self.concurrencia))
+                    if not ventana:
+                        break
+                    if renovado is None or time.monotonic() - renovado > self.renovar_cada:
+                        self._renovar(headers, url_renovar)
+                        renovado = time.monotonic()
+                    respuestas = cliente_http.reunir(*[
+                        self._enviar(url_lote, headers, id_carga, numero, registros)
+                        for numero, _, registros in ventana
+                    ], devolver_excepciones=True)
+
+                    # Se interpretan todas antes de contar, para que una ventana
+                    # interrumpida se repita entera al reanudar
+                    resultados_ventana = [self._resultados(respuesta, len(registros))
+                                          for (_, _, registros), respuesta in zip(ventana, respuestas)]
+                    for (_, primera_fila, registros), resultados in zip(ventana, resultados_ventana):
+                        for fila, (registro, resultado) in enumerate(zip(registros, resultados), primera_fila):
+                            if resultado['estado'] == 201:
+                                estado['creados'] += 1
+                                continue
+                            estado['errores'] += 1
+                            informe.writerow([fila, registro.get('nombre_usuario') or registro.get('nombre'),
+                                              resultado['estado'], resultado['error']])
+                        estado['procesados'] += len(registros)
+                    estado['lotes'] += len(ventana)
+                    errores.flush()
+                    cache_http.invalidar(prefijo_cache)
+                    self._escribir_estado(estado)
+            estado['estado'] = 'COMPLETADA'
+        except Exception as e:
+            estado['estado'] = 'ERROR'
+            estado['error'] = str(e)
+        finally:
+            self._escribir_estado(estado)
+        # En ERROR el fichero se conserva para poder reanudar (hasta CARGAS_RETENCION)
+        if estado['estado'] == 'COMPLETADA':
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+
+
+cargas = CargasMasivas()